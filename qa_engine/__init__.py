@@ -0,0 +1,299 @@
+"""LangChain智能质检引擎（可脱离Streamlit导入使用）"""
+from .core import (
+    DEFAULT_BASE_URL,
+    DEFAULT_MODEL,
+    FAILED_PREFIX,
+    FATAL_FAILED_PREFIX,
+    RESULT_COLUMN,
+    RETRYABLE_FAILED_PREFIX,
+    SKIP_RESULT,
+    analyze_conversation,
+    create_qa_prompt,
+    extract_section_content,
+    failed_row_positions,
+    get_json_sections,
+    initialize_llm,
+    is_error_result,
+    is_failed_result,
+    is_retryable_result,
+    iter_batch_results,
+    process_batch,
+    process_batch_parallel,
+    process_single_row,
+    retry_failed_rows,
+)
+from .async_engine import (
+    ENGINE_ASYNC,
+    ENGINE_THREAD,
+    aiter_batch_results,
+    analyze_conversation_async,
+    iter_batch_results_async,
+)
+from .backends import (
+    BackendConfig,
+    BackendPool,
+    build_backend_pool,
+    is_failover_error,
+    load_backend_configs,
+    parse_backend_configs,
+)
+from .batch_api import (
+    DEFAULT_BATCH_OPTIONS,
+    ENGINE_BATCH,
+    BatchOptions,
+    iter_batch_api_results,
+    parse_output_line,
+    submit_batches,
+)
+from .budget import (
+    DEFAULT_BUDGET,
+    TokenBudget,
+    count_tokens,
+    merge_chunk_data,
+    quality_grade,
+)
+from .cache import DEFAULT_CACHE_PATH, ResultCache, make_cache_key
+from .export import (
+    OrderedCsvWriter,
+    csv_to_parquet,
+    frame_to_xlsx,
+    parquet_available,
+    write_parquet,
+    write_xlsx,
+)
+from .dedup import (
+    DEFAULT_SIMILARITY,
+    REUSED_PREFIX,
+    find_near_duplicates,
+    is_reused_result,
+    mark_reused,
+    minhash_signatures,
+)
+from .ingest import count_rows, iter_column_values, iter_table_rows, read_header, read_preview
+from .jobs import DEFAULT_JOB_DIR, JobStore, export_job_csv, run_job
+from .metrics import (
+    LATENCY_STAGES,
+    METRIC_COLUMNS,
+    build_metrics_frame,
+    metrics_to_json,
+    metrics_to_prometheus,
+    summarize_metrics,
+    write_metrics,
+)
+from .monitor import RunMonitor, percentile
+from .packing import (
+    DEFAULT_PACKING,
+    PackOptions,
+    group_rows,
+    iter_packed_results,
+    parse_pack_result,
+    process_pack,
+)
+from .parsing import extract_json_from_text, iter_json_objects, schema_from_prompt, validate_result
+from .prompt import PROMPT_FILE, QAPrompt, load_prompt
+from .result_tables import (
+    DEFAULT_QUANTILES,
+    GRADE_COLUMN,
+    GRADE_LEVELS,
+    STATUS_COLUMN,
+    ResultTables,
+    analyzed_rows,
+    build_result_tables,
+    grade_distribution,
+    issue_frequency,
+    load_job_tables,
+    load_result_tables,
+    metric_percentiles,
+    save_result_tables,
+)
+from .scheduler import (
+    DEFAULT_MAX_RUNNING,
+    FINISHED_STATES,
+    STATE_CANCELLED,
+    STATE_COMPLETED,
+    STATE_FAILED,
+    STATE_QUEUED,
+    STATE_RUNNING,
+    JobCancelled,
+    JobLimiter,
+    JobScheduler,
+    ScheduledJob,
+)
+from .screen import (
+    DEFAULT_BANNED_FILE,
+    SCREEN_HINT,
+    SCREEN_OFF,
+    SCREEN_REPLACE,
+    PhraseMatcher,
+    PhraseScreen,
+    load_banned_phrases,
+)
+from .sections import (
+    ROW_NUMBER_COLUMN,
+    collect_sections,
+    explode_section,
+    parse_result_json,
+    result_fingerprint,
+)
+from .streaming import DEFAULT_STREAMING, StreamChecker, StreamOptions
+from .uploads import DEFAULT_UPLOAD_CACHE_MB, ParsedTable, UploadCache, parse_table
+from .usage import (
+    DEFAULT_PRICING,
+    Pricing,
+    RowTrace,
+    TokenUsage,
+    UsageMeter,
+    parse_token_usage,
+    track_row,
+)
+from .rate_limit import AdaptiveConcurrency, RateLimiter, TokenBucket
+from .retry import DEFAULT_RETRY_POLICY, NO_RETRY, RetryPolicy, call_with_retry
+
+__all__ = [
+    "ENGINE_ASYNC",
+    "ENGINE_THREAD",
+    "aiter_batch_results",
+    "analyze_conversation_async",
+    "iter_batch_results_async",
+    "BackendConfig",
+    "BackendPool",
+    "build_backend_pool",
+    "is_failover_error",
+    "load_backend_configs",
+    "parse_backend_configs",
+    "DEFAULT_BATCH_OPTIONS",
+    "ENGINE_BATCH",
+    "BatchOptions",
+    "iter_batch_api_results",
+    "parse_output_line",
+    "submit_batches",
+    "DEFAULT_BUDGET",
+    "TokenBudget",
+    "count_tokens",
+    "merge_chunk_data",
+    "quality_grade",
+    "DEFAULT_CACHE_PATH",
+    "ResultCache",
+    "make_cache_key",
+    "OrderedCsvWriter",
+    "csv_to_parquet",
+    "frame_to_xlsx",
+    "parquet_available",
+    "write_parquet",
+    "write_xlsx",
+    "DEFAULT_SIMILARITY",
+    "REUSED_PREFIX",
+    "find_near_duplicates",
+    "is_reused_result",
+    "mark_reused",
+    "minhash_signatures",
+    "count_rows",
+    "iter_column_values",
+    "iter_table_rows",
+    "read_header",
+    "read_preview",
+    "DEFAULT_JOB_DIR",
+    "JobStore",
+    "export_job_csv",
+    "run_job",
+    "LATENCY_STAGES",
+    "METRIC_COLUMNS",
+    "build_metrics_frame",
+    "metrics_to_json",
+    "metrics_to_prometheus",
+    "summarize_metrics",
+    "write_metrics",
+    "RunMonitor",
+    "percentile",
+    "DEFAULT_PACKING",
+    "PackOptions",
+    "group_rows",
+    "iter_packed_results",
+    "parse_pack_result",
+    "process_pack",
+    "extract_json_from_text",
+    "iter_json_objects",
+    "schema_from_prompt",
+    "validate_result",
+    "PROMPT_FILE",
+    "QAPrompt",
+    "load_prompt",
+    "DEFAULT_QUANTILES",
+    "GRADE_COLUMN",
+    "GRADE_LEVELS",
+    "STATUS_COLUMN",
+    "ResultTables",
+    "analyzed_rows",
+    "build_result_tables",
+    "grade_distribution",
+    "issue_frequency",
+    "load_job_tables",
+    "load_result_tables",
+    "metric_percentiles",
+    "save_result_tables",
+    "DEFAULT_MAX_RUNNING",
+    "FINISHED_STATES",
+    "STATE_CANCELLED",
+    "STATE_COMPLETED",
+    "STATE_FAILED",
+    "STATE_QUEUED",
+    "STATE_RUNNING",
+    "JobCancelled",
+    "JobLimiter",
+    "JobScheduler",
+    "ScheduledJob",
+    "DEFAULT_BANNED_FILE",
+    "SCREEN_HINT",
+    "SCREEN_OFF",
+    "SCREEN_REPLACE",
+    "PhraseMatcher",
+    "PhraseScreen",
+    "load_banned_phrases",
+    "ROW_NUMBER_COLUMN",
+    "collect_sections",
+    "explode_section",
+    "parse_result_json",
+    "result_fingerprint",
+    "DEFAULT_STREAMING",
+    "StreamChecker",
+    "StreamOptions",
+    "DEFAULT_UPLOAD_CACHE_MB",
+    "ParsedTable",
+    "UploadCache",
+    "parse_table",
+    "DEFAULT_PRICING",
+    "Pricing",
+    "RowTrace",
+    "TokenUsage",
+    "UsageMeter",
+    "parse_token_usage",
+    "track_row",
+    "AdaptiveConcurrency",
+    "RateLimiter",
+    "TokenBucket",
+    "DEFAULT_RETRY_POLICY",
+    "NO_RETRY",
+    "RetryPolicy",
+    "call_with_retry",
+    "DEFAULT_BASE_URL",
+    "DEFAULT_MODEL",
+    "FAILED_PREFIX",
+    "FATAL_FAILED_PREFIX",
+    "RESULT_COLUMN",
+    "RETRYABLE_FAILED_PREFIX",
+    "SKIP_RESULT",
+    "analyze_conversation",
+    "create_qa_prompt",
+    "extract_section_content",
+    "failed_row_positions",
+    "get_json_sections",
+    "initialize_llm",
+    "is_error_result",
+    "is_failed_result",
+    "is_retryable_result",
+    "iter_batch_results",
+    "process_batch",
+    "process_batch_parallel",
+    "process_single_row",
+    "retry_failed_rows",
+]
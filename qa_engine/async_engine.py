@@ -0,0 +1,230 @@
+"""异步请求引擎：基于 ainvoke 的协程并发，单线程即可维持数百个在途请求
+
+所有请求共享同一个 httpx.AsyncClient 连接池；在途请求数由 concurrency（协程数上限）
+与限流器的自适应并发窗口共同决定。
+"""
+import asyncio
+import logging
+import queue
+import threading
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+import openai
+import pandas as pd
+from langchain.schema import BaseMessage
+from langchain_openai import ChatOpenAI
+from langchain_openai.chat_models.base import BaseChatOpenAI
+
+from .cache import ResultCache
+from .core import (
+    SKIP_RESULT,
+    check_result,
+    create_qa_prompt,
+    format_failure,
+    format_invalid,
+    merge_chunk_results,
+    reask_messages,
+    request_tokens,
+    result_cache_key,
+    split_for_request,
+)
+from .prompt import QAPrompt
+from .rate_limit import RateLimiter
+from .retry import DEFAULT_RETRY_POLICY, RetryPolicy, call_with_retry_async
+from .streaming import StreamChecker, consume_stream_async, stream_kwargs
+from .usage import track_row
+
+logger = logging.getLogger(__name__)
+
+ENGINE_THREAD = "thread"
+ENGINE_ASYNC = "async"
+
+_DONE = object()
+
+
+async def request_analysis_async(llm: ChatOpenAI, messages: List[BaseMessage], conversation: str,
+                                 limiter: Optional[RateLimiter], retry: RetryPolicy,
+                                 cache: Optional[ResultCache], prompt: QAPrompt) -> str:
+    """request_analysis 的协程版本"""
+    cache_key = None
+    if cache is not None:
+        cache_key = result_cache_key(llm, messages, request_tokens(llm, messages, prompt)[1])
+        cached = cache.get(cache_key)
+        if cached is not None:
+            result, problems = check_result(cached, prompt, conversation)
+            if not problems:
+                return result
+
+    async def call(request, max_tokens: int) -> Tuple[str, List[str]]:
+        if prompt.streaming is None:
+            return (await llm.ainvoke(request, max_tokens=max_tokens)).content, []
+        checker = StreamChecker(prompt.schema, prompt.streaming, max_tokens)
+        return await consume_stream_async(llm.astream(request, **stream_kwargs(llm, max_tokens)), checker)
+
+    async def invoke(request) -> Tuple[str, List[str]]:
+        input_tokens, max_tokens = request_tokens(llm, request, prompt)
+        if limiter is None:
+            return await call(request, max_tokens)
+        async with limiter.slot_async(input_tokens + max_tokens):
+            return await call(request, max_tokens)
+
+    async def fetch(request) -> Tuple[str, str, List[str]]:
+        content, drift = await call_with_retry_async(lambda: invoke(request), retry)
+        if drift:
+            return content, content, drift
+        result, problems = check_result(content, prompt, conversation)
+        return content, result, problems
+
+    content, result, problems = await fetch(messages)
+    for _ in range(retry.max_reasks):
+        if not problems:
+            break
+        logger.info("输出不符合JSON结构要求（%s），重新请求", "；".join(problems))
+        request = reask_messages(messages, content, problems)
+        content, result, problems = await fetch(request)
+    if problems:
+        return format_invalid(content, problems)
+    if cache_key is not None:
+        cache.put(cache_key, result)
+    return result
+
+
+async def analyze_conversation_async(llm: ChatOpenAI, conversation: str,
+                                     limiter: Optional[RateLimiter] = None,
+                                     retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                                     cache: Optional[ResultCache] = None,
+                                     prompt: Optional[QAPrompt] = None) -> str:
+    """analyze_conversation 的协程版本，超长对话的各段并发请求"""
+    try:
+        prompt = prompt or create_qa_prompt()
+        chunks = split_for_request(conversation, prompt)
+        if len(chunks) == 1:
+            return await request_analysis_async(llm, prompt.format_messages(conversation), conversation,
+                                                limiter, retry, cache, prompt)
+
+        async def analyze_chunk(part: int) -> str:
+            try:
+                messages = prompt.format_messages(chunks[part], part + 1, len(chunks))
+                return await request_analysis_async(llm, messages, chunks[part], limiter, retry, cache, prompt)
+            except Exception as e:
+                return format_failure(e)
+
+        results = await asyncio.gather(*(analyze_chunk(part) for part in range(len(chunks))))
+        return merge_chunk_results(list(results), chunks, prompt, conversation)
+    except Exception as e:
+        return format_failure(e)
+
+
+async def process_single_row_async(row_data, llm, limiter: Optional[RateLimiter] = None,
+                                   retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                                   cache: Optional[ResultCache] = None,
+                                   prompt: Optional[QAPrompt] = None):
+    """处理单行数据（协程版本）"""
+    idx, value = row_data
+    if pd.isna(value) or str(value).strip() == "":
+        return idx, SKIP_RESULT
+
+    with track_row(idx):
+        result = await analyze_conversation_async(llm, str(value), limiter, retry, cache, prompt)
+    return idx, result
+
+
+async def aiter_batch_results(values: Iterable[Any], llm: ChatOpenAI, concurrency: int = 100,
+                              limiter: Optional[RateLimiter] = None,
+                              retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                              cache: Optional[ResultCache] = None,
+                              prompt: Optional[QAPrompt] = None) -> AsyncIterator[Tuple[int, str]]:
+    """以 concurrency 个协程消费输入，按完成顺序逐条产出 (行号, 结果)
+
+    输入按需读取，不会一次性为所有行创建任务。
+    """
+    prompt = prompt or create_qa_prompt()
+    rows = enumerate(values)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        try:
+            # 单线程事件循环中 next() 不会被并发调用，多个协程可安全共享同一个迭代器
+            for row in rows:
+                await results.put(await process_single_row_async(row, llm, limiter, retry, cache, prompt))
+        finally:
+            results.put_nowait(_DONE)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    try:
+        remaining = len(workers)
+        while remaining:
+            item = await results.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def bind_async_client(llm: ChatOpenAI, http_client: httpx.AsyncClient) -> ChatOpenAI:
+    """返回绑定到指定连接池的模型副本（非OpenAI兼容模型原样返回）"""
+    if not isinstance(llm, BaseChatOpenAI):
+        return llm
+    client = openai.AsyncOpenAI(
+        api_key=llm.openai_api_key.get_secret_value() if llm.openai_api_key else None,
+        organization=llm.openai_organization,
+        base_url=llm.openai_api_base,
+        timeout=llm.request_timeout,
+        max_retries=llm.max_retries,
+        default_headers=llm.default_headers,
+        default_query=llm.default_query,
+        http_client=http_client,
+    )
+    # construct 跳过校验，直接复用原模型的全部字段，只替换异步客户端
+    return type(llm).construct(**{**llm.__dict__, "async_client": client.chat.completions})
+
+
+def iter_batch_results_async(values: Iterable[Any], llm: ChatOpenAI, concurrency: int = 100,
+                             limiter: Optional[RateLimiter] = None,
+                             retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                             cache: Optional[ResultCache] = None,
+                             prompt: Optional[QAPrompt] = None) -> Iterator[Tuple[int, str]]:
+    """在后台线程的事件循环中运行异步引擎，以同步迭代器产出结果（与 iter_batch_results 接口一致）
+
+    提前结束迭代时取消事件循环中的所有在途请求。
+    """
+    out: queue.Queue = queue.Queue()
+    running = {}
+
+    async def main():
+        running["loop"] = asyncio.get_running_loop()
+        running["task"] = asyncio.current_task()
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=openai.DEFAULT_TIMEOUT) as http_client:
+            bound = bind_async_client(llm, http_client)
+            async for item in aiter_batch_results(values, bound, concurrency, limiter, retry, cache, prompt):
+                out.put(item)
+
+    def runner():
+        try:
+            asyncio.run(main())
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            out.put(e)
+        finally:
+            out.put(_DONE)
+
+    thread = threading.Thread(target=runner, name="qa-async-engine", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = out.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        if thread.is_alive() and "loop" in running:
+            running["loop"].call_soon_threadsafe(running["task"].cancel)
@@ -0,0 +1,309 @@
+"""多后端模型池：多个OpenAI兼容端点（不同密钥/模型/服务商，或本地替身服务）之间加权负载均衡与故障转移
+
+BackendPool 本身是一个 LangChain 聊天模型，可直接替代 initialize_llm 返回的单个模型传入 run_job；
+每次调用按平滑加权轮询选择一个健康的后端，经该后端自己的限流器（RPM/TPM/自适应并发）发出请求。
+调用出错（超时、连接失败、429、5xx、密钥失效、模型不存在）时该后端进入冷却（连续失败时冷却时间翻倍），
+本次调用立即转到下一个后端；所有后端都失败时抛出最后一个异常，由外层 RetryPolicy 退避后重试。
+流式调用同样选择后端，收到第一个数据块之前出错时转到下一个后端，之后的错误直接抛出。
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+from langchain_openai import ChatOpenAI
+
+from .budget import count_tokens
+from .core import initialize_llm
+from .errors import get_retry_after, get_status_code, is_retryable_error, is_throttle_error
+from .rate_limit import RateLimiter
+
+# 这些状态码说明问题出在该后端本身（密钥失效、无权限、模型不存在），换一个后端可能成功
+FAILOVER_STATUS = (401, 403, 404)
+DEFAULT_COOLDOWN = 5.0
+MAX_COOLDOWN = 120.0
+
+
+@dataclass(frozen=True)
+class BackendConfig:
+    """一个后端：OpenAI兼容的 base_url + 密钥 + 模型；rpm/tpm 为该密钥自己的配额（不设置则不限制）"""
+    name: str
+    base_url: str
+    api_key: str
+    model: str
+    weight: float = 1.0
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+    max_concurrency: int = 10
+    json_mode: bool = True
+
+
+def parse_backend_configs(items: List[Dict[str, Any]]) -> List[BackendConfig]:
+    """由字典列表构建后端配置；密钥可用 api_key_env 指定环境变量名，避免写入配置文件"""
+    configs = []
+    for item in items:
+        item = dict(item)
+        env_name = item.pop("api_key_env", None)
+        api_key = item.pop("api_key", None) or (os.getenv(env_name) if env_name else None)
+        if not api_key:
+            raise ValueError(f"后端缺少API密钥: {item}")
+        if not item.get("base_url") or not item.get("model"):
+            raise ValueError(f"后端需要 base_url 与 model: {item}")
+        item.setdefault("name", f"{item['model']}@{urlparse(item['base_url']).netloc or item['base_url']}")
+        configs.append(BackendConfig(api_key=api_key, **item))
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"后端名称重复: {names}")
+    return configs
+
+
+def load_backend_configs(source: str) -> List[BackendConfig]:
+    """读取后端配置：JSON文件路径或JSON文本，内容为对象列表（或含 backends 键的对象）"""
+    if os.path.exists(source):
+        with open(source, "r", encoding="utf-8") as f:
+            source = f.read()
+    data = json.loads(source)
+    if isinstance(data, dict):
+        data = data.get("backends", [])
+    if not isinstance(data, list) or not data:
+        raise ValueError("后端配置应为非空的JSON列表")
+    return parse_backend_configs(data)
+
+
+def is_failover_error(exc: BaseException) -> bool:
+    """是否应换一个后端重试：瞬时错误（超时、429、5xx）或该后端自身的问题（401/403/404）"""
+    return is_retryable_error(exc) or get_status_code(exc) in FAILOVER_STATUS
+
+
+class Backend:
+    """池中的一个后端：模型客户端 + 独立限流器 + 健康状态（由 BackendPool 加锁修改）"""
+
+    def __init__(self, config: BackendConfig, llm: ChatOpenAI):
+        self.config = config
+        self.name = config.name
+        self.llm = llm
+        self.limiter = RateLimiter(rpm=config.rpm, tpm=config.tpm, max_concurrency=config.max_concurrency)
+        self.requests = 0
+        self.failures = 0
+        self.throttled = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_error = ""
+        self.current_weight = 0.0
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        latencies = list(self.limiter.latencies)
+        return {
+            "后端": self.name,
+            "模型": self.config.model,
+            "权重": self.config.weight,
+            "状态": "正常" if self.available(now) else f"冷却中({self.cooldown_until - now:.0f}s)",
+            "成功请求": self.requests,
+            "失败": self.failures,
+            "限流": self.throttled,
+            "并发窗口": self.limiter.concurrency.limit,
+            "平均耗时": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "最近错误": self.last_error,
+        }
+
+
+class BackendPool(BaseChatModel):
+    """多后端模型池（见模块说明）；model_name、temperature、max_tokens、model_kwargs 参与结果缓存键与token预算"""
+
+    backends: List[Backend]
+    model_name: str = "pool"
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+    model_kwargs: Dict[str, Any] = {}
+    cooldown: float = DEFAULT_COOLDOWN
+    max_cooldown: float = MAX_COOLDOWN
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "backend-pool"
+
+    def _order(self) -> List[Backend]:
+        """本次调用尝试后端的顺序：平滑加权轮询选出的后端、其余健康后端（按权重）、冷却中的后端（最早恢复的在前）"""
+        with self._lock:
+            now = time.monotonic()
+            healthy = [b for b in self.backends if b.available(now)]
+            cooling = sorted((b for b in self.backends if not b.available(now)), key=lambda b: b.cooldown_until)
+            if not healthy:
+                return cooling
+            total = sum(b.config.weight for b in healthy)
+            for backend in healthy:
+                backend.current_weight += backend.config.weight
+            first = max(healthy, key=lambda b: b.current_weight)
+            first.current_weight -= total
+            rest = sorted((b for b in healthy if b is not first), key=lambda b: -b.config.weight)
+            return [first] + rest + cooling
+
+    def _succeeded(self, backend: Backend):
+        with self._lock:
+            backend.requests += 1
+            backend.consecutive_failures = 0
+            backend.cooldown_until = 0.0
+
+    def _failed(self, backend: Backend, exc: BaseException):
+        with self._lock:
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if is_throttle_error(exc):
+                backend.throttled += 1
+            backend.last_error = f"{type(exc).__name__}: {str(exc)[:120]}"
+            pause = min(self.max_cooldown, self.cooldown * 2 ** (backend.consecutive_failures - 1))
+            retry_after = get_retry_after(exc)
+            if retry_after:
+                pause = max(pause, min(retry_after, self.max_cooldown))
+            backend.cooldown_until = time.monotonic() + pause
+
+    @staticmethod
+    def _estimate(messages: List[BaseMessage], kwargs: Dict[str, Any]) -> int:
+        return sum(count_tokens(str(m.content)) for m in messages) + int(kwargs.get("max_tokens") or 0)
+
+    @staticmethod
+    def _stream_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """各后端都是OpenAI兼容客户端，流式调用时请求在最后一个数据块中返回usage"""
+        return {"stream_options": {"include_usage": True}, **kwargs}
+
+    @staticmethod
+    def _tag(result: ChatResult, backend: Backend) -> ChatResult:
+        result.llm_output = {**(result.llm_output or {}), "backend": backend.name}
+        return result
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        tokens = self._estimate(messages, kwargs)
+        last_error: Optional[BaseException] = None
+        for backend in self._order():
+            try:
+                with backend.limiter.slot(tokens):
+                    result = backend.llm._generate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                self._failed(backend, e)
+                last_error = e
+                continue
+            self._succeeded(backend)
+            return self._tag(result, backend)
+        raise last_error
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        tokens = self._estimate(messages, kwargs)
+        last_error: Optional[BaseException] = None
+        for backend in self._order():
+            try:
+                async with backend.limiter.slot_async(tokens):
+                    result = await backend.llm._agenerate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                self._failed(backend, e)
+                last_error = e
+                continue
+            self._succeeded(backend)
+            return self._tag(result, backend)
+        raise last_error
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tokens = self._estimate(messages, kwargs)
+        kwargs = self._stream_kwargs(kwargs)
+        last_error: Optional[BaseException] = None
+        for backend in self._order():
+            started = False
+            try:
+                with backend.limiter.slot(tokens):
+                    chunks = backend.llm._stream(messages, stop=stop, **kwargs)
+                    try:
+                        for chunk in chunks:
+                            if not started:
+                                started = True
+                                self._succeeded(backend)
+                            if run_manager is not None:
+                                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                            yield chunk
+                    finally:
+                        chunks.close()
+            except Exception as e:
+                if started or not is_failover_error(e):
+                    raise
+                self._failed(backend, e)
+                last_error = e
+                continue
+            if not started:
+                self._succeeded(backend)
+            return
+        raise last_error
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._estimate(messages, kwargs)
+        kwargs = self._stream_kwargs(kwargs)
+        last_error: Optional[BaseException] = None
+        for backend in self._order():
+            started = False
+            try:
+                async with backend.limiter.slot_async(tokens):
+                    chunks = backend.llm._astream(messages, stop=stop, **kwargs)
+                    try:
+                        async for chunk in chunks:
+                            if not started:
+                                started = True
+                                self._succeeded(backend)
+                            if run_manager is not None:
+                                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                            yield chunk
+                    finally:
+                        await chunks.aclose()
+            except Exception as e:
+                if started or not is_failover_error(e):
+                    raise
+                self._failed(backend, e)
+                last_error = e
+                continue
+            if not started:
+                self._succeeded(backend)
+            return
+        raise last_error
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """各后端的健康状态与请求统计"""
+        with self._lock:
+            now = time.monotonic()
+            return [backend.stats(now) for backend in self.backends]
+
+
+def build_backend_pool(configs: List[BackendConfig], temperature: float = 0.7, max_tokens: int = 10000,
+                       json_mode: bool = True, callbacks: Optional[List[Any]] = None) -> BackendPool:
+    """由后端配置构建模型池；callbacks（如 UsageMeter）挂在池上，每次调用无论落到哪个后端都会记录"""
+    backends = [
+        Backend(config, initialize_llm(config.api_key, config.base_url, model=config.model, temperature=temperature,
+                                       max_tokens=max_tokens, json_mode=json_mode and config.json_mode))
+        for config in configs
+    ]
+    return BackendPool(
+        backends=backends,
+        model_name="+".join(sorted({config.model for config in configs})),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        model_kwargs={"response_format": {"type": "json_object"}} if json_mode else {},
+        callbacks=callbacks,
+    )
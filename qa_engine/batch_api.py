@@ -0,0 +1,261 @@
+"""离线批处理引擎：按 OpenAI 兼容的 /v1/batches 接口提交整批请求，轮询完成后按行号取回结果
+
+适合不需要即时结果的大任务：所有请求写成JSONL批处理文件上传，由服务商在完成窗口（24h）内异步处理，
+无需本地限流与重试；提交后的批次ID记录在任务库中，进程中断后续跑只继续轮询，不会重复提交。
+需要服务商支持批处理接口（OpenAI、Azure OpenAI、vLLM 等，或本地模拟服务）。
+"""
+import io
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import openai
+import pandas as pd
+from langchain.schema import BaseMessage
+from langchain_openai import ChatOpenAI
+
+from .cache import ResultCache
+from .core import (
+    FATAL_FAILED_PREFIX,
+    RETRYABLE_FAILED_PREFIX,
+    SKIP_RESULT,
+    check_result,
+    create_qa_prompt,
+    format_invalid,
+    merge_chunk_results,
+    request_tokens,
+    result_cache_key,
+    split_for_request,
+)
+from .prompt import QAPrompt
+from .usage import RowTrace, TokenUsage, parse_token_usage, record_failure, track_row
+
+logger = logging.getLogger(__name__)
+
+ENGINE_BATCH = "batch"
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+@dataclass(frozen=True)
+class BatchOptions:
+    """批处理参数：每个批次的请求数与文件大小上限（OpenAI 为5万条/200MB），轮询间隔（秒）"""
+    max_requests: int = 50000
+    max_bytes: int = 100 * 1024 * 1024
+    poll_interval: float = 30.0
+    completion_window: str = "24h"
+
+
+DEFAULT_BATCH_OPTIONS = BatchOptions()
+
+
+@dataclass
+class _RowPlan:
+    """一行的各段请求与已取回的输出；results 中已有缓存命中的段"""
+    conversation: str
+    chunks: List[str]
+    results: List[Optional[str]]
+    cache_keys: List[Optional[str]]
+    outputs: Dict[int, Tuple[Optional[int], str]] = field(default_factory=dict)
+    usage: TokenUsage = field(default_factory=TokenUsage)
+
+
+def batch_client(llm: ChatOpenAI) -> openai.OpenAI:
+    """用模型的密钥与 base_url 创建批处理客户端（上传、轮询与下载可安全重试）"""
+    if not isinstance(llm, ChatOpenAI):
+        raise ValueError("批处理模式需要单个OpenAI兼容模型（不支持多后端模型池）")
+    api_key = llm.openai_api_key.get_secret_value() if llm.openai_api_key else None
+    return openai.OpenAI(api_key=api_key, base_url=llm.openai_api_base, organization=llm.openai_organization,
+                         max_retries=3)
+
+
+def request_body(llm: ChatOpenAI, messages: List[BaseMessage], max_tokens: int) -> Dict[str, Any]:
+    """与同步调用相同的请求参数（模型、温度、JSON模式等），写入批处理文件的 body"""
+    return {
+        "model": llm.model_name,
+        "messages": [{"role": _ROLES[m.type], "content": m.content} for m in messages],
+        "temperature": llm.temperature,
+        "max_tokens": max_tokens,
+        **(llm.model_kwargs or {}),
+    }
+
+
+def _failure(status: Optional[int], message: str) -> str:
+    prefix = RETRYABLE_FAILED_PREFIX if status is None or status == 429 or status >= 500 else FATAL_FAILED_PREFIX
+    return f"{prefix}: 批处理请求失败（{status or '无状态码'}）: {message}"
+
+
+def parse_output_line(line: str) -> Tuple[str, Optional[int], str, Optional[Dict[str, Any]]]:
+    """解析输出/错误文件中的一行，返回 (custom_id, 状态码, 模型输出或错误信息, usage)；成功时状态码为200"""
+    record = json.loads(line)
+    response = record.get("response") or {}
+    status = response.get("status_code")
+    body = response.get("body") or {}
+    error = record.get("error") or body.get("error")
+    if error or status != 200:
+        message = error.get("message", str(error)) if isinstance(error, dict) else str(error or body)
+        return record["custom_id"], status, message[:300], None
+    return record["custom_id"], 200, body["choices"][0]["message"]["content"] or "", body.get("usage")
+
+
+def _plan_rows(rows: Iterable[Tuple[int, Any]], llm: ChatOpenAI, cache: Optional[ResultCache], prompt: QAPrompt,
+               plans: Dict[int, _RowPlan], requests: Dict[int, List[Dict[str, Any]]]) -> Iterator[Tuple[int, str]]:
+    """为每行生成请求（缓存命中的段不再请求）；空值行与全部命中缓存的行直接产出结果"""
+    for idx, value in rows:
+        if pd.isna(value) or str(value).strip() == "":
+            yield idx, SKIP_RESULT
+            continue
+        conversation = str(value)
+        chunks = split_for_request(conversation, prompt)
+        plan = _RowPlan(conversation, chunks, [None] * len(chunks), [None] * len(chunks))
+        row_requests = []
+        for part, chunk in enumerate(chunks):
+            messages = prompt.format_messages(chunk, part + 1, len(chunks)) if len(chunks) > 1 \
+                else prompt.format_messages(chunk)
+            _, max_tokens = request_tokens(llm, messages, prompt)
+            if cache is not None:
+                plan.cache_keys[part] = result_cache_key(llm, messages, max_tokens)
+                cached = cache.get(plan.cache_keys[part])
+                if cached is not None:
+                    result, problems = check_result(cached, prompt, chunk)
+                    if not problems:
+                        plan.results[part] = result
+                        continue
+            row_requests.append({"custom_id": f"{idx}-{part}", "method": "POST", "url": BATCH_ENDPOINT,
+                                 "body": request_body(llm, messages, max_tokens)})
+        if not row_requests:
+            yield idx, plan.results[0] if len(chunks) == 1 else \
+                merge_chunk_results(plan.results, chunks, prompt, conversation)
+            continue
+        plans[idx] = plan
+        requests[idx] = row_requests
+
+
+def _batch_files(requests: Dict[int, List[Dict[str, Any]]],
+                 options: BatchOptions) -> Iterator[Tuple[bytes, List[int]]]:
+    """按请求数与大小上限分批，同一行的各段总在同一个批次中"""
+    buffer, rows, count = io.BytesIO(), [], 0
+    for idx, row_requests in requests.items():
+        lines = b"".join(json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n" for r in row_requests)
+        full = count + len(row_requests) > options.max_requests or buffer.tell() + len(lines) > options.max_bytes
+        if rows and full:
+            yield buffer.getvalue(), rows
+            buffer, rows, count = io.BytesIO(), [], 0
+        buffer.write(lines)
+        rows.append(idx)
+        count += len(row_requests)
+    if rows:
+        yield buffer.getvalue(), rows
+
+
+def _finish_row(idx: int, plan: _RowPlan, prompt: QAPrompt, cache: Optional[ResultCache],
+                batch_status: str, elapsed: float) -> Tuple[str, RowTrace]:
+    """校验各段输出并合并为整行结果；批次结束仍没有输出的段记为可重试失败"""
+    with track_row(idx) as trace:
+        trace.api_latency = elapsed
+        trace.usage = plan.usage
+        for part, chunk in enumerate(plan.chunks):
+            if plan.results[part] is not None:
+                continue
+            status, content = plan.outputs.get(part, (None, f"批处理{batch_status}，未返回该请求的结果"))
+            if status != 200:
+                trace.errors += 1
+                record_failure(f"HTTP{status}" if status else "BatchIncomplete")
+                plan.results[part] = _failure(status, content)
+                continue
+            result, problems = check_result(content, prompt, chunk)
+            if problems:
+                plan.results[part] = format_invalid(content, problems)
+                continue
+            plan.results[part] = result
+            if plan.cache_keys[part] is not None:
+                cache.put(plan.cache_keys[part], result)
+        result = plan.results[0] if len(plan.chunks) == 1 else \
+            merge_chunk_results(plan.results, plan.chunks, prompt, plan.conversation)
+    # 整行耗时含批次从创建到结束的时间
+    trace.total_time += elapsed
+    return result, trace
+
+
+def submit_batches(client: openai.OpenAI, requests: Dict[int, List[Dict[str, Any]]], options: BatchOptions,
+                   metadata: Optional[Dict[str, str]] = None) -> Iterator[Tuple[str, List[int]]]:
+    """上传批处理文件并创建批次，逐个产出 (批次ID, 包含的行号)"""
+    for number, (content, rows) in enumerate(_batch_files(requests, options), 1):
+        uploaded = client.files.create(file=(f"qa_batch_{number}.jsonl", content), purpose="batch")
+        batch = client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT,
+                                      completion_window=options.completion_window,
+                                      metadata=metadata or openai.NOT_GIVEN)
+        logger.info("已提交批次 %s: %d 行，%.1f MB", batch.id, len(rows), len(content) / 1024 / 1024)
+        yield batch.id, rows
+
+
+def iter_batch_api_results(rows: Iterable[Tuple[int, Any]], llm: ChatOpenAI,
+                           cache: Optional[ResultCache] = None,
+                           prompt: Optional[QAPrompt] = None,
+                           open_batches: Optional[Dict[str, List[int]]] = None,
+                           on_submit: Optional[Callable[[str, List[int]], None]] = None,
+                           on_collected: Optional[Callable[[str, str], None]] = None,
+                           options: BatchOptions = DEFAULT_BATCH_OPTIONS,
+                           metadata: Optional[Dict[str, str]] = None
+                           ) -> Iterator[Tuple[int, str, Optional[RowTrace]]]:
+    """提交 rows（(行号, 对话) 对）并轮询，按批次完成顺序逐行产出 (行号, 结果, 用量与耗时)
+
+    open_batches 为之前已提交、尚未取回的批次（{批次ID: 行号列表}），其中的行只等待结果不再提交；
+    on_submit 在每个批次创建后调用（用于持久化批次ID），on_collected 在批次结果全部产出后调用。
+    """
+    client = batch_client(llm)
+    prompt = prompt or create_qa_prompt()
+    open_batches = dict(open_batches or {})
+    in_flight = {idx for batch_rows in open_batches.values() for idx in batch_rows}
+    plans: Dict[int, _RowPlan] = {}
+    requests: Dict[int, List[Dict[str, Any]]] = {}
+    for idx, result in _plan_rows(rows, llm, cache, prompt, plans, requests):
+        yield idx, result, None
+    for idx in in_flight:
+        requests.pop(idx, None)
+    for batch_id, batch_rows in submit_batches(client, requests, options, metadata):
+        open_batches[batch_id] = batch_rows
+        if on_submit:
+            on_submit(batch_id, batch_rows)
+
+    while open_batches:
+        for batch_id in list(open_batches):
+            batch = client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            if batch.status not in TERMINAL_STATUSES:
+                logger.info("批次 %s: %s（已完成 %s/%s）", batch_id, batch.status,
+                            counts.completed if counts else "-", counts.total if counts else "-")
+                continue
+            if batch.status != "completed":
+                errors = getattr(batch.errors, "data", None) or []
+                logger.warning("批次 %s 结束状态为 %s%s", batch_id, batch.status,
+                               f": {errors[0].message}" if errors else "")
+            # 过期或取消的批次也可能带有部分结果
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                for line in client.files.content(file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    custom_id, status, content, token_usage = parse_output_line(line)
+                    idx, part = (int(value) for value in custom_id.rsplit("-", 1))
+                    plan = plans.get(idx)
+                    if plan is None or part >= len(plan.chunks):
+                        continue
+                    plan.outputs[part] = (status, content)
+                    if token_usage:
+                        plan.usage.add(parse_token_usage(token_usage))
+            ended = batch.completed_at or batch.failed_at or batch.expired_at or batch.cancelled_at or time.time()
+            for idx in open_batches.pop(batch_id):
+                plan = plans.pop(idx, None)
+                if plan is not None:
+                    result, trace = _finish_row(idx, plan, prompt, cache, batch.status, ended - batch.created_at)
+                    yield idx, result, trace
+            if on_collected:
+                on_collected(batch_id, batch.status)
+        if open_batches:
+            time.sleep(options.poll_interval)
@@ -0,0 +1,361 @@
+"""可复现的性能基准：在本地模拟服务（mock_server）上运行各引擎，不消耗真实API配额
+
+按随机种子生成不同规模与长度的合成对话数据集，对每个引擎与并发设置运行一次，报告吞吐（行/秒）、
+整行耗时与调用耗时分位数、解析耗时、峰值内存（RSS）以及服务端的限流/错误次数；--stream-output 时另报告
+首token耗时与提前中止次数（可配合 --runaway-rate 比较失控输出浪费的token）。
+模拟服务默认运行在独立子进程中，避免服务端线程与被测引擎争用同一个GIL。
+保存的报告可作为基线（--baseline），吞吐低于基线超过容差时以非零状态退出，用于发现性能回退。
+
+示例:
+    python -m qa_engine.benchmark --engines sequential,thread,async,pack --concurrency 5,20 \\
+        --latency 0.5 --throttle-rate 0.02 --output bench.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .async_engine import ENGINE_ASYNC, ENGINE_THREAD, iter_batch_results_async
+from .core import (
+    RESULT_COLUMN,
+    SKIP_RESULT,
+    create_qa_prompt,
+    initialize_llm,
+    is_failed_result,
+    process_batch,
+    process_batch_parallel,
+)
+from .mock_server import MockOptions, MockServer, add_mock_arguments, options_from_args
+from .monitor import percentile
+from .packing import DEFAULT_PACKING, iter_packed_results
+from .rate_limit import RateLimiter
+from .retry import RetryPolicy
+from .streaming import DEFAULT_STREAMING, StreamOptions
+from .usage import UsageMeter
+
+logger = logging.getLogger(__name__)
+
+ENGINE_SEQUENTIAL = "sequential"
+ENGINE_PACK = "pack"
+BENCH_ENGINES = (ENGINE_SEQUENTIAL, ENGINE_THREAD, ENGINE_ASYNC, ENGINE_PACK)
+REPORT_KEYS = ["dataset", "engine", "concurrency"]
+_COLUMN = "对话"
+
+_SALES_LINES = [
+    "您好，欢迎光临，请问今天想看看什么款式？",
+    "这款是我们今年的新品，采用瑞士机芯，走时非常精准。",
+    "您平时主要是上班佩戴还是运动的时候戴呢？",
+    "这款表壳是精钢材质，日常佩戴不容易划花。",
+    "我们现在有会员活动，购买可以享受九折优惠。",
+    "这款绝对防水，戴着游泳都没问题。",
+    "您可以试戴一下，看看表带长度是否合适。",
+    "全国联保两年，任何门店都可以免费保养。",
+]
+_CUSTOMER_LINES = [
+    "我随便看看。",
+    "这款有其他颜色吗？",
+    "防水性能怎么样？",
+    "价格是不是有点贵？",
+    "平时上班会用到。",
+    "售后服务怎么样？",
+    "我考虑一下这款。",
+    "有保修卡吗？",
+]
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """合成数据集：rows 行对话，每段 min_turns~max_turns 轮（销售与顾客各说一句为一轮），blank_rate 为空值行比例"""
+    name: str
+    rows: int
+    min_turns: int
+    max_turns: int
+    blank_rate: float = 0.0
+
+
+DEFAULT_DATASETS = (
+    DatasetSpec("short", 200, 2, 6, blank_rate=0.02),
+    DatasetSpec("medium", 200, 8, 20),
+    DatasetSpec("long", 40, 150, 300),
+)
+
+
+def synthetic_conversations(spec: DatasetSpec, seed: int = 0) -> List[str]:
+    """按种子生成数据集，同一种子与规格总得到相同的对话"""
+    rng = random.Random(f"{seed}:{spec.name}")
+    conversations = []
+    for _ in range(spec.rows):
+        if rng.random() < spec.blank_rate:
+            conversations.append("")
+            continue
+        lines = []
+        for _ in range(rng.randint(spec.min_turns, spec.max_turns)):
+            lines.append(f"销售：{rng.choice(_SALES_LINES)}")
+            lines.append(f"顾客：{rng.choice(_CUSTOMER_LINES)}")
+        conversations.append("\n".join(lines))
+    return conversations
+
+
+def current_rss() -> Optional[int]:
+    """当前进程的常驻内存（字节），无法读取时返回None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:  # 非Linux且未安装 psutil 时不报告内存
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class RssSampler:
+    """在 with 块内定期采样RSS，记录峰值"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.start: Optional[int] = None
+        self.peak: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None:
+            self.peak = max(self.peak or 0, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "RssSampler":
+        self.start = current_rss()
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def _serve_mock(options: MockOptions, conn):
+    server = MockServer(options)
+    conn.send(server.url)
+    conn.close()
+    server.serve_forever()
+
+
+def start_mock_process(options: MockOptions) -> Tuple[multiprocessing.Process, str]:
+    """在子进程中启动模拟服务，返回 (进程, base_url)"""
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_serve_mock, args=(options, child_conn), daemon=True)
+    process.start()
+    if not parent_conn.poll(30):
+        process.terminate()
+        raise RuntimeError("模拟服务启动超时")
+    return process, parent_conn.recv()
+
+
+def server_stats(base_url: str, reset: bool = False) -> Dict[str, int]:
+    """模拟服务的累计计数；reset 时随后开始新一轮测量（见 MockServer.reset）"""
+    with urllib.request.urlopen(f"{base_url}/stats{'?reset' if reset else ''}", timeout=10) as response:
+        return json.loads(response.read())
+
+
+def _iter_engine(engine: str, values: List[str], llm, concurrency: int, limiter: RateLimiter,
+                 retry: RetryPolicy, streaming: Optional[StreamOptions] = None) -> Iterator[str]:
+    prompt = create_qa_prompt().with_streaming(streaming)
+    if engine == ENGINE_SEQUENTIAL:
+        yield from process_batch(pd.DataFrame({_COLUMN: values}), _COLUMN, llm, limiter=limiter, retry=retry,
+                                 prompt=prompt)[RESULT_COLUMN]
+    elif engine == ENGINE_THREAD:
+        yield from process_batch_parallel(pd.DataFrame({_COLUMN: values}), _COLUMN, llm, max_workers=concurrency,
+                                          limiter=limiter, retry=retry, prompt=prompt)[RESULT_COLUMN]
+    elif engine == ENGINE_ASYNC:
+        for _, result in iter_batch_results_async(values, llm, concurrency, limiter, retry, prompt=prompt):
+            yield result
+    elif engine == ENGINE_PACK:
+        for _, result in iter_packed_results(values, llm, concurrency, limiter, retry, prompt=prompt,
+                                             options=DEFAULT_PACKING):
+            yield result
+    else:
+        raise ValueError(f"未知引擎: {engine}")
+
+
+def run_case(values: List[str], engine: str, concurrency: int, base_url: str,
+             retry: RetryPolicy = RetryPolicy(), adaptive: bool = False,
+             streaming: Optional[StreamOptions] = None) -> Dict[str, Any]:
+    """对一个数据集运行一个引擎，返回该组合的指标（不缓存结果，每行都请求模拟服务；打包请求不使用流式输出）"""
+    meter = UsageMeter()
+    llm = initialize_llm("mock-key", base_url, callbacks=[meter])
+    limiter = RateLimiter(max_concurrency=concurrency, adaptive=adaptive)
+    before = server_stats(base_url, reset=True)
+    started = time.perf_counter()
+    with RssSampler() as rss:
+        results = list(_iter_engine(engine, values, llm, concurrency, limiter, retry, streaming))
+    elapsed = time.perf_counter() - started
+    after = server_stats(base_url)
+    traces = [trace for trace in (meter.pop_row(k) for k in range(len(values))) if trace is not None]
+    row_times = [trace.total_time for trace in traces]
+    api_times = [trace.api_latency for trace in traces]
+    ttfts = [trace.ttft for trace in traces if trace.ttft is not None]
+    failed = sum(1 for result in results if is_failed_result(result))
+    skipped = sum(1 for result in results if result == SKIP_RESULT)
+    mb = 1024 * 1024
+    return {
+        "engine": engine,
+        "concurrency": concurrency,
+        "rows": len(values),
+        "succeeded": len(results) - failed - skipped,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_s": round(len(values) / elapsed, 2) if elapsed else None,
+        "row_p50_s": percentile(row_times, 0.5),
+        "row_p95_s": percentile(row_times, 0.95),
+        "api_p95_s": percentile(api_times, 0.95),
+        "ttft_p95_s": percentile(ttfts, 0.95),
+        "aborted_streams": sum(trace.aborted for trace in traces),
+        "parse_ms_per_row": round(sum(trace.parse_time for trace in traces) / len(traces) * 1000, 3)
+        if traces else None,
+        "requests": meter.total.requests,
+        "output_tokens": meter.total.completion_tokens,
+        "server_throttled": after["throttled"] - before["throttled"],
+        "server_errors": after["errors"] - before["errors"],
+        "peak_in_flight": after["peak_in_flight"],
+        "peak_rss_mb": round(rss.peak / mb, 1) if rss.peak else None,
+        "rss_growth_mb": round((rss.peak - rss.start) / mb, 1) if rss.peak and rss.start else None,
+    }
+
+
+def run_suite(datasets: Sequence[DatasetSpec] = DEFAULT_DATASETS,
+              engines: Sequence[str] = BENCH_ENGINES,
+              concurrency_levels: Sequence[int] = (5, 20),
+              mock: MockOptions = MockOptions(),
+              seed: int = 0,
+              retry: RetryPolicy = RetryPolicy(),
+              adaptive: bool = False,
+              in_process: bool = False,
+              streaming: Optional[StreamOptions] = None) -> pd.DataFrame:
+    """运行全部组合并返回报告（每个组合一行）；顺序引擎只在并发1下运行一次"""
+    if in_process:
+        server, process = MockServer(mock).start(), None
+        base_url = server.url
+    else:
+        server = None
+        process, base_url = start_mock_process(mock)
+    rows = []
+    try:
+        # 预热：加载提示词、分词器与连接池，不计入结果
+        run_case(["销售：您好\n顾客：随便看看"], ENGINE_THREAD, 1, base_url, retry)
+        for spec in datasets:
+            values = synthetic_conversations(spec, seed)
+            for engine in engines:
+                for concurrency in ([1] if engine == ENGINE_SEQUENTIAL else concurrency_levels):
+                    logger.info("基准: %s × %s × 并发%d", spec.name, engine, concurrency)
+                    rows.append({"dataset": spec.name, **run_case(values, engine, concurrency, base_url, retry,
+                                                                  adaptive, streaming)})
+    finally:
+        if server is not None:
+            server.stop()
+        if process is not None:
+            process.terminate()
+            process.join()
+    return pd.DataFrame(rows)
+
+
+def load_report(path: str) -> pd.DataFrame:
+    return pd.read_json(path) if path.lower().endswith(".json") else pd.read_csv(path)
+
+
+def save_report(report: pd.DataFrame, path: str):
+    if path.lower().endswith(".json"):
+        report.to_json(path, orient="records", force_ascii=False, indent=2)
+    else:
+        report.to_csv(path, index=False, encoding="utf-8-sig")
+
+
+def compare_with_baseline(report: pd.DataFrame, baseline: pd.DataFrame, tolerance: float = 0.2) -> List[str]:
+    """吞吐低于基线 (1 - tolerance) 倍的组合，返回说明文字列表（只比较两份报告都有的组合）"""
+    merged = report.merge(baseline[REPORT_KEYS + ["rows_per_s"]], on=REPORT_KEYS, suffixes=("", "_baseline"))
+    slower = merged[merged["rows_per_s"] < merged["rows_per_s_baseline"] * (1 - tolerance)]
+    return [
+        f"{row.dataset} × {row.engine} × 并发{row.concurrency}: "
+        f"{row.rows_per_s:.2f} 行/秒，基线 {row.rows_per_s_baseline:.2f} 行/秒"
+        for row in slower.itertuples()
+    ]
+
+
+def _csv_list(text: str) -> List[str]:
+    return [item.strip() for item in text.split(",") if item.strip()]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="qa_engine.benchmark", description="LangChain智能质检 - 本地模拟服务上的性能基准")
+    parser.add_argument("--engines", default=",".join(BENCH_ENGINES), help=f"逗号分隔，可选 {', '.join(BENCH_ENGINES)}")
+    parser.add_argument("--concurrency", default="5,20", help="逗号分隔的并发设置（顺序引擎固定为1）")
+    parser.add_argument("--datasets", default=",".join(spec.name for spec in DEFAULT_DATASETS),
+                        help="逗号分隔的内置数据集：short（2~6轮）、medium（8~20轮）、long（150~300轮，多数会切分）")
+    parser.add_argument("--rows", type=int, default=None, help="覆盖各数据集的行数")
+    parser.add_argument("--max-retries", type=int, default=3, help="可重试错误的最大重试次数")
+    parser.add_argument("--adaptive", action="store_true", help="启用自适应并发（默认固定为并发设置）")
+    parser.add_argument("--in-process", action="store_true", help="模拟服务与引擎运行在同一进程中")
+    parser.add_argument("--stream-output", action="store_true", help="逐行请求使用流式输出（边接收边检查结构）")
+    parser.add_argument("-o", "--output", default=None, help="保存报告（.json 或 .csv），可作为以后的基线")
+    parser.add_argument("--baseline", default=None, help="与之前保存的报告比较吞吐")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="吞吐允许低于基线的比例")
+    add_mock_arguments(parser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    engines = _csv_list(args.engines)
+    unknown = [engine for engine in engines if engine not in BENCH_ENGINES]
+    if unknown:
+        logger.error("未知引擎: %s", ", ".join(unknown))
+        return 2
+    specs = {spec.name: spec for spec in DEFAULT_DATASETS}
+    datasets = []
+    for name in _csv_list(args.datasets):
+        if name not in specs:
+            logger.error("未知数据集: %s", name)
+            return 2
+        spec = specs[name]
+        datasets.append(DatasetSpec(name, args.rows, spec.min_turns, spec.max_turns, spec.blank_rate)
+                        if args.rows else spec)
+
+    report = run_suite(datasets, engines, [int(level) for level in _csv_list(args.concurrency)],
+                       options_from_args(args), args.seed, RetryPolicy(max_retries=args.max_retries),
+                       args.adaptive, args.in_process, DEFAULT_STREAMING if args.stream_output else None)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(report.to_string(index=False))
+    if args.output:
+        save_report(report, args.output)
+        logger.info("报告已保存: %s", args.output)
+    if args.baseline:
+        regressions = compare_with_baseline(report, load_report(args.baseline), args.tolerance)
+        for line in regressions:
+            logger.warning("吞吐回退: %s", line)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
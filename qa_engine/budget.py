@@ -0,0 +1,146 @@
+"""token预算与长对话切分：按输入长度设置每行 max_tokens，超长对话按行切分后分段分析再合并
+
+token数优先用 tiktoken 计算（cl100k_base 与 DeepSeek 分词器的中文计数接近），
+未安装或编码文件无法下载时退回按字符类别估算。
+"""
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖，缺失时使用估算
+    tiktoken = None
+
+from .screen import BANNED_SECTION
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_ENCODING = "cl100k_base"
+QUALITY_SECTION = "对话质量问题"
+EXCELLENT_SECTION = "优秀销售话术"
+SUMMARY_SECTION = "整体评估"
+TURN_FIELD = "轮次"
+
+_CJK = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning("加载tiktoken编码失败，改用字符估算token数: %s", e)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """计算文本token数；没有分词器时按中文约0.6、其他字符约0.3 token/字估算"""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+@lru_cache(maxsize=16)
+def count_static_tokens(text: str) -> int:
+    """系统消息等固定文本的token数（缓存，每批只计算一次）"""
+    return count_tokens(text)
+
+
+@dataclass(frozen=True)
+class TokenBudget:
+    """每行的token预算
+
+    输出上限 = output_base + 输入token数 * output_ratio，限制在 [min_output, 模型max_tokens] 之间，
+    且输入与输出之和不超过 context_window。对话超过 chunk_tokens 时按行切分为多段分别分析。
+    """
+    chunk_tokens: int = 4000
+    min_output: int = 1024
+    output_base: int = 1024
+    output_ratio: float = 1.0
+    context_window: int = 64000
+
+    def max_output(self, input_tokens: int, model_max: Optional[int] = None) -> int:
+        budget = max(self.min_output, int(self.output_base + input_tokens * self.output_ratio))
+        if model_max:
+            budget = min(budget, model_max)
+        return max(1, min(budget, self.context_window - input_tokens))
+
+    def split(self, conversation: str) -> List[str]:
+        """按行切分对话，每段不超过 chunk_tokens（单行超长时独占一段，不在行内截断）"""
+        if self.chunk_tokens <= 0 or count_tokens(conversation) <= self.chunk_tokens:
+            return [conversation]
+        chunks, current, size = [], [], 0
+        for line in conversation.splitlines(keepends=True):
+            tokens = count_tokens(line)
+            if current and size + tokens > self.chunk_tokens:
+                chunks.append("".join(current))
+                current, size = [], 0
+            current.append(line)
+            size += tokens
+        if current:
+            chunks.append("".join(current))
+        return [chunk for chunk in chunks if chunk.strip()]
+
+
+DEFAULT_BUDGET = TokenBudget()
+
+
+def _as_int(value: Any) -> Optional[int]:
+    match = re.search(r"\d+", str(value))
+    return int(match.group()) if match else None
+
+
+def _shift_turn(item: Any, offset: int) -> Any:
+    if not offset or not isinstance(item, dict) or _as_int(item.get(TURN_FIELD)) is None:
+        return item
+    return {**item, TURN_FIELD: _as_int(item[TURN_FIELD]) + offset}
+
+
+def quality_grade(issue_ratio: float, excellent_ratio: float) -> str:
+    """按提示词中的标准判定总体质量等级（比例为百分数）"""
+    if issue_ratio > 30 or excellent_ratio < 5:
+        return "待改进"
+    if issue_ratio < 5 and excellent_ratio > 20:
+        return "优秀"
+    if issue_ratio <= 15 and excellent_ratio >= 10:
+        return "良好"
+    return "一般"
+
+
+def merge_chunk_data(parts: List[Dict[str, Any]], fallback_turns: List[int]) -> Dict[str, Any]:
+    """合并各段的分析结果
+
+    数组维度按段顺序拼接，轮次加上前面各段的总轮次；整体评估中的占比与等级按合并后的数量重新计算。
+    某段没有给出可解析的对话总轮次时，用 fallback_turns 中该段的非空行数代替。
+    """
+    merged: Dict[str, Any] = {}
+    offset = 0
+    for data, fallback in zip(parts, fallback_turns):
+        for key, value in data.items():
+            if isinstance(value, list):
+                merged.setdefault(key, []).extend(_shift_turn(item, offset) for item in value)
+            else:
+                merged.setdefault(key, value)
+        summary = data.get(SUMMARY_SECTION)
+        turns = _as_int(summary.get("对话总轮次")) if isinstance(summary, dict) else None
+        offset += turns or fallback
+    total_turns = max(offset, 1)
+    issues = len(merged.get(QUALITY_SECTION, [])) + len(merged.get(BANNED_SECTION, []))
+    issue_ratio = issues / total_turns * 100
+    excellent_ratio = len(merged.get(EXCELLENT_SECTION, [])) / total_turns * 100
+    summary = merged.get(SUMMARY_SECTION)
+    merged[SUMMARY_SECTION] = {
+        **(summary if isinstance(summary, dict) else {}),
+        "对话总轮次": offset,
+        "问题轮次占比": f"{issue_ratio:.1f}%",
+        "优秀话术轮次占比": f"{excellent_ratio:.1f}%",
+        "总体质量等级": quality_grade(issue_ratio, excellent_ratio),
+    }
+    return merged
@@ -0,0 +1,115 @@
+"""持久化结果缓存：以对话文本、提示词与模型参数的哈希为键，存储在SQLite中"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".qa_cache", "results.db"
+)
+
+
+def make_cache_key(parts: Iterable[str]) -> str:
+    """对所有影响结果的输入计算SHA-256内容地址"""
+    payload = json.dumps(list(parts), ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """线程安全的SQLite结果缓存，支持按总大小（LRU）与存活时间淘汰"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_size_mb: Optional[float] = 512,
+                 max_age_days: Optional[float] = 30, evict_every: int = 200):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self._evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results(accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, result: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, result, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, result, len(result.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            should_evict = self._writes % self._evict_every == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """删除过期条目，并按最近访问时间淘汰直到总大小不超过上限"""
+        with self._lock:
+            if self.max_age:
+                self._conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - self.max_age,))
+            if self.max_bytes:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+                if total > self.max_bytes:
+                    excess = total - self.max_bytes
+                    rows = self._conn.execute("SELECT key, size FROM results ORDER BY accessed_at")
+                    stale = []
+                    for key, size in rows:
+                        if excess <= 0:
+                            break
+                        stale.append((key,))
+                        excess -= size
+                    self._conn.executemany("DELETE FROM results WHERE key = ?", stale)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
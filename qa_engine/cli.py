@@ -0,0 +1,301 @@
+"""命令行入口：无需Streamlit即可批量运行质检流程
+
+示例:
+    python -m qa_engine data.xlsx --column 对话内容 --output 质检结果.csv --workers 5
+"""
+import argparse
+import logging
+import os
+import sys
+from typing import List, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from .async_engine import ENGINE_ASYNC, ENGINE_THREAD
+from .backends import build_backend_pool, load_backend_configs
+from .batch_api import ENGINE_BATCH, BatchOptions
+from .cache import DEFAULT_CACHE_PATH, ResultCache
+from .core import (
+    DEFAULT_BASE_URL,
+    DEFAULT_MODEL,
+    RESULT_COLUMN,
+    create_qa_prompt,
+    failed_row_positions,
+    initialize_llm,
+    is_failed_result,
+)
+from .budget import DEFAULT_BUDGET, TokenBudget
+from .dedup import DEFAULT_SIMILARITY, is_reused_result
+from .export import OrderedCsvWriter, frame_to_xlsx, parquet_available, write_parquet
+from .ingest import iter_table_rows, read_header
+from .metrics import summarize_metrics, write_metrics
+from .packing import DEFAULT_PACKING, PackOptions
+from .jobs import DEFAULT_JOB_DIR, JobStore, run_job
+from .rate_limit import RateLimiter
+from .result_tables import analyzed_rows, grade_distribution, issue_frequency, load_job_tables, save_result_tables
+from .retry import RetryPolicy
+from .screen import DEFAULT_BANNED_FILE, SCREEN_HINT, SCREEN_OFF, SCREEN_REPLACE, load_banned_phrases
+from .streaming import DEFAULT_STREAMING, StreamOptions
+from .usage import DEFAULT_PRICING, Pricing, UsageMeter
+
+logger = logging.getLogger(__name__)
+
+
+def read_table(path: str) -> pd.DataFrame:
+    """按扩展名读取CSV/Excel文件"""
+    if path.lower().endswith('.csv'):
+        return pd.read_csv(path)
+    return pd.read_excel(path)
+
+
+def _seconds(value: Optional[float]) -> str:
+    return f"{value:.2f}s" if value is not None else "-"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="qa_engine", description="LangChain智能质检 - 命令行批量处理")
+    parser.add_argument("input", nargs="?", help="输入文件（CSV/XLSX/XLS），使用 --resume 时可省略")
+    parser.add_argument("-c", "--column", help="需要质检的文本列名（新任务必填）")
+    parser.add_argument("-o", "--output", required=True, help="输出文件（.csv 流式写入，.xlsx/.parquet 结束后写入）")
+    parser.add_argument("--api-key", default=None, help="DeepSeek API密钥（默认读取环境变量 DEEPSEEK_API_KEY）")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="API基础URL")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="模型名称")
+    parser.add_argument("--backends", default=None, metavar="JSON",
+                        help="多后端配置文件（JSON列表，每项含 base_url、api_key 或 api_key_env、model，可选 weight、rpm、tpm），"
+                             "设置后忽略 --api-key/--base-url/--model，请求在各后端间加权分配并自动故障转移")
+    parser.add_argument("-w", "--workers", type=int, default=5,
+                        help="并发数：线程引擎为线程数，异步引擎为在途请求上限（可设为数百）")
+    parser.add_argument("--engine", choices=[ENGINE_THREAD, ENGINE_ASYNC, ENGINE_BATCH], default=ENGINE_THREAD,
+                        help="执行引擎：thread（线程池）、async（asyncio协程，共享连接池）或 "
+                             "batch（服务商 /v1/batches 离线批处理，提交后轮询到完成，中断后 --resume 继续轮询）")
+    parser.add_argument("--batch-poll-interval", type=float, default=30,
+                        help="批处理模式查询批次状态的间隔（秒）")
+    parser.add_argument("--sequential", action="store_true", help="顺序处理（等价于单线程）")
+    parser.add_argument("--pack", action="store_true",
+                        help="把相邻的短对话打包为一个请求（仅线程引擎），结果缺失或不合格的对话改为单独请求")
+    parser.add_argument("--pack-rows", type=int, default=DEFAULT_PACKING.max_rows, help="每个打包请求最多包含的对话数")
+    parser.add_argument("--pack-tokens", type=int, default=DEFAULT_PACKING.pack_tokens,
+                        help=f"每个打包请求中对话的token数合计上限；单条超过 {DEFAULT_PACKING.row_tokens} token 的对话不打包")
+    parser.add_argument("--rpm", type=float, default=None, help="每分钟请求数上限（不设置则不限制）")
+    parser.add_argument("--tpm", type=float, default=None, help="每分钟token数上限（不设置则不限制）")
+    parser.add_argument("--no-adaptive", action="store_true", help="关闭自适应并发，固定使用 --workers 个并发")
+    parser.add_argument("--max-retries", type=int, default=3, help="可重试错误（超时、429、5xx）的最大重试次数")
+    parser.add_argument("--max-reasks", type=int, default=1,
+                        help="输出不符合JSON结构要求时附上问题重新请求的次数，仍不合格记为可重试失败")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_BUDGET.chunk_tokens,
+                        help="对话超过该token数时按行切分为多段并行分析后合并，0表示不切分")
+    parser.add_argument("--stream-output", action="store_true",
+                        help="流式接收模型输出，边接收边检查JSON结构，偏离输出格式或字段过长时提前中止并重新请求")
+    parser.add_argument("--section-tokens", type=int, default=DEFAULT_STREAMING.section_tokens,
+                        help="流式输出时单个顶级字段的输出token上限")
+    parser.add_argument("--no-json-mode", action="store_true",
+                        help="不请求 response_format=json_object（服务商不支持JSON模式时使用）")
+    parser.add_argument("--banned-screen", choices=[SCREEN_OFF, SCREEN_HINT, SCREEN_REPLACE], default=SCREEN_OFF,
+                        help="违禁词本地预检：hint 将词典命中附在请求中供模型参考，replace 由本地命中直接替代该维度")
+    parser.add_argument("--banned-file", default=DEFAULT_BANNED_FILE, help="违禁词词典（CSV：违禁词,类型,风险等级）")
+    parser.add_argument("--dedup", action="store_true",
+                        help="近重复对话只请求一次，其余行复用代表行的结果（需要 faiss-cpu）")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_SIMILARITY,
+                        help="近重复判定的估计Jaccard相似度阈值（0-1，1.0 表示只合并内容相同的对话）")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="输入为之前的输出文件时，只重新处理质检结果为失败的行")
+    parser.add_argument("--pricing", default=None, metavar="HIT,MISS,OUTPUT",
+                        help="估算费用用的每百万token价格：缓存命中输入,未命中输入,输出（默认 "
+                             f"{DEFAULT_PRICING.cache_hit},{DEFAULT_PRICING.cache_miss},{DEFAULT_PRICING.output}）")
+    parser.add_argument("--metrics-out", default=None,
+                        help="写出逐行耗时/用量/错误指标：.json（汇总+逐行）、.csv（逐行）、.prom（Prometheus文本格式）")
+    parser.add_argument("--tables-out", default=None, metavar="DIR",
+                        help="把结果整理为结构化表格写入该目录：metrics.parquet（每段对话一行）、items.parquet（每个问题/话术一行）")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="结果缓存数据库路径")
+    parser.add_argument("--no-cache", action="store_true", help="不读写结果缓存")
+    parser.add_argument("--cache-max-mb", type=float, default=512, help="缓存总大小上限（MB），超出按最近访问淘汰")
+    parser.add_argument("--cache-max-age-days", type=float, default=30, help="缓存条目最长保留天数")
+    parser.add_argument("--job-dir", default=DEFAULT_JOB_DIR, help="任务库目录（逐行保存进度）")
+    parser.add_argument("--resume", metavar="JOB_ID", help="从任务库继续运行中断的任务")
+    parser.add_argument("--stream", action="store_true",
+                        help="流式模式：分块读取输入、只在内存中保留质检列，结果按块写出（适合数百MB的文件，输出须为.csv）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出详细日志")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    if not args.verbose:
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    api_key = args.api_key or os.getenv("DEEPSEEK_API_KEY")
+    if not api_key and not args.backends:
+        logger.error("未提供API密钥，请使用 --api-key 或设置环境变量 DEEPSEEK_API_KEY")
+        return 2
+    if args.pack and args.engine != ENGINE_THREAD:
+        logger.error("--pack 仅支持线程引擎")
+        return 2
+    if args.stream and args.retry_failed:
+        logger.error("流式模式暂不支持 --retry-failed")
+        return 2
+    backends = None
+    if args.backends and args.engine == ENGINE_BATCH:
+        logger.error("批处理模式不支持多后端，请使用 --api-key/--base-url/--model 指定单个服务")
+        return 2
+    if args.backends:
+        try:
+            backends = load_backend_configs(args.backends)
+        except (OSError, ValueError) as e:
+            logger.error("多后端配置无效: %s", e)
+            return 2
+    pricing = DEFAULT_PRICING
+    if args.pricing:
+        try:
+            hit, miss, output = (float(price) for price in args.pricing.split(","))
+            pricing = Pricing(hit, miss, output)
+        except ValueError:
+            logger.error("--pricing 格式应为 命中价格,未命中价格,输出价格")
+            return 2
+
+    store = JobStore(args.job_dir)
+    if args.resume:
+        job = store.get_job(args.resume)
+        if job is None:
+            logger.error("任务不存在: %s", args.resume)
+            return 2
+        job_id = args.resume
+        source_path = job["source_path"]
+        data = None if source_path else store.load_input(job_id)
+        logger.info("继续任务 %s: 已完成 %d/%d 行", job_id, job["completed_rows"], job["total_rows"])
+    else:
+        if not args.input or not args.column:
+            logger.error("新任务需要指定输入文件与 --column")
+            return 2
+        columns = read_header(args.input)
+        if args.column not in columns:
+            logger.error("列 %s 不存在，可选列: %s", args.column, columns)
+            return 2
+        source_path = args.input if args.stream else None
+        data = None if args.stream else read_table(args.input)
+        previous = None
+        if args.retry_failed and RESULT_COLUMN in data.columns:
+            previous = data[RESULT_COLUMN].tolist()
+            failed_positions = set(failed_row_positions(data))
+            data = data.drop(columns=[RESULT_COLUMN])
+            logger.info("重试模式: %d 行失败待重新处理", len(failed_positions))
+        job_id = store.create_job(data, args.column, os.path.basename(args.input), source_path=source_path)
+        if previous is not None:
+            store.record_results(job_id, [(idx, r) for idx, r in enumerate(previous) if idx not in failed_positions])
+        logger.info("已创建任务 %s，中断后可使用 --resume %s 继续", job_id, job_id)
+
+    if source_path and not args.output.lower().endswith('.csv'):
+        logger.error("流式模式的输出文件必须为 .csv")
+        return 2
+    if args.output.lower().endswith('.parquet') and not parquet_available():
+        logger.error("输出Parquet需要安装 pyarrow: pip install pyarrow")
+        return 2
+    if args.tables_out and not parquet_available():
+        logger.error("--tables-out 需要安装 pyarrow: pip install pyarrow")
+        return 2
+
+    usage = UsageMeter()
+    if backends:
+        llm = build_backend_pool(backends, json_mode=not args.no_json_mode, callbacks=[usage])
+        logger.info("多后端模式: %s", ", ".join(f"{b.name}(权重{b.weight:g})" for b in backends))
+    else:
+        llm = initialize_llm(api_key, args.base_url, model=args.model, json_mode=not args.no_json_mode,
+                             callbacks=[usage])
+    prompt = create_qa_prompt().with_budget(TokenBudget(chunk_tokens=max(0, args.chunk_tokens)))
+    if args.banned_screen != SCREEN_OFF:
+        screen = load_banned_phrases(args.banned_file)
+        if screen is None:
+            logger.error("违禁词词典不存在: %s", args.banned_file)
+            return 2
+        prompt = prompt.with_screen(screen, args.banned_screen)
+    if args.stream_output:
+        prompt = prompt.with_streaming(StreamOptions(section_tokens=max(1, args.section_tokens)))
+    workers = 1 if args.sequential else max(1, args.workers)
+    limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm, max_concurrency=workers,
+                          adaptive=not args.no_adaptive)
+    retry = RetryPolicy(max_retries=max(0, args.max_retries), max_reasks=max(0, args.max_reasks))
+    cache = None if args.no_cache else ResultCache(
+        args.cache, max_size_mb=args.cache_max_mb, max_age_days=args.cache_max_age_days
+    )
+
+    def log_progress(completed: int, total: int):
+        logger.info("处理进度: %d/%d", completed, total)
+
+    stream_csv = args.output.lower().endswith('.csv')
+    if not stream_csv:
+        writer = None
+    elif source_path:
+        writer = OrderedCsvWriter(args.output, *iter_table_rows(source_path))
+    else:
+        writer = OrderedCsvWriter.from_frame(args.output, data)
+    try:
+        if writer:
+            for idx, result in sorted(store.completed_results(job_id).items()):
+                writer.add(idx, result)
+        result_df = run_job(store, job_id, llm, log_progress, workers, limiter, retry, cache,
+                            on_result=writer.add if writer else None, engine=args.engine, prompt=prompt,
+                            dedup_threshold=args.dedup_threshold if args.dedup else None, usage=usage,
+                            batch_options=BatchOptions(poll_interval=max(0.1, args.batch_poll_interval)),
+                            packing=PackOptions(max(2, args.pack_rows), args.pack_tokens) if args.pack else None)
+    finally:
+        if writer:
+            writer.close()
+
+    if args.output.lower().endswith('.parquet'):
+        write_parquet(args.output, result_df)
+    elif not stream_csv:
+        frame_to_xlsx(args.output, result_df)
+
+    results = result_df[RESULT_COLUMN].tolist()
+    total_rows = len(results)
+    failed = sum(1 for result in results if is_failed_result(result))
+    reused = sum(1 for result in results if is_reused_result(result))
+    if cache is not None:
+        logger.info("结果缓存: 命中 %d，未命中 %d，命中率 %.1f%%",
+                    cache.hits, cache.misses, cache.hit_rate * 100)
+        cache.close()
+    logger.info("本次运行token用量: %s", usage.total.describe(pricing))
+    if backends:
+        for stats in llm.stats():
+            logger.info("后端 %s: 成功 %d，失败 %d（限流 %d），%s%s", stats["后端"], stats["成功请求"], stats["失败"],
+                        stats["限流"], stats["状态"], f"，最近错误: {stats['最近错误']}" if stats["最近错误"] else "")
+    metrics = store.metrics_frame(job_id)
+    if not metrics.empty:
+        summary = summarize_metrics(metrics)
+        latency = summary["latency"]
+        logger.info("整行耗时 p50/p95/p99: %s；调用耗时 p95: %s；排队等待 p95: %s；吞吐 %.1f 行/分钟；重试 %d 次",
+                    "/".join(_seconds(latency["total"][q]) for q in ("p50", "p95", "p99")),
+                    _seconds(latency["api"]["p95"]), _seconds(latency["queue_wait"]["p95"]),
+                    summary["throughput_rows_per_min"], summary["retries"])
+        if args.stream_output:
+            logger.info("首token耗时 p50/p95: %s；提前中止 %d 次",
+                        "/".join(_seconds(latency["ttft"][q]) for q in ("p50", "p95")), summary["aborted_streams"])
+    if args.metrics_out:
+        write_metrics(args.metrics_out, metrics, {"job_id": job_id})
+        logger.info("运行指标已写入 %s", args.metrics_out)
+    if args.tables_out:
+        tables = load_job_tables(store, job_id)
+        save_result_tables(tables, args.tables_out)
+        grades = grade_distribution(analyzed_rows(tables.metrics))
+        if grades.empty:
+            logger.info("质量等级分布: 无可统计结果")
+        else:
+            logger.info("质量等级分布: %s", "，".join(f"{grade} {count}" for grade, count in grades.iloc[0].items()))
+        top_issues = issue_frequency(tables.items).head(5)
+        if not top_issues.empty:
+            logger.info("高频问题: %s", "，".join(f"{row['类型']} {row['次数']}" for _, row in top_issues.iterrows()))
+        logger.info("结构化结果表已写入 %s", args.tables_out)
+    if args.resume:
+        logger.info("任务累计token用量: %s", store.usage_summary(job_id).describe(pricing))
+    logger.info("任务 %s 处理完成: 共 %d 行，失败 %d 行，复用 %d 行，限流 %d 次，结果已写入 %s",
+                job_id, total_rows, failed, reused, limiter.throttled_count, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
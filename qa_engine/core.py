@@ -0,0 +1,399 @@
+"""质检引擎核心：模型初始化、提示词、单行分析与批量处理（不依赖Streamlit）"""
+import contextvars
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from langchain.schema import AIMessage, BaseMessage, HumanMessage
+from langchain_openai import ChatOpenAI
+
+from .budget import count_static_tokens, count_tokens, merge_chunk_data
+from .cache import ResultCache, make_cache_key
+from .errors import is_retryable_error
+from .parsing import extract_json_from_text, validate_result
+from .prompt import QAPrompt, load_prompt
+from .rate_limit import RateLimiter
+from .retry import DEFAULT_RETRY_POLICY, RetryPolicy, call_with_retry
+from .streaming import StreamChecker, consume_stream, stream_kwargs
+from .usage import record_failure, record_parse_time, track_row
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "deepseek-chat"
+DEFAULT_BASE_URL = "https://api.deepseek.com/v1"
+RESULT_COLUMN = "质检结果"
+SKIP_RESULT = "⏭️ 空值跳过"
+FAILED_PREFIX = "❌ 分析失败"
+RETRYABLE_FAILED_PREFIX = f"{FAILED_PREFIX}(可重试)"
+FATAL_FAILED_PREFIX = f"{FAILED_PREFIX}(不可重试)"
+
+# 进度回调: (已完成行数, 总行数)
+ProgressCallback = Callable[[int, int], None]
+
+REASK_TEMPLATE = """你上一次的输出不符合要求的JSON结构：{problems}。
+请严格按照系统提示中的最终输出格式，只输出一个完整的JSON对象，不要包含任何其他文字。"""
+
+def initialize_llm(api_key: str, base_url: str = None, model: str = DEFAULT_MODEL,
+                   temperature: float = 0.7, max_tokens: int = 10000,
+                   json_mode: bool = True, callbacks: Optional[List[Any]] = None) -> ChatOpenAI:
+    """初始化DeepSeek模型，失败时抛出异常
+
+    客户端自带的重试被关闭，由 RetryPolicy 统一控制重试，以便限流器感知每一次429。
+    json_mode 开启时请求 response_format=json_object，服务端保证输出为合法JSON（不支持的服务商可关闭）。
+    callbacks 可传入 UsageMeter，统计每次请求的token用量与前缀缓存命中。
+    """
+    return ChatOpenAI(
+        model=model,
+        openai_api_key=api_key,
+        openai_api_base=base_url or DEFAULT_BASE_URL,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        max_retries=0,
+        model_kwargs={"response_format": {"type": "json_object"}} if json_mode else {},
+        callbacks=callbacks
+    )
+
+
+def create_qa_prompt() -> QAPrompt:
+    """获取质检提示（prompt.txt 未变化时复用已编译的提示）"""
+    return load_prompt()
+
+
+def format_failure(exc: BaseException) -> str:
+    """将异常格式化为结果列中的失败标记，区分可重试与不可重试"""
+    record_failure(type(exc).__name__)
+    prefix = RETRYABLE_FAILED_PREFIX if is_retryable_error(exc) else FATAL_FAILED_PREFIX
+    return f"{prefix}: {str(exc)}"
+
+
+def result_cache_key(llm: ChatOpenAI, messages, max_tokens: Optional[int]) -> str:
+    """结果缓存键：完整提示消息（含对话文本与prompt.txt内容）+ 请求参数（模型、温度、额外参数等）
+
+    max_tokens 为本次请求实际发送的值（按token预算逐行设置），不同输出上限下的结果互不复用。
+    """
+    parts = [f"{m.type}:{m.content}" for m in messages]
+    params = getattr(llm, "_default_params", None)
+    if params is None:
+        params = {"model": getattr(llm, "model_name", None), "temperature": getattr(llm, "temperature", None),
+                  **(getattr(llm, "model_kwargs", None) or {})}
+    params = {key: value for key, value in params.items() if key != "stream"}
+    params["max_tokens"] = max_tokens
+    parts.append(json.dumps(params, sort_keys=True, ensure_ascii=False, default=str))
+    return make_cache_key(parts)
+
+
+def check_result(content: str, prompt: QAPrompt, conversation: str) -> Tuple[str, List[str]]:
+    """校验模型输出，返回 (规范化结果, 问题列表)
+
+    通过校验时结果规范化为紧凑的JSON文本（去掉代码块标记与多余文字）；提示词没有输出示例时原样返回。
+    """
+    if prompt.schema is None:
+        return content, []
+    started = time.perf_counter()
+    data = extract_json_from_text(content)
+    problems = validate_result(data, prompt.schema)
+    if not problems:
+        content = json.dumps(prompt.postprocess(data, conversation), ensure_ascii=False)
+    record_parse_time(time.perf_counter() - started)
+    return content, problems
+
+
+def reask_messages(messages: List[BaseMessage], content: str, problems: List[str]) -> List[BaseMessage]:
+    """在原始消息后附上不合格的输出与问题说明，要求模型重新输出"""
+    return messages + [AIMessage(content=content), HumanMessage(content=REASK_TEMPLATE.format(problems="；".join(problems)))]
+
+
+def format_invalid(content: str, problems: List[str]) -> str:
+    """重新请求后仍不合格的输出记为可重试失败，保留原始输出开头便于排查"""
+    record_failure("InvalidOutput")
+    return f"{RETRYABLE_FAILED_PREFIX}: 输出不符合JSON结构要求（{'；'.join(problems)}）原始输出: {content[:200]}"
+
+
+def request_tokens(llm: ChatOpenAI, request: List[BaseMessage], prompt: QAPrompt) -> Tuple[int, int]:
+    """返回 (输入token数, 本次请求的 max_tokens)；系统消息的token数每批只计算一次"""
+    input_tokens = sum(
+        count_static_tokens(m.content) if m is prompt.system_message else count_tokens(m.content)
+        for m in request
+    )
+    return input_tokens, prompt.budget.max_output(input_tokens, getattr(llm, "max_tokens", None))
+
+
+def split_for_request(conversation: str, prompt: QAPrompt) -> List[str]:
+    """按token预算切分对话；提示词没有输出示例（无法合并结果）时不切分"""
+    if prompt.schema is None:
+        return [conversation]
+    return prompt.budget.split(conversation)
+
+
+def merge_chunk_results(results: List[str], chunks: List[str], prompt: QAPrompt, conversation: str) -> str:
+    """合并各段结果；任一段失败时整行记为该段的失败结果"""
+    for result in results:
+        if is_error_result(result):
+            return result
+    data = merge_chunk_data(
+        [json.loads(result) for result in results],
+        [sum(1 for line in chunk.splitlines() if line.strip()) for chunk in chunks]
+    )
+    return json.dumps(prompt.postprocess(data, conversation), ensure_ascii=False)
+
+
+def invoke_with_budget(llm: ChatOpenAI, request: List[BaseMessage], limiter: Optional[RateLimiter],
+                       prompt: QAPrompt) -> BaseMessage:
+    """按token预算设置 max_tokens 发出一次调用（不含重试）"""
+    input_tokens, max_tokens = request_tokens(llm, request, prompt)
+    if limiter is None:
+        return llm.invoke(request, max_tokens=max_tokens)
+    # TPM按输入加输出上限预占，输出上限随输入长度缩放，短对话不再按整个 max_tokens 占用配额
+    with limiter.slot(input_tokens + max_tokens):
+        return llm.invoke(request, max_tokens=max_tokens)
+
+
+def stream_with_budget(llm: ChatOpenAI, request: List[BaseMessage], limiter: Optional[RateLimiter],
+                       prompt: QAPrompt) -> Tuple[str, List[str]]:
+    """invoke_with_budget 的流式版本：边接收边检查结构，返回 (输出, 偏离问题)；并发与TPM配额占用到输出结束"""
+    input_tokens, max_tokens = request_tokens(llm, request, prompt)
+    checker = StreamChecker(prompt.schema, prompt.streaming, max_tokens)
+    kwargs = stream_kwargs(llm, max_tokens)
+    if limiter is None:
+        return consume_stream(llm.stream(request, **kwargs), checker)
+    with limiter.slot(input_tokens + max_tokens):
+        return consume_stream(llm.stream(request, **kwargs), checker)
+
+
+def fetch_analysis(llm: ChatOpenAI, request: List[BaseMessage], conversation: str,
+                   limiter: Optional[RateLimiter], retry: RetryPolicy, prompt: QAPrompt) -> Tuple[str, str, List[str]]:
+    """发出一次请求（含重试）并校验，返回 (原始输出, 规范化结果, 问题列表)；流式输出提前中止时问题为偏离原因"""
+    if prompt.streaming is not None:
+        content, drift = call_with_retry(lambda: stream_with_budget(llm, request, limiter, prompt), retry)
+        if drift:
+            return content, content, drift
+    else:
+        content = call_with_retry(lambda: invoke_with_budget(llm, request, limiter, prompt), retry).content
+    result, problems = check_result(content, prompt, conversation)
+    return content, result, problems
+
+
+def request_analysis(llm: ChatOpenAI, messages: List[BaseMessage], conversation: str,
+                     limiter: Optional[RateLimiter], retry: RetryPolicy,
+                     cache: Optional[ResultCache], prompt: QAPrompt) -> str:
+    """发送一次质检请求（含缓存、结构校验与重新请求），max_tokens 按输入长度设置；调用异常向上抛出"""
+    cache_key = None
+    if cache is not None:
+        cache_key = result_cache_key(llm, messages, request_tokens(llm, messages, prompt)[1])
+        cached = cache.get(cache_key)
+        if cached is not None:
+            result, problems = check_result(cached, prompt, conversation)
+            if not problems:
+                return result
+
+    content, result, problems = fetch_analysis(llm, messages, conversation, limiter, retry, prompt)
+    for _ in range(retry.max_reasks):
+        if not problems:
+            break
+        logger.info("输出不符合JSON结构要求（%s），重新请求", "；".join(problems))
+        request = reask_messages(messages, content, problems)
+        content, result, problems = fetch_analysis(llm, request, conversation, limiter, retry, prompt)
+    if problems:
+        return format_invalid(content, problems)
+    if cache_key is not None:
+        cache.put(cache_key, result)
+    return result
+
+
+def analyze_conversation(llm: ChatOpenAI, conversation: str,
+                         limiter: Optional[RateLimiter] = None,
+                         retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                         cache: Optional[ResultCache] = None,
+                         prompt: Optional[QAPrompt] = None) -> str:
+    """分析单条对话；批处理时传入同一个 prompt，保证整批使用相同的提示词
+
+    超过 prompt.budget.chunk_tokens 的对话按行切分，各段并行分析后合并（整体评估按合并结果重新计算）。
+    """
+    try:
+        prompt = prompt or create_qa_prompt()
+        chunks = split_for_request(conversation, prompt)
+        if len(chunks) == 1:
+            return request_analysis(llm, prompt.format_messages(conversation), conversation,
+                                    limiter, retry, cache, prompt)
+
+        def analyze_chunk(part: int) -> str:
+            try:
+                messages = prompt.format_messages(chunks[part], part + 1, len(chunks))
+                return request_analysis(llm, messages, chunks[part], limiter, retry, cache, prompt)
+            except Exception as e:
+                return format_failure(e)
+
+        # 各段在新线程中运行，复制当前上下文，用量仍记到当前行
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, analyze_chunk, part)
+                       for part in range(len(chunks))]
+            results = [future.result() for future in futures]
+        return merge_chunk_results(results, chunks, prompt, conversation)
+    except Exception as e:
+        # 不要访问 response，直接返回错误信息
+        return format_failure(e)
+
+
+def is_error_result(result: Any) -> bool:
+    """判断结果是否为失败/警告/跳过标记"""
+    return str(result).startswith(('❌', '⚠️', '⏭️'))
+
+
+def is_failed_result(result: Any) -> bool:
+    """判断结果是否为分析失败（可通过“重试失败行”重新处理）"""
+    return str(result).startswith(FAILED_PREFIX)
+
+
+def is_retryable_result(result: Any) -> bool:
+    """判断结果是否为可重试的失败"""
+    return str(result).startswith(RETRYABLE_FAILED_PREFIX)
+
+
+def get_json_sections(json_data: Dict[str, Any]) -> List[str]:
+    """获取JSON中的所有顶级键名"""
+    return list(json_data.keys())
+
+
+def extract_section_content(json_data: Dict[str, Any], section: str) -> Any:
+    """提取指定section的内容"""
+    return json_data.get(section, None)
+
+
+def process_single_row(row_data, llm, limiter: Optional[RateLimiter] = None,
+                       retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                       cache: Optional[ResultCache] = None,
+                       prompt: Optional[QAPrompt] = None):
+    """处理单行数据"""
+    idx, value = row_data
+    if pd.isna(value) or str(value).strip() == "":
+        return idx, SKIP_RESULT
+
+    with track_row(idx):
+        result = analyze_conversation(llm, str(value), limiter, retry, cache, prompt)
+    return idx, result
+
+
+def iter_batch_results(values: Iterable[Any], llm: ChatOpenAI, max_workers: int = 5,
+                       limiter: Optional[RateLimiter] = None,
+                       retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                       cache: Optional[ResultCache] = None,
+                       prompt: Optional[QAPrompt] = None) -> Iterator[Tuple[int, str]]:
+    """并行处理，按完成顺序逐条产出 (行号, 结果)
+
+    传入 limiter 时 max_workers 只是线程上限，实际在途请求数由限流器的自适应并发窗口控制。
+    提示词在开始时加载一次（或由调用方传入，如附带违禁词预检的提示），运行期间修改prompt.txt不影响本批结果。
+    输入按需读取，同时排队的行数不超过 max_workers 的两倍，可直接传入流式读取的生成器。
+    提前结束迭代（如Streamlit重跑中断脚本）时取消尚未开始的行，不会阻塞到整批跑完。
+    """
+    prompt = prompt or create_qa_prompt()
+    rows = enumerate(values)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+
+    def submit_next() -> bool:
+        row = next(rows, None)
+        if row is None:
+            return False
+        pending.add(executor.submit(process_single_row, row, llm, limiter, retry, cache, prompt))
+        return True
+
+    try:
+        for _ in range(max_workers * 2):
+            if not submit_next():
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                submit_next()
+                yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def process_batch_parallel(data: pd.DataFrame, column_name: str, llm: ChatOpenAI,
+                           on_progress: Optional[ProgressCallback] = None,
+                           max_workers: int = 5,
+                           limiter: Optional[RateLimiter] = None,
+                           retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                           cache: Optional[ResultCache] = None,
+                           prompt: Optional[QAPrompt] = None) -> pd.DataFrame:
+    """并行批量处理数据"""
+    total_rows = len(data)
+    results = [None] * total_rows
+    completed = 0
+
+    for idx, result in iter_batch_results(data[column_name], llm, max_workers, limiter, retry, cache, prompt):
+        results[idx] = result
+        completed += 1
+        if on_progress:
+            on_progress(completed, total_rows)
+
+    result_df = data.copy()
+    result_df[RESULT_COLUMN] = results
+
+    return result_df
+
+
+def process_batch(data: pd.DataFrame, column_name: str, llm: ChatOpenAI,
+                  on_progress: Optional[ProgressCallback] = None,
+                  limiter: Optional[RateLimiter] = None,
+                  retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                  cache: Optional[ResultCache] = None,
+                  prompt: Optional[QAPrompt] = None) -> pd.DataFrame:
+    """顺序批量处理数据（未配置限流器时每行间隔0.5秒）"""
+    results = []
+    total_rows = len(data)
+    prompt = prompt or create_qa_prompt()
+
+    for idx, value in enumerate(data[column_name]):
+        if pd.isna(value) or str(value).strip() == "":
+            results.append(SKIP_RESULT)
+            continue
+
+        with track_row(idx):
+            result = analyze_conversation(llm, str(value), limiter, retry, cache, prompt)
+        results.append(result)
+
+        if on_progress:
+            on_progress(idx + 1, total_rows)
+
+        if limiter is None:
+            time.sleep(0.5)
+
+    result_df = data.copy()
+    result_df[RESULT_COLUMN] = results
+
+    return result_df
+
+
+def failed_row_positions(result_df: pd.DataFrame, retryable_only: bool = False) -> List[int]:
+    """返回结果表中分析失败行的位置（iloc下标）"""
+    check = is_retryable_result if retryable_only else is_failed_result
+    return [pos for pos, result in enumerate(result_df[RESULT_COLUMN]) if check(result)]
+
+
+def retry_failed_rows(result_df: pd.DataFrame, column_name: str, llm: ChatOpenAI,
+                      on_progress: Optional[ProgressCallback] = None,
+                      max_workers: int = 5,
+                      limiter: Optional[RateLimiter] = None,
+                      retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                      retryable_only: bool = False,
+                      cache: Optional[ResultCache] = None,
+                      prompt: Optional[QAPrompt] = None) -> pd.DataFrame:
+    """只重新处理失败行，其余行的结果保持不变"""
+    positions = failed_row_positions(result_df, retryable_only)
+    updated = result_df.copy()
+    result_col = updated.columns.get_loc(RESULT_COLUMN)
+    values = result_df[column_name].iloc[positions]
+
+    for completed, (k, result) in enumerate(
+            iter_batch_results(values, llm, max_workers, limiter, retry, cache, prompt), 1):
+        updated.iat[positions[k], result_col] = result
+        if on_progress:
+            on_progress(completed, len(positions))
+
+    return updated
@@ -0,0 +1,123 @@
+"""近重复对话检测：MinHash签名 + FAISS二值索引聚类，每个簇只请求代表行，结果复用到其余行
+
+1-bit MinHash 放入 faiss.IndexBinaryFlat 做范围检索召回候选，再用完整签名估计的Jaccard相似度确认；
+召回半径见 recall_radius，完整签名达到阈值的行对漏召回概率约千分之一以下。
+聚类为贪心“领头行”方式：按行号顺序，尚未归簇的行成为代表，与其相似度达到阈值的未归簇行并入该簇，
+因此簇内每一行都与代表行直接相似（不会出现 A~B~C 的链式合并）。
+"""
+import math
+import re
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from .core import is_error_result
+
+REUSED_PREFIX = "♻️ 复用"
+DEFAULT_SIMILARITY = 0.9
+
+_WHITESPACE = re.compile(r"\s+")
+_ROLLING_BASE = np.uint64(1000003)
+# 每批参与计算的k-gram总数上限，控制 (num_perm, 批大小) 中间矩阵的内存
+_CHUNK_SHINGLES = 50000
+
+
+def _shingle_hashes(text: str, k: int) -> np.ndarray:
+    """字符 k-gram 的多项式滚动哈希（向量化，uint64 自然溢出）"""
+    codes = np.frombuffer(_WHITESPACE.sub(" ", text).strip().encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) == 0:
+        return np.zeros(1, dtype=np.uint64)
+    k = min(k, len(codes))
+    hashes = np.zeros(len(codes) - k + 1, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(k):
+            hashes = hashes * _ROLLING_BASE + codes[j:len(codes) - k + 1 + j]
+    return hashes
+
+
+def minhash_signatures(texts: List[str], num_perm: int = 128, k: int = 5, seed: int = 1) -> np.ndarray:
+    """计算字符 k-gram 的 MinHash 签名，返回 (行数, num_perm) 的 uint32 矩阵
+
+    哈希族为 multiply-shift：h(x) = (a*x + b) >> 32（a 为奇数），多行的k-gram拼接后一次计算，按行取最小值。
+    """
+    rng = np.random.RandomState(seed)
+    a = (rng.randint(0, 1 << 62, size=num_perm, dtype=np.int64).astype(np.uint64) << np.uint64(1)) | np.uint64(1)
+    b = rng.randint(0, 1 << 62, size=num_perm, dtype=np.int64).astype(np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    row = 0
+    while row < len(texts):
+        chunk, total = [], 0
+        while row + len(chunk) < len(texts) and (not chunk or total < _CHUNK_SHINGLES):
+            hashes = _shingle_hashes(texts[row + len(chunk)], k)
+            chunk.append(hashes)
+            total += len(hashes)
+        offsets = np.cumsum([0] + [len(h) for h in chunk[:-1]])
+        with np.errstate(over="ignore"):
+            values = (a[:, None] * np.concatenate(chunk)[None, :] + b[:, None]) >> np.uint64(32)
+        signatures[row:row + len(chunk)] = np.minimum.reduceat(values, offsets, axis=1).T
+        row += len(chunk)
+    return signatures
+
+
+def recall_radius(num_perm: int, threshold: float) -> int:
+    """1-bit签名范围检索的半径（faiss 只返回距离小于半径的结果）
+
+    相似度为J的一对签名，1-bit不同位数约为 Binomial(num_perm, (1-J)/2)，半径取阈值处的期望加3倍标准差；
+    完整签名达到阈值的一对最多有 num_perm-ceil(threshold*num_perm) 个位置不同，半径不必超过该值。
+    """
+    p = (1 - threshold) / 2
+    spread = num_perm * p + 3 * math.sqrt(num_perm * p * (1 - p))
+    return min(num_perm - math.ceil(threshold * num_perm), math.ceil(spread)) + 1
+
+
+def find_near_duplicates(values: Iterable[Any], threshold: float = DEFAULT_SIMILARITY,
+                         num_perm: int = 128, batch_size: int = 1024) -> Dict[int, int]:
+    """返回 {重复行号: 代表行号}；空值不参与，代表行本身不在结果中
+
+    threshold 为估计的Jaccard相似度下限（1.0 时只合并内容相同的对话）。需要 faiss-cpu。
+    """
+    import faiss
+
+    rows = [(idx, str(value)) for idx, value in enumerate(values)
+            if not pd.isna(value) and str(value).strip()]
+    if len(rows) < 2:
+        return {}
+    signatures = minhash_signatures([text for _, text in rows], num_perm)
+    index = faiss.IndexBinaryFlat(num_perm)
+    index.add(np.packbits((signatures & 1).astype(np.uint8), axis=1))
+    # 误召回由完整签名过滤
+    radius = recall_radius(num_perm, threshold)
+
+    assigned = np.zeros(len(rows), dtype=bool)
+    reuse = {}
+    for start in range(0, len(rows), batch_size):
+        batch = [i for i in range(start, min(start + batch_size, len(rows))) if not assigned[i]]
+        if not batch:
+            continue
+        query = np.packbits((signatures[batch] & 1).astype(np.uint8), axis=1)
+        lims, _, neighbors = index.range_search(query, radius)
+        for q, leader in enumerate(batch):
+            if assigned[leader]:
+                continue
+            assigned[leader] = True
+            candidates = neighbors[lims[q]:lims[q + 1]]
+            candidates = candidates[~assigned[candidates]]
+            if len(candidates) == 0:
+                continue
+            similarity = (signatures[candidates] == signatures[leader]).mean(axis=1)
+            for member in candidates[similarity >= threshold]:
+                assigned[member] = True
+                reuse[rows[member][0]] = rows[leader][0]
+    return reuse
+
+
+def mark_reused(result: str, source_idx: int) -> str:
+    """复用代表行结果时加上来源标记；失败结果原样复制，便于之后单独重试"""
+    if is_error_result(result):
+        return result
+    return f"{REUSED_PREFIX}第{source_idx + 1}行结果: {result}"
+
+
+def is_reused_result(result: Any) -> bool:
+    return str(result).startswith(REUSED_PREFIX)
@@ -0,0 +1,40 @@
+"""API调用异常分类"""
+from typing import Optional
+
+import openai
+
+
+def get_status_code(exc: BaseException) -> Optional[int]:
+    """提取异常中的HTTP状态码（没有则返回None）"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_throttle_error(exc: BaseException) -> bool:
+    """是否为限流/服务端过载类错误（429、5xx），用于触发并发回退"""
+    if isinstance(exc, openai.RateLimitError):
+        return True
+    status = get_status_code(exc)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """是否为可重试的瞬时错误：超时、连接中断、429、5xx"""
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, TimeoutError, ConnectionError)):
+        return True
+    return is_throttle_error(exc)
+
+
+def get_retry_after(exc: BaseException) -> Optional[float]:
+    """读取响应头中的 Retry-After 秒数（没有则返回None）"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,99 @@
+"""结果导出：按序流式写CSV、只写模式XLSX与可选的Parquet"""
+import csv
+from typing import BinaryIO, Iterable, Iterator, List, Union
+
+import openpyxl
+import pandas as pd
+
+from .core import RESULT_COLUMN
+from .ingest import DEFAULT_CHUNKSIZE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet导出为可选功能，未安装pyarrow时不可用
+    pa = pq = None
+
+Target = Union[str, BinaryIO]
+
+
+class OrderedCsvWriter:
+    """按原始行顺序流式写出CSV：乱序完成的结果先缓存，前序行齐全后立即落盘
+
+    原始行来自迭代器（内存中的表格或流式读取的源文件），只在写出时逐行读取。
+    """
+
+    def __init__(self, path: str, columns: List[str], rows: Iterator[tuple]):
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(list(columns) + [RESULT_COLUMN])
+        self._rows = rows
+        self._pending = {}
+        self._next_idx = 0
+
+    @classmethod
+    def from_frame(cls, path: str, data: pd.DataFrame) -> "OrderedCsvWriter":
+        return cls(path, list(data.columns), data.itertuples(index=False, name=None))
+
+    def add(self, idx: int, result: str):
+        self._pending[idx] = result
+        while self._next_idx in self._pending:
+            row = next(self._rows)
+            values = ['' if pd.isna(v) else v for v in row]
+            self._writer.writerow(values + [self._pending.pop(self._next_idx)])
+            self._next_idx += 1
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def _require_parquet():
+    if pq is None:
+        raise RuntimeError("导出Parquet需要安装 pyarrow: pip install pyarrow")
+
+
+def write_xlsx(target: Target, columns: Iterable[str], rows: Iterable[tuple],
+               sheet_name: str = RESULT_COLUMN):
+    """openpyxl只写模式逐行写出XLSX，内存占用与行数无关"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(list(columns))
+    for row in rows:
+        sheet.append([None if pd.isna(v) else v for v in row])
+    workbook.save(target)
+
+
+def frame_to_xlsx(target: Target, data: pd.DataFrame, sheet_name: str = RESULT_COLUMN):
+    write_xlsx(target, data.columns, data.itertuples(index=False, name=None), sheet_name)
+
+
+def _as_text(column: pd.Series) -> pd.Series:
+    """混合类型的object列统一转为字符串（保留空值），避免Arrow类型推断失败"""
+    return column.where(column.isna(), column.astype(str))
+
+
+def write_parquet(target: Target, data: pd.DataFrame):
+    """将结果表写出为Parquet（需要pyarrow）"""
+    _require_parquet()
+    data = data.apply(lambda column: _as_text(column) if column.dtype == object else column)
+    data.to_parquet(target, index=False)
+
+
+def csv_to_parquet(path: str, target: Target, chunksize: int = DEFAULT_CHUNKSIZE):
+    """按块将结果CSV转为Parquet，所有列按字符串存储，不整体加载"""
+    _require_parquet()
+    writer = None
+    try:
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(target, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
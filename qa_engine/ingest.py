@@ -0,0 +1,89 @@
+"""大文件流式读取：CSV按chunksize分块、XLSX用只读行迭代器，只在内存中保留当前块"""
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Tuple
+
+import openpyxl
+import pandas as pd
+
+DEFAULT_CHUNKSIZE = 5000
+
+
+def is_csv(path: str) -> bool:
+    return path.lower().endswith('.csv')
+
+
+def is_xlsx(path: str) -> bool:
+    return path.lower().endswith(('.xlsx', '.xlsm'))
+
+
+@contextmanager
+def _xlsx_rows(path: str):
+    """只读模式打开工作簿，产出 (表头, 数据行迭代器)"""
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h) if h is not None else "" for h in next(rows, ())]
+        yield header, rows
+    finally:
+        workbook.close()
+
+
+def read_header(path: str) -> List[str]:
+    """只读取表头"""
+    if is_csv(path):
+        return list(pd.read_csv(path, nrows=0).columns)
+    if is_xlsx(path):
+        with _xlsx_rows(path) as (header, _):
+            return header
+    return list(pd.read_excel(path, nrows=0).columns)
+
+
+def read_preview(path: str, nrows: int = 10) -> pd.DataFrame:
+    """读取前 nrows 行用于预览"""
+    if is_csv(path):
+        return pd.read_csv(path, nrows=nrows)
+    return pd.read_excel(path, nrows=nrows)
+
+
+def iter_column_values(path: str, column: str, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[Any]:
+    """逐个产出指定列的值，CSV只解析该列，XLSX逐行读取"""
+    if is_csv(path):
+        for chunk in pd.read_csv(path, usecols=[column], chunksize=chunksize):
+            yield from chunk[column]
+    elif is_xlsx(path):
+        with _xlsx_rows(path) as (header, rows):
+            col = header.index(column)
+            for row in rows:
+                yield row[col] if col < len(row) else None
+    else:
+        # .xls 没有流式读取器，退化为只读取该列
+        yield from pd.read_excel(path, usecols=[column])[column]
+
+
+def iter_table_rows(path: str, chunksize: int = DEFAULT_CHUNKSIZE) -> Tuple[List[str], Iterator[tuple]]:
+    """返回 (表头, 全部列的行迭代器)，用于按块写出带原始列的结果"""
+    header = read_header(path)
+
+    def rows() -> Iterator[tuple]:
+        if is_csv(path):
+            for chunk in pd.read_csv(path, chunksize=chunksize):
+                yield from chunk.itertuples(index=False, name=None)
+        elif is_xlsx(path):
+            with _xlsx_rows(path) as (_, data_rows):
+                for row in data_rows:
+                    yield tuple(row) + (None,) * (len(header) - len(row))
+        else:
+            yield from pd.read_excel(path).itertuples(index=False, name=None)
+
+    return header, rows()
+
+
+def count_rows(path: str, chunksize: int = DEFAULT_CHUNKSIZE) -> int:
+    """统计数据行数（不含表头），不整体加载文件"""
+    if is_csv(path):
+        # 只解析第一列即可得到行数
+        return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=chunksize))
+    if is_xlsx(path):
+        with _xlsx_rows(path) as (_, rows):
+            return sum(1 for _ in rows)
+    return len(pd.read_excel(path, usecols=[0]))
@@ -0,0 +1,376 @@
+"""可断点续跑的批处理任务：每完成一行即写入SQLite任务库，进程重启或页面刷新后可按任务ID继续
+
+任务输入有两种来源：小文件整表另存为pickle；大文件只记录源文件路径，运行时流式读取所需列。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+from langchain_openai import ChatOpenAI
+
+from .async_engine import ENGINE_ASYNC, ENGINE_THREAD, iter_batch_results_async
+from .batch_api import DEFAULT_BATCH_OPTIONS, ENGINE_BATCH, BatchOptions, iter_batch_api_results
+from .cache import ResultCache
+from .core import RESULT_COLUMN, ProgressCallback, iter_batch_results
+from .dedup import find_near_duplicates, mark_reused
+from .export import OrderedCsvWriter
+from .ingest import count_rows, iter_column_values, iter_table_rows
+from .metrics import build_metrics_frame
+from .packing import PackOptions, iter_packed_results
+from .prompt import QAPrompt
+from .rate_limit import RateLimiter
+from .retry import DEFAULT_RETRY_POLICY, RetryPolicy
+from .usage import RowTrace, TokenUsage, UsageMeter
+
+DEFAULT_JOB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".qa_jobs")
+
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+# job_usage 表中后加入的耗时与错误列
+_TRACE_COLUMNS = (("queue_wait", "REAL"), ("api_latency", "REAL"), ("parse_time", "REAL"),
+                  ("total_time", "REAL"), ("retries", "INTEGER"), ("error_class", "TEXT"),
+                  ("ttft", "REAL"), ("aborted", "INTEGER"))
+
+
+class JobStore:
+    """任务库：jobs 表记录任务元数据，job_results 表逐行追加结果，job_usage 表记录每行的用量与耗时，输入表格另存为pickle
+
+    job_batches 表记录批处理模式已提交的批次及其包含的行号，续跑时继续轮询未取回的批次。
+    """
+
+    def __init__(self, job_dir: str = DEFAULT_JOB_DIR):
+        os.makedirs(job_dir, exist_ok=True)
+        self.job_dir = job_dir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(job_dir, "jobs.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, source_name TEXT, column_name TEXT NOT NULL, "
+            "total_rows INTEGER NOT NULL, status TEXT NOT NULL, config TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, source_path TEXT)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if "source_path" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN source_path TEXT")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_results ("
+            "job_id TEXT NOT NULL, row_idx INTEGER NOT NULL, result TEXT, completed_at REAL NOT NULL, "
+            "PRIMARY KEY (job_id, row_idx))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_usage ("
+            "job_id TEXT NOT NULL, row_idx INTEGER NOT NULL, requests INTEGER NOT NULL, "
+            "prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+            "cache_hit_tokens INTEGER NOT NULL, cache_miss_tokens INTEGER NOT NULL, "
+            "PRIMARY KEY (job_id, row_idx))"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(job_usage)")]
+        for name, sql_type in _TRACE_COLUMNS:
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE job_usage ADD COLUMN {name} {sql_type}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_batches ("
+            "job_id TEXT NOT NULL, batch_id TEXT NOT NULL, row_ids TEXT NOT NULL, status TEXT, "
+            "created_at REAL NOT NULL, PRIMARY KEY (job_id, batch_id))"
+        )
+        self._conn.commit()
+
+    def _input_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.input.pkl")
+
+    def create_job(self, data: Optional[pd.DataFrame], column_name: str, source_name: str = "",
+                   config: Optional[Dict[str, Any]] = None, source_path: Optional[str] = None) -> str:
+        """登记新任务，返回任务ID
+
+        传入 data 时保存整张输入表；data 为 None 时为流式任务，只记录 source_path，运行时按需读取。
+        """
+        job_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        if data is not None:
+            data.to_pickle(self._input_path(job_id))
+            total_rows = len(data)
+            source_path = None
+        else:
+            source_path = os.path.abspath(source_path)
+            total_rows = count_rows(source_path)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, source_name, column_name, total_rows, status, config, "
+                "created_at, updated_at, source_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, source_name, column_name, total_rows, STATUS_RUNNING,
+                 json.dumps(config or {}, ensure_ascii=False), now, now, source_path)
+            )
+            self._conn.commit()
+        return job_id
+
+    def record_result(self, job_id: str, row_idx: int, result: str, trace: Optional[RowTrace] = None):
+        """追加（或覆盖）一行结果及其用量与耗时，立即提交"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_results VALUES (?, ?, ?, ?)", (job_id, row_idx, result, now)
+            )
+            if trace is not None:
+                usage = trace.usage
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO job_usage (job_id, row_idx, requests, prompt_tokens, "
+                    "completion_tokens, cache_hit_tokens, cache_miss_tokens, queue_wait, api_latency, "
+                    "parse_time, total_time, retries, error_class, ttft, aborted) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, row_idx, usage.requests, usage.prompt_tokens, usage.completion_tokens,
+                     usage.cache_hit_tokens, usage.cache_miss_tokens, trace.queue_wait, trace.api_latency,
+                     trace.parse_time, trace.total_time, trace.retries, trace.error_class, trace.ttft, trace.aborted)
+                )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+            self._conn.commit()
+
+    def record_results(self, job_id: str, items: Iterable[Tuple[int, str]]):
+        """批量写入已知结果（如重试模式下沿用的成功行）"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_results VALUES (?, ?, ?, ?)",
+                [(job_id, row_idx, result, now) for row_idx, result in items]
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+            self._conn.commit()
+
+    def add_batch(self, job_id: str, batch_id: str, row_ids: List[int]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_batches VALUES (?, ?, ?, NULL, ?)",
+                (job_id, batch_id, json.dumps(row_ids), time.time())
+            )
+            self._conn.commit()
+
+    def close_batch(self, job_id: str, batch_id: str, status: str):
+        """批次结果已全部写入任务库"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_batches SET status = ? WHERE job_id = ? AND batch_id = ?", (status, job_id, batch_id)
+            )
+            self._conn.commit()
+
+    def open_batches(self, job_id: str) -> Dict[str, List[int]]:
+        """已提交但结果尚未取回的批次：{批次ID: 行号列表}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT batch_id, row_ids FROM job_batches WHERE job_id = ? AND status IS NULL ORDER BY created_at",
+                (job_id,)
+            ).fetchall()
+        return {batch_id: json.loads(row_ids) for batch_id, row_ids in rows}
+
+    def set_status(self, job_id: str, status: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        jobs = self._query_jobs("WHERE j.job_id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self._query_jobs("ORDER BY j.created_at DESC LIMIT ?", (limit,))
+
+    def _query_jobs(self, clause: str, params: tuple) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT j.job_id, j.source_name, j.column_name, j.total_rows, j.status, j.config, "
+                "j.created_at, j.updated_at, j.source_path, "
+                "(SELECT COUNT(*) FROM job_results r WHERE r.job_id = j.job_id) "
+                f"FROM jobs j {clause}", params
+            ).fetchall()
+        keys = ("job_id", "source_name", "column_name", "total_rows", "status", "config",
+                "created_at", "updated_at", "source_path", "completed_rows")
+        jobs = [dict(zip(keys, row)) for row in rows]
+        for job in jobs:
+            job["config"] = json.loads(job["config"] or "{}")
+        return jobs
+
+    def completed_results(self, job_id: str) -> Dict[int, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row_idx, result FROM job_results WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def completed_row_ids(self, job_id: str) -> Set[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT row_idx FROM job_results WHERE job_id = ?", (job_id,))
+            return {row[0] for row in rows}
+
+    def usage_summary(self, job_id: str) -> TokenUsage:
+        """任务所有行（含之前运行）的token用量合计"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(prompt_tokens), 0), "
+                "COALESCE(SUM(completion_tokens), 0), COALESCE(SUM(cache_hit_tokens), 0), "
+                "COALESCE(SUM(cache_miss_tokens), 0) FROM job_usage WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return TokenUsage(*row)
+
+    def metrics_frame(self, job_id: str) -> pd.DataFrame:
+        """每行的用量、耗时（秒）与错误，列名见 metrics.METRIC_COLUMNS；只含实际发出请求的行"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT u.row_idx + 1, r.completed_at, u.requests, u.retries, u.aborted, u.queue_wait, "
+                "u.api_latency, u.ttft, u.parse_time, u.total_time, u.prompt_tokens, u.cache_hit_tokens, u.cache_miss_tokens, "
+                "u.completion_tokens, u.error_class, r.result FROM job_usage u "
+                "JOIN job_results r ON r.job_id = u.job_id AND r.row_idx = u.row_idx "
+                "WHERE u.job_id = ? ORDER BY u.row_idx", (job_id,)
+            ).fetchall()
+        return build_metrics_frame(rows)
+
+    def load_input(self, job_id: str) -> pd.DataFrame:
+        return pd.read_pickle(self._input_path(job_id))
+
+    def iter_input_values(self, job: Dict[str, Any]) -> Iterator[Any]:
+        """按行产出任务待质检列的值；流式任务从源文件逐块读取"""
+        if job["source_path"]:
+            return iter_column_values(job["source_path"], job["column_name"])
+        return iter(self.load_input(job["job_id"])[job["column_name"]])
+
+    def results_frame(self, job_id: str) -> pd.DataFrame:
+        """输入表格 + 已完成的质检结果（未完成的行为空），运行中也可随时调用
+
+        流式任务不保存输入表格，只返回质检结果列（行号与源文件数据行一一对应）。
+        """
+        job = self.get_job(job_id)
+        if job["source_path"]:
+            result_df = pd.DataFrame(index=pd.RangeIndex(job["total_rows"]))
+        else:
+            result_df = self.load_input(job_id).copy()
+        results = [None] * len(result_df)
+        for idx, result in self.completed_results(job_id).items():
+            results[idx] = result
+        result_df[RESULT_COLUMN] = results
+        return result_df
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def run_job(store: JobStore, job_id: str, llm: ChatOpenAI,
+            on_progress: Optional[ProgressCallback] = None,
+            max_workers: int = 5,
+            limiter: Optional[RateLimiter] = None,
+            retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+            cache: Optional[ResultCache] = None,
+            on_result: Optional[Callable[[int, str], None]] = None,
+            engine: str = ENGINE_THREAD,
+            prompt: Optional[QAPrompt] = None,
+            dedup_threshold: Optional[float] = None,
+            usage: Optional[UsageMeter] = None,
+            batch_options: BatchOptions = DEFAULT_BATCH_OPTIONS,
+            packing: Optional[PackOptions] = None) -> pd.DataFrame:
+    """运行（或继续运行）任务：跳过已完成的行，每完成一行立即持久化
+
+    engine 为 "async" 时使用异步引擎，max_workers 表示在途请求上限（可设为数百）；
+    为 "batch" 时通过服务商的批处理接口提交，阻塞轮询到所有批次结束（不使用限流器与重试策略）。
+    dedup_threshold 不为空时先做近重复检测，每簇只请求代表行，其余行复用代表行的结果（带复用标记）。
+    usage 为挂在 llm 上的 UsageMeter 时，每行的用量、耗时与错误类别随结果一起保存。
+    packing 不为空时把相邻的短对话打包为一个请求（仅线程引擎），打包请求的用量按行平均分摊。
+    """
+    job = store.get_job(job_id)
+    if job is None:
+        raise KeyError(f"任务不存在: {job_id}")
+    if packing is not None and engine != ENGINE_THREAD:
+        raise ValueError("短对话打包仅支持线程引擎")
+    done = store.completed_row_ids(job_id)
+    total_rows = job["total_rows"]
+    completed = len(done)
+    if on_progress:
+        on_progress(completed, total_rows)
+
+    def record(idx: int, result: str, trace: Optional[RowTrace] = None):
+        nonlocal completed
+        store.record_result(job_id, idx, result, trace)
+        if on_result:
+            on_result(idx, result)
+        completed += 1
+        if on_progress:
+            on_progress(completed, total_rows)
+
+    # 近重复检测结果可由输入重新计算，续跑时无需保存
+    reuse = find_near_duplicates(store.iter_input_values(job), dedup_threshold) if dedup_threshold else {}
+    members_of: Dict[int, List[int]] = {}
+    for member, source in reuse.items():
+        if member not in done:
+            members_of.setdefault(source, []).append(member)
+    if members_of:
+        # 上次中断时代表行已完成、重复行尚未写入
+        finished = store.completed_results(job_id)
+        for source in [s for s in members_of if s in done]:
+            for member in members_of.pop(source):
+                record(member, mark_reused(finished[source], source))
+
+    # 引擎按消费顺序给出局部下标k，pending[k] 即源文件中的行号
+    pending = []
+
+    def pending_values():
+        for idx, value in enumerate(store.iter_input_values(job)):
+            if idx not in done and idx not in reuse:
+                pending.append(idx)
+                yield value
+
+    store.set_status(job_id, STATUS_RUNNING)
+    if engine == ENGINE_BATCH:
+        rows = ((idx, value) for idx, value in enumerate(store.iter_input_values(job))
+                if idx not in done and idx not in reuse)
+        results = iter_batch_api_results(
+            rows, llm, cache, prompt, store.open_batches(job_id),
+            on_submit=lambda batch_id, row_ids: store.add_batch(job_id, batch_id, row_ids),
+            on_collected=lambda batch_id, status: store.close_batch(job_id, batch_id, status),
+            options=batch_options, metadata={"qa_job_id": job_id}
+        )
+        for idx, result, trace in results:
+            record(idx, result, trace)
+            if usage is not None and trace is not None:
+                usage.add(trace.usage)
+            for member in members_of.get(idx, ()):
+                record(member, mark_reused(result, idx))
+        store.set_status(job_id, STATUS_COMPLETED)
+        return store.results_frame(job_id)
+
+    if usage is not None:
+        usage.clear_rows()
+    if packing is not None:
+        results = iter_packed_results(pending_values(), llm, max_workers, limiter, retry, cache, prompt, packing)
+    else:
+        iterate = iter_batch_results_async if engine == ENGINE_ASYNC else iter_batch_results
+        results = iterate(pending_values(), llm, max_workers, limiter, retry, cache, prompt)
+    for k, result in results:
+        record(pending[k], result, usage.pop_row(k) if usage is not None else None)
+        for member in members_of.get(pending[k], ()):
+            record(member, mark_reused(result, pending[k]))
+
+    store.set_status(job_id, STATUS_COMPLETED)
+    return store.results_frame(job_id)
+
+
+def export_job_csv(store: JobStore, job_id: str, path: str) -> str:
+    """将任务结果与原始各列合并写出为CSV；流式任务逐块重读源文件，不整体加载"""
+    job = store.get_job(job_id)
+    if job["source_path"]:
+        writer = OrderedCsvWriter(path, *iter_table_rows(job["source_path"]))
+    else:
+        writer = OrderedCsvWriter.from_frame(path, store.load_input(job_id))
+    try:
+        results = store.completed_results(job_id)
+        for idx in range(job["total_rows"]):
+            writer.add(idx, results.get(idx))
+    finally:
+        writer.close()
+    return path
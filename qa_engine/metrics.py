@@ -0,0 +1,119 @@
+"""运行指标：由逐行记录汇总延迟分位数、吞吐与错误率，并导出为 JSON / CSV / Prometheus 文本格式"""
+import json
+from typing import Any, Dict, Iterable, Optional
+
+import pandas as pd
+
+from .core import is_failed_result
+from .monitor import percentile
+
+METRIC_COLUMNS = [
+    "原始行号", "完成时间", "请求次数", "重试次数", "提前中止", "排队等待", "调用耗时", "首token耗时", "解析耗时", "总耗时",
+    "输入token", "缓存命中token", "缓存未命中token", "输出token", "错误类别", "失败",
+]
+# 延迟分位数统计的阶段：(summary中的键, 列名)
+LATENCY_STAGES = (("total", "总耗时"), ("api", "调用耗时"), ("ttft", "首token耗时"), ("queue_wait", "排队等待"),
+                  ("parse", "解析耗时"))
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def build_metrics_frame(rows: Iterable[tuple]) -> pd.DataFrame:
+    """由任务库的查询结果构建逐行指标表（最后一列为质检结果，转换为是否失败）"""
+    frame = pd.DataFrame(list(rows), columns=METRIC_COLUMNS[:-1] + ["结果"])
+    frame["失败"] = frame["结果"].map(is_failed_result).astype(bool)
+    frame["错误类别"] = frame["错误类别"].fillna("")
+    frame["提前中止"] = frame["提前中止"].fillna(0).astype(int)
+    frame["首token耗时"] = frame["首token耗时"].astype(float)
+    return frame.drop(columns=["结果"])
+
+
+def _quantiles(values: pd.Series) -> Dict[str, Optional[float]]:
+    ordered = values.dropna().tolist()
+    stats = {f"p{int(q * 100)}": percentile(ordered, q) for q in QUANTILES}
+    stats["max"] = max(ordered) if ordered else None
+    stats["sum"] = float(sum(ordered))
+    stats["count"] = len(ordered)
+    return stats
+
+
+def summarize_metrics(frame: pd.DataFrame) -> Dict[str, Any]:
+    """汇总逐行指标：各阶段耗时分位数(秒，首token耗时只统计流式调用的行)、吞吐(行/分钟)、错误率与错误类别、token用量"""
+    rows = len(frame)
+    failed = int(frame["失败"].sum()) if rows else 0
+    span = (frame["完成时间"].max() - (frame["完成时间"] - frame["总耗时"]).min()) if rows else 0.0
+    prompt_tokens = int(frame["输入token"].sum())
+    cache_hit = int(frame["缓存命中token"].sum())
+    return {
+        "rows": rows,
+        "failed_rows": failed,
+        "error_rate": failed / rows if rows else 0.0,
+        "requests": int(frame["请求次数"].sum()),
+        "retries": int(frame["重试次数"].fillna(0).sum()),
+        "aborted_streams": int(frame["提前中止"].sum()),
+        "throughput_rows_per_min": rows / span * 60 if span and span > 0 else 0.0,
+        "latency": {key: _quantiles(frame[column]) for key, column in LATENCY_STAGES},
+        "tokens": {
+            "prompt": prompt_tokens,
+            "cache_hit": cache_hit,
+            "cache_miss": int(frame["缓存未命中token"].sum()),
+            "completion": int(frame["输出token"].sum()),
+            "cache_hit_rate": cache_hit / prompt_tokens if prompt_tokens else 0.0,
+        },
+        "error_classes": frame.loc[frame["失败"], "错误类别"].replace("", "unknown").value_counts().to_dict(),
+    }
+
+
+def metrics_to_json(frame: pd.DataFrame, summary: Optional[Dict[str, Any]] = None) -> str:
+    summary = summary or summarize_metrics(frame)
+    return json.dumps({"summary": summary, "rows": frame.to_dict("records")}, ensure_ascii=False, indent=2)
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def metrics_to_prometheus(summary: Dict[str, Any], labels: Optional[Dict[str, Any]] = None) -> str:
+    """Prometheus文本格式（可写入 node_exporter 的 textfile 目录或推送到 Pushgateway）"""
+    labels = labels or {}
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, extra, value in samples:
+            if value is not None:
+                lines.append(f"{name}{suffix}{_labels({**labels, **extra})} {value}")
+
+    metric("qa_rows_total", "counter", "发出过请求的行数", [("", {}, summary["rows"])])
+    metric("qa_rows_failed_total", "counter", "最终失败的行数", [("", {}, summary["failed_rows"])])
+    metric("qa_api_requests_total", "counter", "成功返回的API请求数", [("", {}, summary["requests"])])
+    metric("qa_retries_total", "counter", "重试次数", [("", {}, summary["retries"])])
+    metric("qa_stream_aborts_total", "counter", "因输出偏离提前中止的流式调用次数", [("", {}, summary["aborted_streams"])])
+    metric("qa_error_rate", "gauge", "失败行占比", [("", {}, summary["error_rate"])])
+    metric("qa_throughput_rows_per_minute", "gauge", "吞吐（行/分钟）", [("", {}, summary["throughput_rows_per_min"])])
+    latency_samples = []
+    for stage, stats in summary["latency"].items():
+        latency_samples += [("", {"stage": stage, "quantile": str(q)}, stats[f"p{int(q * 100)}"]) for q in QUANTILES]
+        latency_samples += [("_sum", {"stage": stage}, stats["sum"]), ("_count", {"stage": stage}, stats["count"])]
+    metric("qa_row_latency_seconds", "summary", "每行各阶段耗时（秒）", latency_samples)
+    metric("qa_tokens_total", "counter", "token用量",
+           [("", {"kind": kind}, value) for kind, value in summary["tokens"].items() if kind != "cache_hit_rate"])
+    metric("qa_row_errors_total", "counter", "按错误类别统计的失败行数",
+           [("", {"error_class": name}, count) for name, count in summary["error_classes"].items()])
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str, frame: pd.DataFrame, labels: Optional[Dict[str, Any]] = None) -> str:
+    """按扩展名写出：.json（汇总+逐行）、.csv（逐行）、其他（Prometheus文本格式）"""
+    lower = path.lower()
+    if lower.endswith(".csv"):
+        frame.to_csv(path, index=False, encoding="utf-8-sig")
+        return path
+    summary = summarize_metrics(frame)
+    content = metrics_to_json(frame, summary) if lower.endswith(".json") else metrics_to_prometheus(summary, labels)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
@@ -0,0 +1,484 @@
+"""本地模拟的OpenAI兼容聊天接口：用于压测与回归测试，不消耗真实API配额
+
+返回按提示词输出格式（prompt.txt 中的JSON示例）生成的固定结果，打包请求按段数返回；
+延迟为对数正态分布（中位数 latency、离散度 jitter）加按输出token计算的生成时间，可按比例返回429、5xx、不合格输出
+与失控输出（某个数组字段不断重复），也可设置服务端并发上限（超出时返回429）。
+流式请求（"stream": true）以SSE逐块返回：首个数据块在 latency 后发出，其余按 tokens_per_second 匀速发出，客户端断开即停止。
+随机数由 seed、请求内容与该请求的第几次发送决定，与请求到达顺序无关。
+另有内存中的批处理接口（/v1/files 上传与下载、/v1/batches 创建与查询）：批次在后台线程中逐条按上述规则生成结果，
+成功的写入输出文件、失败的写入错误文件。
+
+示例（在应用中把API基础URL设为 http://127.0.0.1:8000/v1 即可）:
+    python -m qa_engine.mock_server --port 8000 --latency 0.8 --throttle-rate 0.05
+"""
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .budget import count_tokens
+from .prompt import PACK_ITEM_FIELD, PACK_RESULTS_FIELD, PACK_TEMPLATE, PROMPT_FILE, load_prompt
+
+logger = logging.getLogger(__name__)
+
+# 打包请求的段数写在人类消息开头（PACK_TEMPLATE 中 {count} 之前的文字）
+_PACK_COUNT = re.compile(re.escape(PACK_TEMPLATE.split("{count}")[0]) + r"(\d+)")
+_INVALID_OUTPUT = {"分析": "模拟的不合格输出：缺少提示词要求的字段"}
+# 失控输出中重复的数组元素个数，流式数据块按字符数切分
+_RUNAWAY_ITEMS = 400
+_STREAM_CHUNK_CHARS = 2
+
+
+@dataclass(frozen=True)
+class MockOptions:
+    """模拟服务参数：延迟单位为秒，各比例为0~1；tokens_per_second 为空时不计生成时间"""
+    latency: float = 0.5
+    jitter: float = 0.3
+    tokens_per_second: Optional[float] = None
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    invalid_rate: float = 0.0
+    runaway_rate: float = 0.0
+    retry_after: float = 1.0
+    max_concurrency: Optional[int] = None
+    seed: int = 0
+    prompt_path: str = PROMPT_FILE
+
+
+def canned_results(schema: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """由输出格式示例生成的几种结果：示例本身与各数组为空的版本（提示词没有示例时为简单对象）"""
+    if schema is None:
+        return [{"总体评价": "模拟结果"}]
+    empty = {key: [] if isinstance(value, list) else value for key, value in schema.items()}
+    return [schema, empty]
+
+
+class MockStats:
+    """线程安全的服务端计数"""
+
+    def __init__(self):
+        self.requests = 0
+        self.completed = 0
+        self.errors = 0
+        self.throttled = 0
+        self.invalid = 0
+        self.runaway = 0
+        self.aborted = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: getattr(self, name) for name in (
+                "requests", "completed", "errors", "throttled", "invalid", "runaway", "aborted", "in_flight",
+                "peak_in_flight")}
+
+
+class MockServer:
+    """在后台线程中运行的模拟服务；port 为0时自动选择空闲端口，url 为可直接用作 base_url 的地址"""
+
+    def __init__(self, options: MockOptions = MockOptions(), host: str = "127.0.0.1", port: int = 0):
+        self.options = options
+        self.stats = MockStats()
+        self.results = canned_results(load_prompt(options.prompt_path).schema)
+        self._attempts: Dict[str, int] = {}
+        self._files: Dict[str, bytes] = {}
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._httpd.request_queue_size = 1024
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="qa-mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """在当前线程中运行（命令行使用），Ctrl+C 结束"""
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset(self):
+        """开始新一轮测量：峰值并发从当前在途数重新统计，各请求的发送次数清零（相同请求序列得到相同结果）"""
+        with self.stats._lock:
+            self.stats.peak_in_flight = self.stats.in_flight
+        with self._lock:
+            self._attempts.clear()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _rng(self, body: bytes) -> random.Random:
+        """同一请求内容第n次发送时的随机数（重试与原请求结果不同，但与到达顺序无关）"""
+        digest = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            attempt = self._attempts.get(digest, 0)
+            self._attempts[digest] = attempt + 1
+        return random.Random(f"{self.options.seed}:{digest}:{attempt}")
+
+    def _runaway(self) -> Dict[str, Any]:
+        """第一个数组字段重复同一元素的结果（结构合法但远超正常长度）"""
+        result = dict(self.results[0])
+        for key, value in result.items():
+            if isinstance(value, list):
+                result[key] = (value[:1] or [{"描述": "模拟的失控输出"}]) * _RUNAWAY_ITEMS
+                break
+        return result
+
+    def _content(self, request: Dict[str, Any], rng: random.Random) -> str:
+        roll = rng.random()
+        if roll < self.options.invalid_rate:
+            with self.stats._lock:
+                self.stats.invalid += 1
+            return json.dumps(_INVALID_OUTPUT, ensure_ascii=False)
+        if roll < self.options.invalid_rate + self.options.runaway_rate:
+            with self.stats._lock:
+                self.stats.runaway += 1
+            return json.dumps(self._runaway(), ensure_ascii=False)
+        messages = request.get("messages") or [{}]
+        match = _PACK_COUNT.search(str(messages[-1].get("content", "")))
+        if match:
+            count = int(match.group(1))
+            items = [{PACK_ITEM_FIELD: number, **rng.choice(self.results)} for number in range(1, count + 1)]
+            return json.dumps({PACK_RESULTS_FIELD: items}, ensure_ascii=False)
+        return json.dumps(rng.choice(self.results), ensure_ascii=False)
+
+    def _delay(self, rng: random.Random, output_tokens: int) -> float:
+        options = self.options
+        delay = options.latency * math.exp(rng.gauss(0.0, options.jitter)) if options.jitter else options.latency
+        if options.tokens_per_second:
+            delay += output_tokens / options.tokens_per_second
+        return delay
+
+    @contextmanager
+    def track_request(self) -> Iterator[bool]:
+        """在 with 块内计为在途请求（流式响应发送完毕才结束），返回是否超出服务端并发上限"""
+        stats = self.stats
+        with stats._lock:
+            stats.requests += 1
+            over_limit = self.options.max_concurrency is not None and stats.in_flight >= self.options.max_concurrency
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            yield over_limit
+        finally:
+            with stats._lock:
+                stats.in_flight -= 1
+
+    def completion(self, body: bytes, over_limit: bool = False) -> Dict[str, Any]:
+        """生成一次聊天补全的响应（status、headers、body），在调用线程中等待模拟延迟
+
+        流式请求成功时不等待，返回 events：(发送前等待秒数, 数据块) 列表，由调用方按时间逐块发送。
+        """
+        request = json.loads(body)
+        rng = self._rng(body)
+        stats = self.stats
+        roll = rng.random()
+        if over_limit or roll < self.options.throttle_rate:
+            time.sleep(min(self.options.latency, 0.05))
+            with stats._lock:
+                stats.throttled += 1
+            return {"status": 429, "headers": {"Retry-After": f"{self.options.retry_after:g}"},
+                    "body": {"error": {"message": "模拟限流", "type": "rate_limit_exceeded"}}}
+        if roll < self.options.throttle_rate + self.options.error_rate:
+            time.sleep(self._delay(rng, 0))
+            with stats._lock:
+                stats.errors += 1
+            return {"status": 500, "headers": {},
+                    "body": {"error": {"message": "模拟服务端错误", "type": "server_error"}}}
+        content = self._content(request, rng)
+        completion_tokens = count_tokens(content)
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens")
+        if max_tokens and completion_tokens > max_tokens:
+            # 与真实服务一样在 max_tokens 处截断（按字符比例近似）
+            content = content[:len(content) * max_tokens // completion_tokens]
+            completion_tokens, finish_reason = max_tokens, "length"
+        prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in request.get("messages", []))
+        system_tokens = sum(count_tokens(str(m.get("content", "")))
+                            for m in request.get("messages", []) if m.get("role") == "system")
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens,
+                 "prompt_cache_hit_tokens": system_tokens,
+                 "prompt_cache_miss_tokens": prompt_tokens - system_tokens}
+        header = {"id": f"mock-{rng.getrandbits(48):012x}", "created": int(time.time()),
+                  "model": request.get("model", "mock")}
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            return {"status": 200, "headers": {},
+                    "events": self._events(header, content, finish_reason, usage if include_usage else None, rng)}
+        time.sleep(self._delay(rng, completion_tokens))
+        with stats._lock:
+            stats.completed += 1
+        return {"status": 200, "headers": {}, "body": {
+            **header,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": finish_reason}],
+            "usage": usage,
+        }}
+
+    def create_file(self, filename: str, content: bytes, purpose: str) -> Dict[str, Any]:
+        """保存上传的文件（仅在内存中），返回文件对象"""
+        with self._lock:
+            file_id = f"file-mock-{len(self._files) + 1}"
+            self._files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def file_content(self, file_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self._files.get(file_id)
+
+    def create_batch(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """创建批次并在后台线程中处理，输入文件不存在时返回None"""
+        content = self.file_content(request.get("input_file_id", ""))
+        if content is None:
+            return None
+        with self._lock:
+            batch_id = f"batch-mock-{len(self._batches) + 1}"
+            now = int(time.time())
+            self._batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": request.get("endpoint"), "errors": None,
+                "input_file_id": request["input_file_id"], "completion_window": request.get("completion_window"),
+                "status": "in_progress", "output_file_id": None, "error_file_id": None,
+                "created_at": now, "in_progress_at": now, "completed_at": None, "failed_at": None,
+                "expired_at": None, "cancelled_at": None, "metadata": request.get("metadata"),
+                "request_counts": {"total": sum(1 for line in content.splitlines() if line.strip()),
+                                   "completed": 0, "failed": 0},
+            }
+            batch = json.loads(json.dumps(self._batches[batch_id]))
+        threading.Thread(target=self._run_batch, args=(batch_id, content), name="qa-mock-batch", daemon=True).start()
+        return batch
+
+    def batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            return json.loads(json.dumps(batch)) if batch is not None else None
+
+    def _run_batch(self, batch_id: str, content: bytes):
+        """逐条生成批次中各请求的结果（不受服务端并发上限限制），全部完成后写出输出与错误文件"""
+        outputs: Dict[bool, List[str]] = {True: [], False: []}
+        for number, line in enumerate(content.splitlines()):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            with self.track_request():
+                response = self.completion(json.dumps(request["body"], ensure_ascii=False).encode("utf-8"))
+            succeeded = response["status"] == 200
+            outputs[succeeded].append(json.dumps({
+                "id": f"{batch_id}-req-{number}", "custom_id": request["custom_id"], "error": None,
+                "response": {"status_code": response["status"], "request_id": f"{batch_id}-{number}",
+                             "body": response["body"]},
+            }, ensure_ascii=False))
+            with self._lock:
+                self._batches[batch_id]["request_counts"]["completed" if succeeded else "failed"] += 1
+        files = {name: self.create_file(f"{batch_id}_{name}.jsonl", "\n".join(lines).encode("utf-8") + b"\n",
+                                        "batch_output")["id"]
+                 for name, lines in (("output", outputs[True]), ("error", outputs[False])) if lines}
+        with self._lock:
+            self._batches[batch_id].update(
+                status="completed", completed_at=int(time.time()),
+                output_file_id=files.get("output"), error_file_id=files.get("error"))
+
+    def _events(self, header: Dict[str, Any], content: str, finish_reason: str, usage: Optional[Dict[str, Any]],
+                rng: random.Random) -> List[Tuple[float, Dict[str, Any]]]:
+        """流式响应的数据块：角色、按字符切分的内容、结束原因，请求了usage时最后附带usage"""
+        pieces = [content[i:i + _STREAM_CHUNK_CHARS] for i in range(0, len(content), _STREAM_CHUNK_CHARS)]
+        tokens_per_second = self.options.tokens_per_second
+        interval = (count_tokens(content) / tokens_per_second / max(1, len(pieces))) if tokens_per_second else 0.0
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            return {**header, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        events = [(self._delay(rng, 0), chunk({"role": "assistant", "content": ""}))]
+        events += [(interval, chunk({"content": piece})) for piece in pieces]
+        events.append((0.0, chunk({}, finish_reason)))
+        if usage is not None:
+            events.append((0.0, {**header, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+        return events
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头与响应体分两次写出，不关闭Nagle算法时每个响应会多出约40ms的延迟确认等待
+            disable_nagle_algorithm = True
+
+            def log_message(self, format: str, *args: Any):
+                logger.debug(format, *args)
+
+            def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_bytes(self, data: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_events(self, events: List[Tuple[float, Dict[str, Any]]]):
+                """按时间逐块发送SSE（分块传输编码，保持连接复用），客户端提前断开时停止"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for delay, event in events:
+                        if delay:
+                            time.sleep(delay)
+                        self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                    with server.stats._lock:
+                        server.stats.aborted += 1
+                    return
+                with server.stats._lock:
+                    server.stats.completed += 1
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                parts = path.rstrip("/").split("/")
+                if parts[-1] == "stats":
+                    self._send(200, server.stats.snapshot())
+                    if "reset" in query:
+                        server.reset()
+                    return
+                if len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content":
+                    content = server.file_content(parts[-2])
+                    if content is not None:
+                        self._send_bytes(content, "application/jsonl")
+                        return
+                elif len(parts) >= 2 and parts[-2] == "batches":
+                    batch = server.batch(parts[-1])
+                    if batch is not None:
+                        self._send(200, batch)
+                        return
+                self._send(404, {"error": {"message": "not found"}})
+
+            def _upload(self, body: bytes) -> Optional[Dict[str, Any]]:
+                """解析 multipart/form-data 上传（file 与 purpose 两个字段）"""
+                message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                    f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode("latin-1") + body)
+                fields = {part.get_param("name", header="content-disposition"): part
+                          for part in message.iter_parts()}
+                if "file" not in fields:
+                    return None
+                purpose = (fields["purpose"].get_payload(decode=True) or b"").decode() if "purpose" in fields else ""
+                return server.create_file(fields["file"].get_filename() or "upload.jsonl",
+                                          fields["file"].get_payload(decode=True) or b"", purpose)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                path = self.path.rstrip("/")
+                if path.endswith("/files") or path.endswith("/batches"):
+                    created = self._upload(body) if path.endswith("/files") else server.create_batch(json.loads(body))
+                    if created is None:
+                        self._send(400, {"error": {"message": "invalid request"}})
+                    else:
+                        self._send(200, created)
+                    return
+                if not path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": "not found"}})
+                    return
+                with server.track_request() as over_limit:
+                    response = server.completion(body, over_limit)
+                    if "events" in response:
+                        self._send_events(response["events"])
+                    else:
+                        self._send(response["status"], response["body"], response["headers"])
+
+        return Handler
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """模拟服务参数（基准测试的命令行共用）"""
+    defaults = MockOptions()
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="延迟中位数（秒）")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="对数正态分布的sigma，0表示固定延迟")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="输出生成速度，不设置则不计生成时间")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="返回500的比例")
+    parser.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate, help="返回429的比例")
+    parser.add_argument("--invalid-rate", type=float, default=defaults.invalid_rate, help="返回不合格输出的比例")
+    parser.add_argument("--runaway-rate", type=float, default=defaults.runaway_rate,
+                        help="返回失控输出（某个数组字段重复数百次）的比例")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after, help="429响应的Retry-After秒数")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="服务端并发上限，超出时返回429")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--prompt", default=PROMPT_FILE, help="按该提示词的输出格式生成结果")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="qa_engine.mock_server", description="本地模拟的OpenAI兼容聊天接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_mock_arguments(parser)
+    return parser
+
+
+def options_from_args(args: argparse.Namespace) -> MockOptions:
+    return MockOptions(
+        latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate, invalid_rate=args.invalid_rate,
+        runaway_rate=args.runaway_rate,
+        retry_after=args.retry_after, max_concurrency=args.max_concurrency, seed=args.seed, prompt_path=args.prompt,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    server = MockServer(options_from_args(args), args.host, args.port)
+    logger.info("模拟服务已启动: %s（%s）", server.url, json.dumps(asdict(server.options), ensure_ascii=False))
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+"""运行监控：滚动吞吐、调用延迟与错误计数（供界面实时展示，不依赖Streamlit）"""
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .core import SKIP_RESULT, is_failed_result, is_retryable_result
+from .dedup import is_reused_result
+from .rate_limit import RateLimiter
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近邻法分位数，values 为空时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RunMonitor:
+    """记录一次运行中逐行完成的结果
+
+    record 可直接作为 run_job 的 on_result 回调；snapshot 返回当前统计。
+    吞吐按最近 window 秒内完成的行数计算，延迟取自限流器记录的最近成功调用耗时（缓存命中不计入）。
+    """
+
+    def __init__(self, total_rows: int, completed: int = 0, limiter: Optional[RateLimiter] = None,
+                 window: float = 30.0, recent_size: int = 20):
+        self.total_rows = total_rows
+        self.completed = completed
+        self.limiter = limiter
+        self.window = window
+        self.started = time.monotonic()
+        self.finished_at: Deque[float] = deque()
+        self.recent: Deque[Tuple[int, str]] = deque(maxlen=recent_size)
+        self.failed = 0
+        self.retryable = 0
+        self.skipped = 0
+        self.reused = 0
+
+    def record(self, idx: int, result: str):
+        now = time.monotonic()
+        self.completed += 1
+        self.finished_at.append(now)
+        while self.finished_at and now - self.finished_at[0] > self.window:
+            self.finished_at.popleft()
+        self.recent.appendleft((idx, result))
+        if result == SKIP_RESULT:
+            self.skipped += 1
+        elif is_reused_result(result):
+            self.reused += 1
+        elif is_failed_result(result):
+            self.failed += 1
+            if is_retryable_result(result):
+                self.retryable += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前统计：完成数、滚动吞吐(行/分钟)、延迟p50/p95/p99(秒)、失败/复用/限流计数"""
+        now = time.monotonic()
+        span = min(self.window, now - self.started)
+        recent_rows = sum(1 for t in self.finished_at if now - t <= self.window)
+        latencies = list(self.limiter.latencies) if self.limiter else []
+        return {
+            "completed": self.completed,
+            "total": self.total_rows,
+            "elapsed": now - self.started,
+            "rows_per_min": recent_rows / span * 60 if span > 0 else 0.0,
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95),
+            "latency_p99": percentile(latencies, 0.99),
+            "failed": self.failed,
+            "retryable": self.retryable,
+            "skipped": self.skipped,
+            "reused": self.reused,
+            "throttled": self.limiter.throttled_count if self.limiter else 0,
+        }
@@ -0,0 +1,160 @@
+"""短对话打包：多段短对话合并为一个请求，分摊系统提示的输入token与请求往返
+
+打包请求要求模型按编号返回各段结果，逐段按提示词中的输出格式校验；某段缺失或不合格时该段改为单独请求，
+整包调用失败时包内各行全部改为单独请求。长对话、空值行与提示词没有输出示例（无法校验）时不打包。
+"""
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from langchain_openai import ChatOpenAI
+
+from .budget import count_tokens
+from .cache import ResultCache
+from .core import (
+    check_result,
+    create_qa_prompt,
+    invoke_with_budget,
+    process_single_row,
+    request_tokens,
+    result_cache_key,
+)
+from .parsing import extract_json_from_text, validate_result
+from .prompt import PACK_ITEM_FIELD, PACK_RESULTS_FIELD, QAPrompt
+from .rate_limit import RateLimiter
+from .retry import DEFAULT_RETRY_POLICY, RetryPolicy, call_with_retry
+from .usage import track_row
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PackOptions:
+    """打包参数：不超过 row_tokens 的对话参与打包，每包最多 max_rows 段、对话合计不超过 pack_tokens"""
+    max_rows: int = 8
+    pack_tokens: int = 3000
+    row_tokens: int = 800
+
+
+DEFAULT_PACKING = PackOptions()
+
+
+def group_rows(rows: Iterable[Tuple[int, Any]], prompt: QAPrompt,
+               options: PackOptions = DEFAULT_PACKING) -> Iterator[List[Tuple[int, Any]]]:
+    """按输入顺序把相邻的短对话分组，其余行单独成组"""
+    pack, size = [], 0
+    for k, value in rows:
+        text = "" if pd.isna(value) else str(value)
+        tokens = count_tokens(text) if text.strip() and prompt.schema is not None else None
+        if tokens is None or tokens > options.row_tokens:
+            yield [(k, value)]
+            continue
+        if pack and (len(pack) >= options.max_rows or size + tokens > options.pack_tokens):
+            yield pack
+            pack, size = [], 0
+        pack.append((k, text))
+        size += tokens
+    if pack:
+        yield pack
+
+
+def parse_pack_result(content: str) -> Dict[int, Any]:
+    """解析打包请求的输出，返回 {编号: 该段结果}；编号无法识别的元素忽略"""
+    items = extract_json_from_text(content).get(PACK_RESULTS_FIELD)
+    if not isinstance(items, list):
+        return {}
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            number = int(str(item.get(PACK_ITEM_FIELD)).strip())
+        except ValueError:
+            continue
+        results.setdefault(number, {key: value for key, value in item.items() if key != PACK_ITEM_FIELD})
+    return results
+
+
+def process_pack(rows: List[Tuple[int, Any]], llm: ChatOpenAI,
+                 limiter: Optional[RateLimiter] = None,
+                 retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                 cache: Optional[ResultCache] = None,
+                 prompt: Optional[QAPrompt] = None) -> List[Tuple[int, str]]:
+    """处理一组行，返回 [(行号, 结果)]；各段结果按单行请求的缓存键写入缓存，与单行模式共用"""
+    prompt = prompt or create_qa_prompt()
+    if len(rows) == 1:
+        return [process_single_row(rows[0], llm, limiter, retry, cache, prompt)]
+    results, remaining, keys = [], [], {}
+    for k, text in rows:
+        if cache is not None:
+            messages = prompt.format_messages(text)
+            keys[k] = result_cache_key(llm, messages, request_tokens(llm, messages, prompt)[1])
+        else:
+            keys[k] = None
+        cached = cache.get(keys[k]) if keys[k] is not None else None
+        if cached is not None:
+            result, problems = check_result(cached, prompt, text)
+            if not problems:
+                results.append((k, result))
+                continue
+        remaining.append((k, text))
+    if len(remaining) < 2:
+        return results + [process_single_row(row, llm, limiter, retry, cache, prompt) for row in remaining]
+
+    fallback = []
+    with track_row(remaining[0][0], tuple(k for k, _ in remaining)):
+        try:
+            messages = prompt.format_pack_messages([text for _, text in remaining])
+            content = call_with_retry(lambda: invoke_with_budget(llm, messages, limiter, prompt), retry).content
+            items = parse_pack_result(content)
+        except Exception as e:
+            logger.info("打包请求失败（%s），%d 行改为单独请求", e, len(remaining))
+            items = {}
+        for number, (k, text) in enumerate(remaining, 1):
+            item = items.get(number)
+            if item is None or validate_result(item, prompt.schema):
+                fallback.append((k, text))
+                continue
+            result = json.dumps(prompt.postprocess(item, text), ensure_ascii=False)
+            if keys[k] is not None:
+                cache.put(keys[k], result)
+            results.append((k, result))
+    if fallback and items:
+        logger.info("打包结果中 %d/%d 段缺失或不符合结构要求，改为单独请求", len(fallback), len(remaining))
+    return results + [process_single_row(row, llm, limiter, retry, cache, prompt) for row in fallback]
+
+
+def iter_packed_results(values: Iterable[Any], llm: ChatOpenAI, max_workers: int = 5,
+                        limiter: Optional[RateLimiter] = None,
+                        retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+                        cache: Optional[ResultCache] = None,
+                        prompt: Optional[QAPrompt] = None,
+                        options: PackOptions = DEFAULT_PACKING) -> Iterator[Tuple[int, str]]:
+    """打包模式的并行处理，与 iter_batch_results 相同按完成顺序逐条产出 (行号, 结果)，按需读取输入"""
+    prompt = prompt or create_qa_prompt()
+    groups = group_rows(enumerate(values), prompt, options)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+
+    def submit_next() -> bool:
+        group = next(groups, None)
+        if group is None:
+            return False
+        pending.add(executor.submit(process_pack, group, llm, limiter, retry, cache, prompt))
+        return True
+
+    try:
+        for _ in range(max_workers * 2):
+            if not submit_next():
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                submit_next()
+                yield from future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,112 @@
+"""模型输出解析：单遍扫描定位最外层JSON对象，并按提示词中的输出示例校验结构"""
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+# 扫描时只需关注的字符，其余字符由正则整段跳过（无回溯）
+_TOKEN = re.compile(r'[{}"\\]')
+_DECODER = json.JSONDecoder()
+
+
+def _closing_brace(text: str, start: int) -> int:
+    """与 start 处的 { 配平的 } 的位置，到结尾仍未配平时返回-1"""
+    depth = 1
+    in_string = False
+    skip_to = -1
+    for match in _TOKEN.finditer(text, start + 1):
+        i = match.start()
+        if i < skip_to:
+            continue
+        ch = text[i]
+        if ch == '\\':
+            if in_string:
+                skip_to = i + 2
+        elif ch == '"':
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif ch == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def iter_json_objects(text: str) -> Iterator[str]:
+    """按出现顺序产出最外层花括号配平的片段；字符串内的花括号与转义字符不计入配平
+
+    某个 { 到结尾都未配平（如被截断的对象）时，从它之后的下一个 { 重新查找。
+    """
+    pos = 0
+    while True:
+        start = text.find('{', pos)
+        if start < 0:
+            return
+        end = _closing_brace(text, start)
+        if end < 0:
+            pos = start + 1
+            continue
+        yield text[start:end + 1]
+        pos = end + 1
+
+
+def extract_json_from_text(text: str) -> Dict[str, Any]:
+    """从文本中提取第一个可解析的JSON对象（忽略其前后的文字），失败返回{}
+
+    从每个 { 起用C实现的解码器解析，遇到第一个语法错误即失败并转到下一个 {，不必先配平整个片段；
+    截断的对象、嵌套过深（RecursionError）的片段直接跳过，不会抛出异常。
+    """
+    text = str(text)
+    start = text.find('{')
+    while start >= 0:
+        try:
+            data, _ = _DECODER.raw_decode(text, start)
+        except (ValueError, RecursionError):
+            data = None
+        if isinstance(data, dict):
+            return data
+        start = text.find('{', start + 1)
+    return {}
+
+
+def schema_from_prompt(system_text: str) -> Optional[Dict[str, Any]]:
+    """取提示词中最后一个JSON示例（即最终输出格式）作为校验依据，没有示例时返回None"""
+    schema = None
+    for candidate in iter_json_objects(system_text):
+        try:
+            example = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(example, dict):
+            schema = example
+    return schema
+
+
+def validate_result(data: Any, schema: Dict[str, Any]) -> List[str]:
+    """按示例校验结构：顶级键齐全、数组/对象类型一致、对象示例的字段齐全；返回问题列表，空列表表示通过
+
+    只校验容器类型，不校验叶子值（示例中的"X%"等占位文字与实际数值类型可以不同）。
+    """
+    if not isinstance(data, dict) or not data:
+        return ["未找到JSON对象"]
+    problems = []
+    for key, example in schema.items():
+        if key not in data:
+            problems.append(f"缺少字段 {key}")
+            continue
+        value = data[key]
+        if isinstance(example, list):
+            if not isinstance(value, list):
+                problems.append(f"{key} 应为数组")
+            elif example and isinstance(example[0], dict) and not all(isinstance(item, dict) for item in value):
+                problems.append(f"{key} 的元素应为对象")
+        elif isinstance(example, dict):
+            if not isinstance(value, dict):
+                problems.append(f"{key} 应为对象")
+            else:
+                missing = [field for field in example if field not in value]
+                if missing:
+                    problems.append(f"{key} 缺少字段 {'、'.join(missing)}")
+    return problems
@@ -0,0 +1,163 @@
+"""质检提示词：prompt.txt 只在内容变化时重新读取，系统消息预先构建为静态消息"""
+import copy
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.schema import BaseMessage, HumanMessage, SystemMessage
+
+from .budget import DEFAULT_BUDGET, TokenBudget
+from .parsing import schema_from_prompt
+from .screen import BANNED_SECTION, SCREEN_HINT, SCREEN_REPLACE, PhraseScreen
+from .streaming import StreamOptions
+
+logger = logging.getLogger(__name__)
+
+PROMPT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompt.txt")
+
+DEFAULT_SYSTEM_TEMPLATE = """你是一个专业的销售对话质检专家。请分析以下销售对话，并从多个维度进行质量评估。
+
+请严格按照以下JSON格式返回结果：
+{
+    "对话质量问题": [],
+    "销售违禁词问题": [],
+    "优秀销售话术": [],
+    "整体评估": {
+        "对话总轮次": "总轮次数",
+        "问题轮次占比": "X%",
+        "优秀话术轮次占比": "X%",
+        "总体质量等级": "优秀/良好/一般/待改进"
+    }
+}
+
+请确保JSON格式正确，所有字段都要包含。"""
+
+HUMAN_TEMPLATE = """请分析以下销售对话：
+
+{conversation}
+
+请提供详细的质检分析结果。"""
+
+CHUNK_NOTE = """
+
+说明：这是一段长对话的第{part}/{parts}部分，请只分析本部分内容，轮次从本部分第一轮开始按1计数，“对话总轮次”填写本部分的轮次数。"""
+
+PACK_ITEM_FIELD = "编号"
+PACK_RESULTS_FIELD = "结果"
+
+PACK_TEMPLATE = """请分别分析以下{count}段相互独立的销售对话，每段单独评估，轮次从该段第一轮开始按1计数：
+
+{conversations}
+
+请输出一个JSON对象 {{"结果": [...]}}：数组共{count}个元素，按编号顺序对应每段对话，每个元素包含"编号"（对话编号，从1开始）以及上述最终输出格式中的全部字段。"""
+
+
+class QAPrompt:
+    """编译后的质检提示：静态系统消息 + 人类消息模板，每行只需格式化人类消息
+
+    schema 为提示词中最终输出格式的JSON示例，用于校验模型输出；提示词中没有示例时为None（不校验）。
+    screen 为违禁词本地预检，screen_mode 为 hint（命中附在请求中）或 replace（由本地结果替代该维度）。
+    budget 决定每行的 max_tokens 与超长对话的切分长度；streaming 不为空时逐行请求改为流式输出（打包请求除外）。
+    系统消息逐字节固定且位于最前，对话、预检命中与分段说明都放在其后的人类消息中，以命中服务端的前缀缓存。
+    """
+
+    def __init__(self, system_text: str, human_template: str = HUMAN_TEMPLATE):
+        self.system_message = SystemMessage(content=system_text)
+        self.human_template = human_template
+        self.fingerprint = hashlib.sha256(system_text.encode("utf-8")).hexdigest()[:12]
+        self.schema = schema_from_prompt(system_text)
+        self.screen: Optional[PhraseScreen] = None
+        self.screen_mode = SCREEN_HINT
+        self.budget: TokenBudget = DEFAULT_BUDGET
+        self.streaming: Optional[StreamOptions] = None
+
+    def with_screen(self, screen: Optional[PhraseScreen], mode: str = SCREEN_HINT) -> "QAPrompt":
+        """返回附带违禁词预检的副本（共用同一个系统消息）"""
+        prompt = copy.copy(self)
+        prompt.screen = screen
+        prompt.screen_mode = mode
+        return prompt
+
+    def with_budget(self, budget: TokenBudget) -> "QAPrompt":
+        """返回使用指定token预算的副本"""
+        prompt = copy.copy(self)
+        prompt.budget = budget
+        return prompt
+
+    def with_streaming(self, options: Optional[StreamOptions]) -> "QAPrompt":
+        """返回使用流式输出（边接收边检查结构、偏离时提前中止）的副本，None 表示不使用"""
+        prompt = copy.copy(self)
+        prompt.streaming = options
+        return prompt
+
+    def format_messages(self, conversation: str, part: int = 0, parts: int = 1) -> List[BaseMessage]:
+        """part 为长对话切分后的段序号（从1开始），不切分时为0"""
+        human = self.human_template.format(conversation=conversation)
+        if part:
+            human += CHUNK_NOTE.format(part=part, parts=parts)
+        if self.screen is not None:
+            human += self.screen.instructions(conversation, self.screen_mode)
+        return [self.system_message, HumanMessage(content=human)]
+
+    def format_pack_messages(self, conversations: List[str]) -> List[BaseMessage]:
+        """多段短对话打包为一个请求，要求按编号返回各段结果（系统消息不变，仍命中前缀缓存）"""
+        replace = self.screen is not None and self.screen_mode == SCREEN_REPLACE
+        blocks = []
+        for number, conversation in enumerate(conversations, 1):
+            block = f"【对话{number}】\n{conversation}"
+            if self.screen is not None and not replace:
+                block += self.screen.instructions(conversation, self.screen_mode)
+            blocks.append(block)
+        human = PACK_TEMPLATE.format(count=len(conversations), conversations="\n\n".join(blocks))
+        if replace:
+            human += self.screen.instructions("", SCREEN_REPLACE)
+        return [self.system_message, HumanMessage(content=human)]
+
+    def postprocess(self, data: Dict[str, Any], conversation: str) -> Dict[str, Any]:
+        """replace 模式下用本地预检结果覆盖“销售违禁词问题”维度"""
+        if self.screen is not None and self.screen_mode == SCREEN_REPLACE:
+            data[BANNED_SECTION] = self.screen.items(conversation)
+        return data
+
+
+def render_system_text(template: str) -> str:
+    """prompt.txt 按模板语法用 {{ }} 转义花括号，静态系统消息中还原为单个花括号"""
+    return template.replace("{{", "{").replace("}}", "}")
+
+
+DEFAULT_PROMPT = QAPrompt(DEFAULT_SYSTEM_TEMPLATE)
+
+# 路径 -> (mtime_ns, size, 编译后的提示)
+_loaded: Dict[str, Tuple[int, int, QAPrompt]] = {}
+_lock = threading.Lock()
+
+
+def load_prompt(path: str = PROMPT_FILE) -> QAPrompt:
+    """读取并编译提示词；文件mtime/大小未变时直接复用，内容哈希未变时保留原对象"""
+    with _lock:
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            logger.error("读取prompt.txt文件失败: %s", e)
+            # 如果读取失败，使用默认提示词
+            return DEFAULT_PROMPT
+
+        cached = _loaded.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                prompt = QAPrompt(render_system_text(f.read()))
+        except Exception as e:
+            logger.error("读取prompt.txt文件失败: %s", e)
+            return DEFAULT_PROMPT
+
+        if cached and cached[2].fingerprint == prompt.fingerprint:
+            prompt = cached[2]
+        elif cached:
+            logger.info("检测到prompt.txt内容变化，已重新加载 (%s -> %s)", cached[2].fingerprint, prompt.fingerprint)
+        _loaded[path] = (stat.st_mtime_ns, stat.st_size, prompt)
+        return prompt
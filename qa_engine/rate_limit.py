@@ -0,0 +1,199 @@
+"""共享限流器：RPM/TPM令牌桶 + AIMD自适应并发
+
+所有工作线程在发起API调用前通过同一个 RateLimiter 申请配额：
+- 令牌桶分别限制每分钟请求数(RPM)与每分钟token数(TPM)
+- 并发窗口在调用成功时线性增长，遇到429/5xx时按比例收缩
+
+异步引擎使用对应的 *_async 方法；同一个限流器实例只应在线程或协程其中一种模式下使用。
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+from .errors import is_throttle_error
+
+
+class TokenBucket:
+    """线程安全的令牌桶，按 rate_per_minute 匀速补充，容量为一分钟配额"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self._rate = rate_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """尝试取得 amount 个令牌（超过容量时按容量计）；成功返回0，否则返回需等待的秒数"""
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self._rate
+
+    def acquire(self, amount: float = 1.0):
+        """阻塞直到取得 amount 个令牌"""
+        while True:
+            wait = self.reserve(amount)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, amount: float = 1.0):
+        while True:
+            wait = self.reserve(amount)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def drain(self):
+        """清空令牌（收到限流响应时调用，让所有线程一起等待补充）"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+
+class AdaptiveConcurrency:
+    """AIMD并发窗口：成功时每轮+1，限流时乘以 decrease 因子"""
+
+    def __init__(self, initial: int = 2, minimum: int = 1, maximum: int = 10,
+                 decrease: float = 0.5, cooldown: float = 2.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self._limit = float(min(max(initial, self.minimum), self.maximum))
+        self._decrease = decrease
+        self._cooldown = cooldown
+        self._last_decrease = 0.0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._async_cond: Optional[asyncio.Condition] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, throttled: bool = False, succeeded: bool = True):
+        with self._cond:
+            self._in_flight -= 1
+            self._adjust(throttled, succeeded)
+            self._cond.notify_all()
+
+    def _adjust(self, throttled: bool, succeeded: bool):
+        if throttled:
+            now = time.monotonic()
+            # 同一波限流只收缩一次，避免并发请求同时失败时窗口被连续减半
+            if now - self._last_decrease >= self._cooldown:
+                self._limit = max(self.minimum, self._limit * self._decrease)
+                self._last_decrease = now
+        elif succeeded:
+            self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+
+    def _get_async_cond(self) -> asyncio.Condition:
+        # 在事件循环内首次使用时创建，每次运行引擎都会使用新的事件循环
+        loop = asyncio.get_running_loop()
+        if self._async_cond is None or self._async_loop is not loop:
+            self._async_cond = asyncio.Condition()
+            self._async_loop = loop
+        return self._async_cond
+
+    async def acquire_async(self):
+        cond = self._get_async_cond()
+        async with cond:
+            while self._in_flight >= int(self._limit):
+                await cond.wait()
+            self._in_flight += 1
+
+    async def release_async(self, throttled: bool = False, succeeded: bool = True):
+        cond = self._get_async_cond()
+        async with cond:
+            self._in_flight -= 1
+            self._adjust(throttled, succeeded)
+            cond.notify_all()
+
+
+class RateLimiter:
+    """组合RPM、TPM与自适应并发的共享限流器"""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_concurrency: int = 10, adaptive: bool = True, initial_concurrency: int = 2):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(
+            initial=initial_concurrency if adaptive else max_concurrency,
+            maximum=max_concurrency,
+            minimum=1 if adaptive else max_concurrency,
+        )
+        self.throttled_count = 0
+        # 最近成功调用的耗时（秒，不含排队等待配额的时间），供运行监控统计延迟
+        self.latencies = deque(maxlen=256)
+
+    @contextmanager
+    def slot(self, estimated_tokens: int = 1):
+        """申请一次调用配额；with块内抛出的429/5xx会触发并发回退"""
+        self.concurrency.acquire()
+        throttled = False
+        succeeded = False
+        try:
+            if self.requests:
+                self.requests.acquire(1)
+            if self.tokens:
+                self.tokens.acquire(estimated_tokens)
+            started = time.monotonic()
+            yield
+            succeeded = True
+            self.latencies.append(time.monotonic() - started)
+        except BaseException as e:
+            throttled = is_throttle_error(e)
+            if throttled:
+                self.throttled_count += 1
+                if self.requests:
+                    self.requests.drain()
+            raise
+        finally:
+            self.concurrency.release(throttled, succeeded)
+
+    @asynccontextmanager
+    async def slot_async(self, estimated_tokens: int = 1):
+        """slot 的协程版本，供异步引擎使用"""
+        await self.concurrency.acquire_async()
+        throttled = False
+        succeeded = False
+        try:
+            if self.requests:
+                await self.requests.acquire_async(1)
+            if self.tokens:
+                await self.tokens.acquire_async(estimated_tokens)
+            started = time.monotonic()
+            yield
+            succeeded = True
+            self.latencies.append(time.monotonic() - started)
+        except BaseException as e:
+            throttled = is_throttle_error(e)
+            if throttled:
+                self.throttled_count += 1
+                if self.requests:
+                    self.requests.drain()
+            raise
+        finally:
+            await self.concurrency.release_async(throttled, succeeded)
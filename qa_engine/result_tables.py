@@ -0,0 +1,277 @@
+"""结构化结果表：把质检结果列的JSON整理为带类型的列式表格，持久化为Parquet并做向量化汇总
+
+metrics 每段对话一行：状态、整体评估中的对话总轮次（整数）、问题/优秀话术轮次占比（百分数，"12%" 记为 12.0）、
+总体质量等级（有序分类）以及各数组维度的条数；items 每个问题/话术一行：维度、序号、轮次与各字段
+（质量评分等 "8.5/10" 取数值，嵌套对象存为JSON文本，取值较少的文本列存为分类）。
+两张表都以原始行号（从1开始）关联，可与输入表格的其他列（如门店、销售）拼接后分组统计。
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+from .budget import EXCELLENT_SECTION, QUALITY_SECTION, SUMMARY_SECTION, TURN_FIELD
+from .core import SKIP_RESULT, is_error_result
+from .dedup import is_reused_result
+from .export import pa, pq
+from .jobs import JobStore
+from .parsing import extract_json_from_text
+from .screen import BANNED_SECTION
+from .sections import ROW_NUMBER_COLUMN
+
+STATUS_COLUMN = "状态"
+SECTION_COLUMN = "维度"
+ITEM_INDEX_COLUMN = "序号"
+GRADE_COLUMN = "总体质量等级"
+TURNS_COLUMN = "对话总轮次"
+RATIO_COLUMNS = ("问题轮次占比", "优秀话术轮次占比")
+# 与 budget.quality_grade 的判定结果一致，从好到差
+GRADE_LEVELS = ("优秀", "良好", "一般", "待改进")
+# 缺少等级或等级不在 GRADE_LEVELS 中
+UNGRADED = "未评级"
+ISSUE_SECTIONS = (QUALITY_SECTION, BANNED_SECTION)
+PHRASE_SECTIONS = (EXCELLENT_SECTION,)
+
+STATUS_SUCCEEDED = "成功"
+STATUS_REUSED = "复用"
+STATUS_FAILED = "失败"
+STATUS_SKIPPED = "跳过"
+STATUS_LEVELS = (STATUS_SUCCEEDED, STATUS_REUSED, STATUS_FAILED, STATUS_SKIPPED)
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+# 取开头数值的字段（如 "8.5/10"）
+_SCORE_FIELDS = ("质量评分",)
+# 文本列中不同取值占比低于该值时存为分类
+_CATEGORY_RATIO = 0.5
+_NUMBER = r"(-?\d+(?:\.\d+)?)"
+# Parquet文件元数据中记录的来源版本（任务的更新时间）
+_VERSION_KEY = b"qa_source_version"
+
+
+@dataclass
+class ResultTables:
+    """metrics 与 items 两张表（列见模块说明）"""
+    metrics: pd.DataFrame
+    items: pd.DataFrame
+
+
+def count_column(section: str) -> str:
+    """metrics 中数组维度条数的列名"""
+    return f"{section}数"
+
+
+def count_columns(metrics: pd.DataFrame) -> List[str]:
+    return [column for column in metrics.columns if column.endswith("数")]
+
+
+def analyzed_rows(metrics: pd.DataFrame) -> pd.DataFrame:
+    """成功（含复用）的行，汇总统计只计这些行"""
+    return metrics[metrics[STATUS_COLUMN].isin((STATUS_SUCCEEDED, STATUS_REUSED))]
+
+
+def _status(result: str) -> str:
+    if result == SKIP_RESULT:
+        return STATUS_SKIPPED
+    if is_error_result(result):
+        return STATUS_FAILED
+    return STATUS_REUSED if is_reused_result(result) else STATUS_SUCCEEDED
+
+
+def _parse(result: str) -> Dict[str, Any]:
+    if not result or result == SKIP_RESULT or is_error_result(result):
+        return {}
+    data = extract_json_from_text(result)
+    return data if isinstance(data, dict) else {}
+
+
+def _leading_number(values: pd.Series) -> pd.Series:
+    """取文本中的第一个数值（"12%"、"12.5 %"、"8.5/10"），没有数值时为缺失"""
+    return pd.to_numeric(values.astype("string").str.extract(_NUMBER, expand=False), errors="coerce")
+
+
+def _flatten(item: Any) -> Dict[str, Any]:
+    """问题/话术条目的字段：嵌套对象与数组转为JSON文本"""
+    if not isinstance(item, dict):
+        return {"内容": item}
+    return {key: json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+            for key, value in item.items()}
+
+
+def _compact_text(column: pd.Series) -> pd.Series:
+    """文本列：不同取值较少时存为分类"""
+    column = column.astype("string")
+    non_null = int(column.notna().sum())
+    if non_null and column.nunique(dropna=True) <= non_null * _CATEGORY_RATIO:
+        # 分类取值存为普通对象，读回Parquet后类型一致
+        return column.astype(object).where(column.notna(), None).astype("category")
+    return column
+
+
+def build_result_tables(results: pd.Series, list_sections: Optional[Sequence[str]] = None) -> ResultTables:
+    """由结果列（索引为原始行索引，缺失值为未完成的行，不计入）构建结构化结果表
+
+    list_sections 为要展开为 items 的数组维度（默认取结果中出现的所有数组字段）。
+    """
+    results = results.dropna().astype(str)
+    rows = (results.index + 1).to_numpy()
+    parsed = [_parse(result) for result in results]
+    summaries = [data.get(SUMMARY_SECTION) if isinstance(data.get(SUMMARY_SECTION), dict) else {}
+                 for data in parsed]
+
+    metrics = pd.DataFrame({ROW_NUMBER_COLUMN: rows.astype("int32")})
+    metrics[STATUS_COLUMN] = pd.Categorical(results.map(_status).to_numpy(), categories=STATUS_LEVELS)
+    summary = pd.DataFrame(summaries, index=metrics.index)
+    if TURNS_COLUMN in summary:
+        metrics[TURNS_COLUMN] = _leading_number(summary[TURNS_COLUMN]).round().astype("Int32")
+    else:
+        metrics[TURNS_COLUMN] = pd.array([pd.NA] * len(metrics), dtype="Int32")
+    for column in RATIO_COLUMNS:
+        metrics[column] = (_leading_number(summary[column]) if column in summary
+                           else pd.Series(float("nan"), index=metrics.index)).astype("float32")
+    grades = summary[GRADE_COLUMN].astype("string").str.strip() if GRADE_COLUMN in summary else None
+    metrics[GRADE_COLUMN] = pd.Categorical(grades if grades is not None else [None] * len(metrics),
+                                           categories=GRADE_LEVELS, ordered=True)
+
+    if list_sections is None:
+        seen = {}
+        for data in parsed:
+            for key, value in data.items():
+                if isinstance(value, list):
+                    seen.setdefault(key, None)
+        list_sections = list(seen)
+    records: List[Dict[str, Any]] = []
+    for section in list_sections:
+        counts = []
+        for row, data in zip(rows, parsed):
+            values = data.get(section)
+            values = values if isinstance(values, list) else []
+            counts.append(len(values) if data else None)
+            for position, item in enumerate(values, 1):
+                records.append({ROW_NUMBER_COLUMN: row, SECTION_COLUMN: section, ITEM_INDEX_COLUMN: position,
+                                **_flatten(item)})
+        metrics[count_column(section)] = pd.array(counts, dtype="Int32")
+    return ResultTables(metrics, _type_items(pd.DataFrame.from_records(records), list_sections))
+
+
+def _type_items(items: pd.DataFrame, sections: Sequence[str]) -> pd.DataFrame:
+    if items.empty:
+        items = pd.DataFrame(columns=[ROW_NUMBER_COLUMN, SECTION_COLUMN, ITEM_INDEX_COLUMN, TURN_FIELD])
+    items[ROW_NUMBER_COLUMN] = items[ROW_NUMBER_COLUMN].astype("int32")
+    items[SECTION_COLUMN] = pd.Categorical(items[SECTION_COLUMN], categories=list(sections))
+    items[ITEM_INDEX_COLUMN] = items[ITEM_INDEX_COLUMN].astype("int32")
+    if TURN_FIELD not in items:
+        items[TURN_FIELD] = None
+    items[TURN_FIELD] = _leading_number(items[TURN_FIELD]).round().astype("Int32")
+    fixed = (ROW_NUMBER_COLUMN, SECTION_COLUMN, ITEM_INDEX_COLUMN, TURN_FIELD)
+    for column in items.columns:
+        if column in fixed:
+            continue
+        if column in _SCORE_FIELDS:
+            items[column] = _leading_number(items[column]).astype("float32")
+        else:
+            items[column] = _compact_text(items[column])
+    return items.reset_index(drop=True)
+
+
+def grade_distribution(metrics: pd.DataFrame, by: Optional[pd.Series] = None,
+                       normalize: bool = False) -> pd.DataFrame:
+    """总体质量等级分布：不分组时为一行（全部），by 为与 metrics 等长的分组列时每组一行；normalize 时为组内占比(%)
+
+    有未评级的行时另加一列 UNGRADED。
+    """
+    if metrics.empty:
+        return pd.DataFrame(columns=list(GRADE_LEVELS), dtype="int64")
+    grades = metrics[GRADE_COLUMN].cat.add_categories([UNGRADED]).fillna(UNGRADED)
+    keys = pd.Series("全部", index=metrics.index) if by is None else pd.Series(by.to_numpy(), index=metrics.index)
+    table = pd.crosstab(keys.fillna("(空)").astype(str), grades, dropna=False)
+    levels = [*GRADE_LEVELS, UNGRADED] if (grades == UNGRADED).any() else list(GRADE_LEVELS)
+    table = table.reindex(columns=levels, fill_value=0)
+    if normalize:
+        table = table.div(table.sum(axis=1).where(lambda total: total > 0), axis=0).mul(100).round(1)
+    table.index.name = by.name if by is not None and by.name else None
+    table.columns.name = None
+    return table
+
+
+def issue_frequency(items: pd.DataFrame, field: str = "类型", sections: Sequence[str] = ISSUE_SECTIONS,
+                    conversations: Optional[int] = None) -> pd.DataFrame:
+    """各维度中某字段（默认“类型”）的出现次数与涉及的对话数，按次数降序；传入 conversations 时另算涉及对话占比(%)"""
+    subset = items[items[SECTION_COLUMN].isin(sections)]
+    if field not in subset or subset.empty:
+        return pd.DataFrame(columns=[SECTION_COLUMN, field, "次数", "涉及对话数"])
+    grouped = subset.groupby([SECTION_COLUMN, field], observed=True)
+    table = pd.DataFrame({
+        "次数": grouped.size(),
+        "涉及对话数": grouped[ROW_NUMBER_COLUMN].nunique(),
+    }).reset_index().sort_values(["次数", "涉及对话数"], ascending=False, ignore_index=True)
+    if conversations:
+        table["涉及对话占比"] = (table["涉及对话数"] / conversations * 100).round(1)
+    return table
+
+
+def metric_percentiles(metrics: pd.DataFrame, quantiles: Iterable[float] = DEFAULT_QUANTILES,
+                       by: Optional[pd.Series] = None) -> pd.DataFrame:
+    """数值指标（轮次、占比、各维度条数）的均值与分位数；by 为分组列时按组计算"""
+    columns = [TURNS_COLUMN, *RATIO_COLUMNS, *count_columns(metrics)]
+    values = metrics[columns].astype("float64")
+    labels = {q: f"p{round(q * 100):g}" for q in quantiles}
+    if by is None:
+        table = values.quantile(list(quantiles)).rename(index=labels).T
+        table.insert(0, "均值", values.mean())
+        table.insert(0, "有效行数", values.count())
+        return table.round(2)
+    grouped = values.groupby(pd.Series(by.to_numpy(), index=metrics.index, name=by.name), observed=True)
+    table = grouped.quantile(list(quantiles)).unstack()
+    table.columns = [f"{column}_{labels[q]}" for column, q in table.columns]
+    return table.round(2)
+
+
+def save_result_tables(tables: ResultTables, directory: str, prefix: str = "",
+                       version: Optional[str] = None) -> List[str]:
+    """写出为 {prefix}metrics.parquet 与 {prefix}items.parquet（需要pyarrow），version 记录在文件元数据中"""
+    if pq is None:
+        raise RuntimeError("保存Parquet需要安装 pyarrow: pip install pyarrow")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, frame in (("metrics", tables.metrics), ("items", tables.items)):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if version is not None:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), _VERSION_KEY: version.encode()})
+        path = os.path.join(directory, f"{prefix}{name}.parquet")
+        pq.write_table(table, path)
+        paths.append(path)
+    return paths
+
+
+def load_result_tables(directory: str, prefix: str = "", version: Optional[str] = None) -> Optional[ResultTables]:
+    """读取保存的结果表；文件不存在、无法读取或 version 不一致时返回None"""
+    if pq is None:
+        return None
+    paths = [os.path.join(directory, f"{prefix}{name}.parquet") for name in ("metrics", "items")]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    try:
+        if version is not None:
+            metadata = pq.read_schema(paths[0]).metadata or {}
+            if metadata.get(_VERSION_KEY) != version.encode():
+                return None
+        return ResultTables(*(pq.read_table(path).to_pandas() for path in paths))
+    except Exception:
+        return None
+
+
+def load_job_tables(store: JobStore, job_id: str) -> ResultTables:
+    """任务的结构化结果表：任务结果没有变化时直接读取任务目录中的Parquet，否则重新构建并保存（未安装pyarrow时不保存）"""
+    job = store.get_job(job_id)
+    version = f"{job['updated_at']!r}:{job['completed_rows']}"
+    directory = os.path.join(store.job_dir, f"{job_id}.tables")
+    tables = load_result_tables(directory, version=version)
+    if tables is not None:
+        return tables
+    completed = store.completed_results(job_id)
+    tables = build_result_tables(pd.Series(completed, dtype=object).sort_index())
+    if pq is not None:
+        save_result_tables(tables, directory, version=version)
+    return tables
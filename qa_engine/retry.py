@@ -0,0 +1,62 @@
+"""带抖动的指数退避重试"""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+from .errors import get_retry_after, is_retryable_error
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """重试策略：第n次重试前等待 uniform(0, min(max_delay, base_delay * 2**n)) 秒
+
+    max_reasks 为输出不符合JSON结构要求时，附上问题说明重新请求的次数。
+    """
+    max_retries: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    max_reasks: int = 1
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+NO_RETRY = RetryPolicy(max_retries=0, max_reasks=0)
+
+
+def call_with_retry(fn: Callable[[], T], policy: RetryPolicy = DEFAULT_RETRY_POLICY) -> T:
+    """调用 fn，遇到可重试错误时按策略退避重试，不可重试错误或重试耗尽时抛出最后一次异常"""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= policy.max_retries or not is_retryable_error(e):
+                raise
+            delay = min(policy.max_delay, max(policy.backoff(attempt), get_retry_after(e) or 0.0))
+            logger.warning("调用失败(%s)，%.1f秒后第%d次重试", e, delay, attempt + 1)
+            time.sleep(delay)
+            attempt += 1
+
+
+async def call_with_retry_async(fn: Callable[[], Awaitable[T]], policy: RetryPolicy = DEFAULT_RETRY_POLICY) -> T:
+    """call_with_retry 的协程版本，退避期间不占用事件循环"""
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= policy.max_retries or not is_retryable_error(e):
+                raise
+            delay = min(policy.max_delay, max(policy.backoff(attempt), get_retry_after(e) or 0.0))
+            logger.warning("调用失败(%s)，%.1f秒后第%d次重试", e, delay, attempt + 1)
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,312 @@
+"""共享任务调度：进程内所有会话的任务在同一个工作池中排队运行，共用全局限流器并按任务公平分配并发
+
+会话只提交任务，再按任务ID轮询状态与结果（结果逐行写入任务库）；任务在调度器的工作线程中运行，不随会话结束而中断。
+最多同时运行 max_running 个任务，其余按提交顺序排队。运行中的任务共用一个 RateLimiter（整个进程对同一API密钥的
+RPM/TPM与自适应并发窗口），每个任务的在途请求数不超过并发窗口按任务数平分的份额；其他任务没有请求在等待时
+可以借用空闲的份额，新任务加入后已有任务随请求完成逐步让出并发。会话内直接运行（不进入队列）的任务通过 foreground
+取得同样的视图，与后台任务共用全局配额。
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from langchain_openai import ChatOpenAI
+
+from .async_engine import ENGINE_ASYNC, ENGINE_THREAD
+from .batch_api import DEFAULT_BATCH_OPTIONS, ENGINE_BATCH, BatchOptions
+from .cache import ResultCache
+from .errors import is_throttle_error
+from .jobs import STATUS_CANCELLED, STATUS_FAILED, JobStore, run_job
+from .monitor import RunMonitor
+from .packing import PackOptions
+from .prompt import QAPrompt
+from .rate_limit import RateLimiter
+from .retry import DEFAULT_RETRY_POLICY, RetryPolicy
+from .usage import UsageMeter
+
+logger = logging.getLogger(__name__)
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_COMPLETED = "completed"
+STATE_FAILED = STATUS_FAILED
+STATE_CANCELLED = STATUS_CANCELLED
+FINISHED_STATES = (STATE_COMPLETED, STATE_FAILED, STATE_CANCELLED)
+
+DEFAULT_MAX_RUNNING = 4
+# 等待份额时的最长阻塞时间：自适应并发窗口变化不会唤醒等待的线程，需要定期重新检查
+_SHARE_RECHECK = 0.5
+
+
+class JobCancelled(Exception):
+    """任务被取消（由结果回调抛出，run_job 随之停止提交新请求）"""
+
+
+@dataclass
+class ScheduledJob:
+    """调度器中的一个任务；monitor 在任务开始运行后创建"""
+    job_id: str
+    llm: ChatOpenAI
+    options: Dict[str, Any]
+    usage: Optional[UsageMeter] = None
+    state: str = STATE_QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: str = ""
+    monitor: Optional[RunMonitor] = None
+    limiter: Optional["JobLimiter"] = None
+    cancel_requested: bool = False
+
+
+class JobLimiter:
+    """任务在全局限流器上的视图：先取得本任务的并发份额，再经全局限流器发出请求（仅线程模式）
+
+    与 RateLimiter 一样提供 slot、throttled_count 与 latencies，可直接传给 run_job 与 RunMonitor；
+    local 为该任务自己的限流器（RPM/TPM/并发），在全局配额之外另行生效，先于全局配额取得。
+    """
+
+    def __init__(self, scheduler: "JobScheduler", local: Optional[RateLimiter] = None):
+        self._scheduler = scheduler
+        self.shared = scheduler.limiter
+        self.local = local
+        self.concurrency = self.shared.concurrency
+        self.in_flight = 0
+        self.waiting = 0
+        self.throttled_count = 0
+        self.latencies = deque(maxlen=256)
+
+    @contextmanager
+    def slot(self, estimated_tokens: int = 1):
+        with self.local.slot(estimated_tokens) if self.local is not None else nullcontext():
+            self._scheduler._acquire_share(self)
+            dispatched = False
+            try:
+                with self.shared.slot(estimated_tokens):
+                    self._scheduler._dispatched(self)
+                    dispatched = True
+                    started = time.monotonic()
+                    try:
+                        yield
+                    except BaseException as e:
+                        if is_throttle_error(e):
+                            self.throttled_count += 1
+                        raise
+                    self.latencies.append(time.monotonic() - started)
+            finally:
+                self._scheduler._release_share(self, dispatched)
+
+
+class JobScheduler:
+    """进程内共享的任务调度器（见模块说明），线程安全；limiter 为全局配额，不传时按10并发、不限RPM/TPM"""
+
+    def __init__(self, store: JobStore, limiter: Optional[RateLimiter] = None,
+                 max_running: int = DEFAULT_MAX_RUNNING):
+        self.store = store
+        self.limiter = limiter or RateLimiter()
+        self.max_running = max(1, max_running)
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._queue: Deque[str] = deque()
+        self._limiters: List[JobLimiter] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._work, name=f"qa-scheduler-{n}", daemon=True)
+            for n in range(self.max_running)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, job_id: str, llm: ChatOpenAI,
+               max_workers: int = 5,
+               retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+               cache: Optional[ResultCache] = None,
+               engine: str = ENGINE_THREAD,
+               prompt: Optional[QAPrompt] = None,
+               dedup_threshold: Optional[float] = None,
+               usage: Optional[UsageMeter] = None,
+               batch_options: BatchOptions = DEFAULT_BATCH_OPTIONS,
+               packing: Optional[PackOptions] = None) -> ScheduledJob:
+        """任务排队（任务须已在任务库中创建），参数与 run_job 相同；已完成的行不会重复处理
+
+        全局限流器只在线程模式下使用，异步引擎的任务改用线程引擎运行（记录警告）；每个任务的线程数不超过全局并发上限。
+        """
+        if self.store.get_job(job_id) is None:
+            raise KeyError(f"任务不存在: {job_id}")
+        if engine == ENGINE_ASYNC:
+            logger.warning("任务 %s: 共享队列只支持线程引擎，异步引擎改用线程引擎运行", job_id)
+            engine = ENGINE_THREAD
+        options = dict(
+            max_workers=self.max_workers(max_workers), retry=retry, cache=cache,
+            engine=engine, prompt=prompt, dedup_threshold=dedup_threshold, usage=usage,
+            batch_options=batch_options, packing=packing,
+        )
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("调度器已关闭")
+            existing = self._jobs.get(job_id)
+            if existing is not None and existing.state not in FINISHED_STATES:
+                raise ValueError(f"任务已在队列中: {job_id}")
+            job = ScheduledJob(job_id, llm, options, usage)
+            self._jobs[job_id] = job
+            self._queue.append(job_id)
+            self._cond.notify_all()
+        logger.info("任务 %s 已加入队列（排队 %d 个）", job_id, len(self._queue))
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """取消排队中或运行中的任务；运行中的任务在下一行完成时停止，已完成的行保留在任务库中"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return False
+            job.cancel_requested = True
+            if job.state == STATE_QUEUED:
+                self._queue.remove(job_id)
+                job.state = STATE_CANCELLED
+                job.finished_at = time.time()
+                self.store.set_status(job_id, STATUS_CANCELLED)
+            return True
+
+    def get(self, job_id: str) -> Optional[ScheduledJob]:
+        return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务状态：state、排队位置（从1开始，未排队为0）、完成行数（来自任务库）、错误信息与运行统计"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            position = self._queue.index(job_id) + 1 if job.state == STATE_QUEUED else 0
+        record = self.store.get_job(job_id)
+        return {
+            "job_id": job_id,
+            "state": job.state,
+            "position": position,
+            "completed": record["completed_rows"] if record else 0,
+            "total": record["total_rows"] if record else 0,
+            "submitted_at": job.submitted_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "error": job.error,
+            "stats": job.monitor.snapshot() if job.monitor is not None else None,
+        }
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        """所有任务（含已结束的）的状态，按提交时间倒序"""
+        with self._cond:
+            job_ids = sorted(self._jobs, key=lambda job_id: -self._jobs[job_id].submitted_at)
+        return [self.status(job_id) for job_id in job_ids]
+
+    def max_workers(self, max_workers: int) -> int:
+        """任务的线程数不超过全局并发上限"""
+        return max(1, min(max_workers, self.limiter.concurrency.maximum))
+
+    @contextmanager
+    def foreground(self, local: Optional[RateLimiter] = None) -> Iterator[JobLimiter]:
+        """会话内直接运行的任务在全局限流器上的视图（仅线程模式），运行期间与后台任务一起参与并发份额分配"""
+        limiter = JobLimiter(self, local)
+        with self._cond:
+            self._limiters.append(limiter)
+        try:
+            yield limiter
+        finally:
+            with self._cond:
+                self._limiters.remove(limiter)
+                self._cond.notify_all()
+
+    def fair_share(self) -> int:
+        """当前每个任务的并发份额：全局并发窗口按使用限流器的运行中任务数平分（向上取整）"""
+        return max(1, math.ceil(self.limiter.concurrency.limit / max(1, len(self._limiters))))
+
+    def shutdown(self, wait: bool = False):
+        """停止接收新任务，取消排队中的任务；运行中的任务继续到结束"""
+        with self._cond:
+            self._closed = True
+            for job_id in list(self._queue):
+                job = self._jobs[job_id]
+                job.state = STATE_CANCELLED
+                job.finished_at = time.time()
+                self.store.set_status(job_id, STATUS_CANCELLED)
+            self._queue.clear()
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _acquire_share(self, limiter: JobLimiter):
+        """取得份额后该请求仍计为等待，直到拿到全局限流器的配额（_dispatched）"""
+        with self._cond:
+            limiter.waiting += 1
+            # 未超出份额，或其他任务没有请求在等待（借用空闲份额）
+            while limiter.in_flight >= self.fair_share() and any(
+                    other.waiting for other in self._limiters if other is not limiter):
+                self._cond.wait(_SHARE_RECHECK)
+            limiter.in_flight += 1
+
+    def _dispatched(self, limiter: JobLimiter):
+        with self._cond:
+            limiter.waiting -= 1
+            self._cond.notify_all()
+
+    def _release_share(self, limiter: JobLimiter, dispatched: bool):
+        with self._cond:
+            limiter.in_flight -= 1
+            if not dispatched:
+                limiter.waiting -= 1
+            self._cond.notify_all()
+
+    def _next_job(self) -> Optional[ScheduledJob]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            job = self._jobs[self._queue.popleft()]
+            job.state = STATE_RUNNING
+            job.started_at = time.time()
+            if job.options["engine"] != ENGINE_BATCH:
+                job.limiter = JobLimiter(self)
+                self._limiters.append(job.limiter)
+            return job
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._run(job)
+
+    def _run(self, job: ScheduledJob):
+        record = self.store.get_job(job.job_id)
+        job.monitor = RunMonitor(record["total_rows"], record["completed_rows"], job.limiter)
+
+        def on_result(idx: int, result: str):
+            job.monitor.record(idx, result)
+            if job.cancel_requested:
+                raise JobCancelled(job.job_id)
+
+        state, error = STATE_COMPLETED, ""
+        try:
+            run_job(self.store, job.job_id, job.llm, limiter=job.limiter, on_result=on_result, **job.options)
+        except JobCancelled:
+            state = STATE_CANCELLED
+        except Exception as e:
+            logger.exception("任务 %s 运行失败", job.job_id)
+            state, error = STATE_FAILED, f"{type(e).__name__}: {str(e)[:300]}"
+        if state != STATE_COMPLETED:
+            # run_job 只在完成时更新任务库中的状态
+            self.store.set_status(job.job_id, state)
+        with self._cond:
+            if job.limiter is not None:
+                self._limiters.remove(job.limiter)
+            job.state = state
+            job.error = error
+            job.finished_at = time.time()
+            self._cond.notify_all()
+        logger.info("任务 %s 结束: %s", job.job_id, state)
@@ -0,0 +1,174 @@
+"""销售违禁词本地预检：由词典构建一次Aho-Corasick自动机，单遍扫描对话找出全部命中
+
+命中结果可作为提示附在请求中（hint），或直接替代模型输出的“销售违禁词问题”维度（replace）。
+扫描一列时先用全部短语组成的正则对整列做一次向量化筛查（pandas 字符串方法），只有可能命中的行再逐行送入自动机
+取得轮次与位置；行内同样先按轮次筛查。自动机逐字符运行于Python循环中，筛查使未命中的行与轮次不再经过它。
+"""
+import csv
+import os
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+DEFAULT_BANNED_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "banned_phrases.csv")
+BANNED_SECTION = "销售违禁词问题"
+
+SCREEN_OFF = "off"
+SCREEN_HINT = "hint"
+SCREEN_REPLACE = "replace"
+
+# 说话人标签中包含这些文字的行不属于销售发言，不参与扫描
+CUSTOMER_SPEAKERS = ("顾客", "客户", "用户")
+_SPEAKER = re.compile(r"\s*([^:：\s][^:：]{0,9})[:：]")
+
+HINT_HEADER = "\n\n本地违禁词预检命中（仅供参考，请结合上下文判断是否违规；未列出的表达同样需要检查）：\n"
+REPLACE_NOTE = f"\n\n「{BANNED_SECTION}」由本地规则检测，该字段请直接输出空数组 []。"
+
+
+class PhraseMatcher:
+    """Aho-Corasick多模式匹配（按casefold不区分大小写），find 返回全部命中（含重叠）的 (起始位置, 短语下标)
+
+    起始位置为原文中的字符偏移：逐字符casefold后送入自动机，casefold后长度变化的字符（如 "ß"、"İ"）不会使位置偏移。
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases = [p for p in phrases if p]
+        self._lengths = [len(p.casefold()) for p in self.phrases]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for idx, phrase in enumerate(self.phrases):
+            state = 0
+            for ch in phrase.casefold():
+                if ch not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][ch] = len(self._goto) - 1
+                state = self._goto[state][ch]
+            self._out[state].append(idx)
+        # 按层构建失配指针，并合并后缀状态的输出
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, int]]:
+        hits = []
+        state = 0
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        # casefold后每个字符对应的原文位置
+        origins: List[int] = []
+        for pos, original in enumerate(text):
+            for ch in original.casefold():
+                origins.append(pos)
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                for idx in out[state]:
+                    hits.append((origins[len(origins) - lengths[idx]], idx))
+        return hits
+
+
+def split_turns(conversation: str) -> List[Tuple[int, int, str, str]]:
+    """按行切分对话，返回 (轮次, 行在原文中的起始位置, 说话人, 内容)；轮次为非空行的序号
+
+    行首形如“销售：”的短标签视为说话人，没有标签的行说话人为空字符串。
+    """
+    turns = []
+    offset = 0
+    for line in conversation.splitlines(keepends=True):
+        text = line.rstrip("\r\n")
+        if text.strip():
+            match = _SPEAKER.match(text)
+            speaker = match.group(1).strip() if match else ""
+            content_start = match.end() if match else 0
+            turns.append((len(turns) + 1, offset + content_start, speaker, text[content_start:]))
+        offset += len(line)
+    return turns
+
+
+class PhraseScreen:
+    """违禁词词典 + 自动机；scan 只扫描销售（或未标注说话人）的发言"""
+
+    def __init__(self, entries: List[Dict[str, str]]):
+        self.entries = entries
+        self.matcher = PhraseMatcher(entry["违禁词"] for entry in entries)
+        # 自动机在casefold后的文本上匹配，命中的行casefold后必然包含某个短语
+        self._any_phrase = re.compile("|".join(sorted(re.escape(p.casefold()) for p in self.matcher.phrases)))
+
+    def scan(self, conversation: str) -> List[Dict[str, Any]]:
+        """返回命中列表，每项含 轮次、违禁词、类型、风险等级 与 位置（在对话原文中的字符偏移）"""
+        hits = []
+        for turn, start, speaker, content in split_turns(str(conversation)):
+            if any(name in speaker for name in CUSTOMER_SPEAKERS) or not self._any_phrase.search(content.casefold()):
+                continue
+            for pos, idx in self.matcher.find(content):
+                entry = self.entries[idx]
+                hits.append({
+                    "轮次": turn,
+                    "违禁词": entry["违禁词"],
+                    "类型": entry["类型"],
+                    "风险等级": entry["风险等级"],
+                    "位置": start + pos,
+                })
+        return hits
+
+    def scan_values(self, values: Iterable[Any]) -> List[List[Dict[str, Any]]]:
+        """扫描一列对话（见模块说明），空值与未命中的行返回空列表"""
+        series = pd.Series(list(values), dtype=object)
+        texts = series.where(series.map(lambda value: isinstance(value, str)), "")
+        hits: List[List[Dict[str, Any]]] = [[] for _ in range(len(texts))]
+        if not self.matcher.phrases:
+            return hits
+        candidates = texts.str.casefold().str.contains(self._any_phrase, regex=True).to_numpy()
+        for pos in candidates.nonzero()[0]:
+            hits[pos] = self.scan(texts.iat[pos])
+        return hits
+
+    def instructions(self, conversation: str, mode: str) -> str:
+        """附在人类消息末尾的说明：hint 模式列出命中，replace 模式要求模型跳过该维度"""
+        if mode == SCREEN_REPLACE:
+            return REPLACE_NOTE
+        hits = self.scan(conversation)
+        if not hits:
+            return ""
+        return HINT_HEADER + "\n".join(
+            f"- 第{hit['轮次']}轮「{hit['违禁词']}」{hit['类型']}/{hit['风险等级']}风险" for hit in hits
+        )
+
+    def items(self, conversation: str) -> List[Dict[str, Any]]:
+        """将命中转换为“销售违禁词问题”维度的输出格式"""
+        return [
+            {
+                "轮次": hit["轮次"],
+                "违禁词": hit["违禁词"],
+                "类型": hit["类型"],
+                "描述": f"本地词典命中「{hit['违禁词']}」（{hit['类型']}）",
+                "风险等级": hit["风险等级"],
+                "位置": hit["位置"],
+            }
+            for hit in self.scan(conversation)
+        ]
+
+
+def load_banned_phrases(path: str = DEFAULT_BANNED_FILE) -> Optional[PhraseScreen]:
+    """读取违禁词词典（CSV，列为 违禁词,类型,风险等级；#开头的行为注释），文件不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = csv.DictReader(line for line in f if not line.lstrip().startswith("#"))
+        entries = [
+            {"违禁词": row["违禁词"].strip(), "类型": (row.get("类型") or "").strip(),
+             "风险等级": (row.get("风险等级") or "").strip()}
+            for row in rows if (row.get("违禁词") or "").strip()
+        ]
+    return PhraseScreen(entries)
@@ -0,0 +1,51 @@
+"""质检结果的JSON整理：解析结果列并按section展开（向量化，供界面按结果集缓存）"""
+import hashlib
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from .core import is_error_result
+from .parsing import extract_json_from_text
+
+ROW_NUMBER_COLUMN = "原始行号"
+CONTENT_COLUMN = "内容"
+
+
+def result_fingerprint(results: pd.Series) -> str:
+    """结果集指纹：结果列内容或行号变化时改变"""
+    hashed = pd.util.hash_pandas_object(results.astype(str), index=True)
+    return hashlib.sha256(hashed.values.tobytes()).hexdigest()[:16]
+
+
+def _parse_result(text: str) -> Dict[str, Any]:
+    if not text or is_error_result(text):
+        return {}
+    data = extract_json_from_text(text)
+    return data if isinstance(data, dict) else {}
+
+
+def parse_result_json(results: pd.Series) -> pd.Series:
+    """解析结果列，只保留解析出非空JSON对象的行（索引为原始行索引）"""
+    parsed = results.fillna("").astype(str).map(_parse_result)
+    return parsed[parsed.map(bool)]
+
+
+def collect_sections(parsed: pd.Series) -> List[str]:
+    """所有行出现过的顶级键名（排序）"""
+    sections = set()
+    for data in parsed:
+        sections.update(data.keys())
+    return sorted(sections)
+
+
+def explode_section(parsed: pd.Series, section: str) -> pd.DataFrame:
+    """将指定section展开为 (原始行号, 内容) 表，列表内容每项一行"""
+    content = parsed.map(lambda data: data.get(section))
+    content = content[content.notna()]
+    # 只展开列表；字典等其他内容包成单元素列表，保持为一行
+    content = content.map(lambda value: value if isinstance(value, list) else [value])
+    content = content[content.map(len) > 0].explode()
+    return pd.DataFrame({
+        ROW_NUMBER_COLUMN: content.index + 1,
+        CONTENT_COLUMN: content.values,
+    })
@@ -0,0 +1,215 @@
+"""流式输出：边接收边检查JSON结构，输出偏离输出格式或某个字段过长时提前中止，不再等待整段生成
+
+StreamChecker 只跟踪最外层对象的字段名与各字段值的起始字符（字符串内容整段跳过），对照提示词中的输出示例：
+出现示例以外的字段、字段重复、字段类型（数组/对象）不符、JSON对象之前有大段文字，或单个字段的输出超过
+预算（section_tokens 与本次 max_tokens 的 section_share 中较小者，超出时其余字段已无法完整输出）时判定为偏离。中止的输出按不合格输出处理（附上问题说明重新请求），首token耗时由 UsageMeter 记录。
+"""
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain.schema import BaseMessage
+from langchain_openai.chat_models.base import BaseChatOpenAI
+
+from .usage import record_parse_time, record_stream_abort
+
+# 字符串内只需关注引号与转义字符
+_STRING_STOP = re.compile(r'["\\]')
+
+
+@dataclass(frozen=True)
+class StreamOptions:
+    """流式输出选项：单个顶级字段的输出上限为 section_tokens 与 max_tokens * section_share 中较小者
+    （按收到的增量数计，每个增量约为一个token），preamble_chars 为JSON对象之前允许的文字长度（如代码块标记）"""
+    section_tokens: int = 2000
+    section_share: float = 0.6
+    preamble_chars: int = 200
+
+    def section_limit(self, max_tokens: Optional[int] = None) -> int:
+        if not max_tokens:
+            return self.section_tokens
+        return max(1, min(self.section_tokens, int(max_tokens * self.section_share)))
+
+
+DEFAULT_STREAMING = StreamOptions()
+
+
+class StreamChecker:
+    """逐块检查流式输出的结构；feed 返回是否可以停止检查（对象已完整或已偏离，偏离时 problems 不为空）"""
+
+    def __init__(self, schema: Optional[Dict[str, Any]], options: StreamOptions = DEFAULT_STREAMING,
+                 max_tokens: Optional[int] = None):
+        self.schema = schema
+        self.options = options
+        self.section_limit = options.section_limit(max_tokens)
+        self.problems: List[str] = []
+        self.complete = False
+        self.section: Optional[str] = None
+        self.section_tokens = 0
+        self._seen = set()
+        self._depth = 0
+        self._preamble = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[List[str]] = None
+        # 最外层对象中下一个非空白字符的含义："key"（字段名）、"value"（字段值的起始）或 ""（其他）
+        self._expect = ""
+
+    @property
+    def finished(self) -> bool:
+        return self.complete or bool(self.problems)
+
+    def feed(self, text: str) -> bool:
+        if self.finished:
+            return True
+        if self.section is not None:
+            self.section_tokens += 1
+            if self.section_tokens > self.section_limit:
+                self.problems.append(f"{self.section} 的输出超过 {self.section_limit} token")
+                return True
+        i, n = 0, len(text)
+        while i < n:
+            if self._in_string:
+                i = self._scan_string(text, i)
+                if self.problems:
+                    break
+                continue
+            ch = text[i]
+            i += 1
+            if ch.isspace():
+                continue
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth, self._expect = 1, "key"
+                else:
+                    self._preamble += 1
+                    if self._preamble > self.options.preamble_chars:
+                        self.problems.append("JSON对象之前有过多文字")
+                        break
+                continue
+            if self._depth == 1 and self._expect == "value":
+                self._expect = ""
+                self._check_type(ch)
+                if self.problems:
+                    break
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect == "key":
+                    self._key = []
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.complete = True
+                    break
+            elif self._depth == 1 and ch == ':':
+                self._expect = "value"
+            elif self._depth == 1 and ch == ',':
+                self._expect = "key"
+        return self.finished
+
+    def _scan_string(self, text: str, i: int) -> int:
+        if self._escape:
+            self._escape = False
+            if self._key is not None:
+                self._key.append(text[i])
+            return i + 1
+        match = _STRING_STOP.search(text, i)
+        end = match.start() if match else len(text)
+        if self._key is not None:
+            self._key.append(text[i:end])
+        if match is None:
+            return end
+        if text[end] == '\\':
+            self._escape = True
+            return end + 1
+        self._in_string = False
+        if self._key is not None:
+            self._enter_section("".join(self._key))
+            self._key = None
+        return end + 1
+
+    def _enter_section(self, key: str):
+        self._expect = ""
+        if self.schema is not None and key not in self.schema:
+            self.problems.append(f"多余字段 {key}")
+        elif key in self._seen:
+            self.problems.append(f"重复字段 {key}")
+        self._seen.add(key)
+        self.section, self.section_tokens = key, 0
+
+    def _check_type(self, ch: str):
+        if self.schema is None or self.section not in self.schema:
+            return
+        example = self.schema[self.section]
+        if isinstance(example, list) and ch != '[':
+            self.problems.append(f"{self.section} 应为数组")
+        elif isinstance(example, dict) and ch != '{':
+            self.problems.append(f"{self.section} 应为对象")
+
+
+def stream_kwargs(llm: Any, max_tokens: int) -> Dict[str, Any]:
+    """流式请求参数；OpenAI兼容客户端额外请求在最后一个数据块中返回usage（多后端池由各后端自行请求）"""
+    kwargs: Dict[str, Any] = {"max_tokens": max_tokens}
+    if isinstance(llm, BaseChatOpenAI):
+        kwargs["stream_options"] = {"include_usage": True}
+    return kwargs
+
+
+def _finish(parts: List[str], checker: StreamChecker, check_seconds: float) -> Tuple[str, List[str]]:
+    record_parse_time(check_seconds)
+    content = "".join(parts)
+    if checker.problems:
+        record_stream_abort()
+        return content, [f"{problem}（已提前中止）" for problem in checker.problems]
+    return content, []
+
+
+def consume_stream(chunks: Iterable[BaseMessage], checker: StreamChecker) -> Tuple[str, List[str]]:
+    """读取流式输出直到结束或偏离，返回 (已收到的输出, 偏离问题)；对象完整后继续读完（最后的数据块带有usage）"""
+    parts: List[str] = []
+    check_seconds = 0.0
+    stream = iter(chunks)
+    try:
+        for chunk in stream:
+            text = chunk.content
+            if not text or not isinstance(text, str):
+                continue
+            parts.append(text)
+            if checker.finished:
+                continue
+            started = time.perf_counter()
+            checker.feed(text)
+            check_seconds += time.perf_counter() - started
+            if checker.problems:
+                break
+    finally:
+        # 提前中止时关闭生成器，断开连接，服务端随之停止生成
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return _finish(parts, checker, check_seconds)
+
+
+async def consume_stream_async(chunks: Any, checker: StreamChecker) -> Tuple[str, List[str]]:
+    """consume_stream 的协程版本（chunks 为 llm.astream 返回的异步生成器）"""
+    parts: List[str] = []
+    check_seconds = 0.0
+    try:
+        async for chunk in chunks:
+            text = chunk.content
+            if not text or not isinstance(text, str):
+                continue
+            parts.append(text)
+            if checker.finished:
+                continue
+            started = time.perf_counter()
+            checker.feed(text)
+            check_seconds += time.perf_counter() - started
+            if checker.problems:
+                break
+    finally:
+        await chunks.aclose()
+    return _finish(parts, checker, check_seconds)
@@ -0,0 +1,138 @@
+"""上传文件解析缓存：按内容哈希缓存解析后的表格，进程内所有会话共享，按内存占用LRU淘汰
+
+同一份文件只解析一次：脚本重跑（调整参数、点击按钮）与其他会话上传相同内容时直接复用。
+各列类型在解析时推断一次；质检列可转换为 Arrow 字符串列（需要 pyarrow），内存占用更小。
+"""
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    COMPACT_DTYPE = "string[pyarrow]"
+except ImportError:  # 可选依赖，缺失时不转换
+    COMPACT_DTYPE = None
+
+DEFAULT_UPLOAD_CACHE_MB = 512
+# 推断文本列时抽样的行数
+_SAMPLE_ROWS = 1000
+
+
+class ParsedTable:
+    """解析后的上传表格（只读，多个会话共享，不要原地修改 frame）"""
+
+    def __init__(self, digest: str, name: str, frame: pd.DataFrame, source_bytes: int):
+        self.digest = digest
+        self.name = name
+        self.frame = frame
+        self.source_bytes = source_bytes
+        self.nbytes = int(frame.memory_usage(deep=True).sum())
+        self.dtypes: Dict[str, str] = {
+            str(column): pd.api.types.infer_dtype(frame[column], skipna=True) for column in frame.columns
+        }
+        self._compact: Dict[str, pd.Series] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def text_column(self) -> Optional[str]:
+        """猜测对话所在的列：抽样平均长度最长的文本列"""
+        sample = self.frame.head(_SAMPLE_ROWS)
+        lengths = {
+            column: sample[column].dropna().astype(str).str.len().mean()
+            for column in self.frame.columns if self.dtypes[str(column)] in ("string", "mixed")
+        }
+        lengths = {column: length for column, length in lengths.items() if pd.notna(length)}
+        return max(lengths, key=lengths.get) if lengths else None
+
+    def column(self, name: str) -> pd.Series:
+        """质检列的紧凑表示（Arrow字符串，缺失值为 NA），首次访问时转换并缓存"""
+        with self._lock:
+            if name not in self._compact:
+                series = self.frame[name]
+                if COMPACT_DTYPE and self.dtypes[str(name)] in ("string", "empty"):
+                    series = series.astype(COMPACT_DTYPE)
+                self._compact[name] = series
+            return self._compact[name]
+
+    def with_compact_column(self, name: str) -> pd.DataFrame:
+        """将质检列替换为紧凑表示的新表格（其余列共用原数据）"""
+        frame = self.frame.copy(deep=False)
+        frame[name] = self.column(name)
+        return frame
+
+
+def parse_table(name: str, data: bytes) -> pd.DataFrame:
+    """按扩展名解析上传内容（CSV或Excel）"""
+    if name.lower().endswith('.csv'):
+        return pd.read_csv(io.BytesIO(data))
+    return pd.read_excel(io.BytesIO(data))
+
+
+class UploadCache:
+    """线程安全的解析结果缓存：键为内容SHA-256，总内存超过 max_bytes 时淘汰最久未使用的表格"""
+
+    def __init__(self, max_mb: float = DEFAULT_UPLOAD_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._tables: "OrderedDict[str, ParsedTable]" = OrderedDict()
+        self._digests: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(table.nbytes for table in self._tables.values())
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    def _lookup(self, digest: str) -> Optional[ParsedTable]:
+        table = self._tables.get(digest)
+        if table is not None:
+            self._tables.move_to_end(digest)
+            self.hits += 1
+        return table
+
+    def load(self, upload_id: str, name: str, read_bytes: Callable[[], bytes]) -> ParsedTable:
+        """返回上传文件的解析结果；upload_id（如Streamlit的file_id）已见过时不再读取与哈希文件内容"""
+        with self._lock:
+            digest = self._digests.get(upload_id)
+            table = self._lookup(digest) if digest else None
+        if table is not None:
+            return table
+        data = read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._digests[upload_id] = digest
+            table = self._lookup(digest)
+        if table is not None:
+            return table
+        # 解析在锁外进行，不阻塞其他会话；并发解析同一内容时保留先完成的一份
+        table = ParsedTable(digest, name, parse_table(name, data), len(data))
+        with self._lock:
+            self.misses += 1
+            table = self._tables.setdefault(digest, table)
+            self._tables.move_to_end(digest)
+            self._evict()
+        return table
+
+    def _evict(self):
+        total = sum(table.nbytes for table in self._tables.values())
+        # 至少保留最近使用的一份，即使它本身超过上限
+        while total > self.max_bytes and len(self._tables) > 1:
+            digest, table = self._tables.popitem(last=False)
+            total -= table.nbytes
+            for upload_id in [key for key, value in self._digests.items() if value == digest]:
+                del self._digests[upload_id]
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self._digests.clear()
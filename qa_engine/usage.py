@@ -0,0 +1,280 @@
+"""逐行用量与耗时记录：读取响应中的usage（含DeepSeek前缀缓存命中/未命中token数），并记录排队、调用、首token、解析耗时与错误
+
+UsageMeter 作为LangChain回调挂在模型上（initialize_llm 的 callbacks 参数），不需要改动请求路径；
+当前处理的行通过 contextvars 传递（RowTrace），同一行的分段请求、重试与重新请求计入同一行。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from .budget import count_tokens
+
+
+@dataclass(frozen=True)
+class Pricing:
+    """每百万token价格（默认为 deepseek-chat 的人民币价格，价格调整时请覆盖）"""
+    cache_hit: float = 0.2
+    cache_miss: float = 2.0
+    output: float = 3.0
+    currency: str = "¥"
+
+
+DEFAULT_PRICING = Pricing()
+
+
+@dataclass
+class TokenUsage:
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_hit_tokens: int = 0
+    cache_miss_tokens: int = 0
+
+    def add(self, other: "TokenUsage"):
+        self.requests += other.requests
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cache_hit_tokens += other.cache_hit_tokens
+        self.cache_miss_tokens += other.cache_miss_tokens
+
+    @property
+    def hit_rate(self) -> float:
+        """前缀缓存命中的输入token占比"""
+        return self.cache_hit_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def cost(self, pricing: Pricing = DEFAULT_PRICING) -> float:
+        return (self.cache_hit_tokens * pricing.cache_hit + self.cache_miss_tokens * pricing.cache_miss
+                + self.completion_tokens * pricing.output) / 1_000_000
+
+    def describe(self, pricing: Pricing = DEFAULT_PRICING) -> str:
+        return (
+            f"{self.requests} 次请求，输入 {self.prompt_tokens} token"
+            f"（前缀缓存命中 {self.cache_hit_tokens}，命中率 {self.hit_rate * 100:.1f}%），"
+            f"输出 {self.completion_tokens} token，估算费用 {pricing.currency}{self.cost(pricing):.4f}"
+        )
+
+
+def parse_token_usage(token_usage: Dict[str, Any]) -> TokenUsage:
+    """解析响应中的usage：DeepSeek 返回 prompt_cache_hit/miss_tokens，OpenAI 返回 prompt_tokens_details.cached_tokens"""
+    prompt_tokens = int(token_usage.get("prompt_tokens") or 0)
+    hit = token_usage.get("prompt_cache_hit_tokens")
+    if hit is None:
+        hit = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    hit = int(hit or 0)
+    miss = token_usage.get("prompt_cache_miss_tokens")
+    return TokenUsage(
+        requests=1,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=int(token_usage.get("completion_tokens") or 0),
+        cache_hit_tokens=hit,
+        cache_miss_tokens=int(miss) if miss is not None else max(0, prompt_tokens - hit),
+    )
+
+
+@dataclass
+class RowTrace:
+    """一行的耗时与用量
+
+    queue_wait 为开始处理到第一次发出请求的时间（主要是等待限流器的并发窗口与RPM/TPM配额），
+    api_latency 为各次调用耗时之和，parse_time 为解析与校验输出的耗时，total_time 为整行处理耗时。
+    ttft 为该行第一次流式调用从发出到收到第一个输出token的时间（非流式调用时为None）。
+    errors 为失败的调用次数，最终仍失败时最后一次不计入 retries；aborted 为因输出偏离而提前中止的流式调用次数。
+    shared_rows 不为空时为多行打包在同一个请求中，取出时用量按行数平均分摊。
+    """
+    row: int
+    started: float = field(default_factory=time.monotonic)
+    first_call: Optional[float] = None
+    ttft: Optional[float] = None
+    api_latency: float = 0.0
+    parse_time: float = 0.0
+    total_time: float = 0.0
+    errors: int = 0
+    failed: bool = False
+    error_class: str = ""
+    aborted: int = 0
+    usage: TokenUsage = field(default_factory=TokenUsage)
+    shared_rows: Tuple[int, ...] = ()
+
+    @property
+    def queue_wait(self) -> float:
+        return self.first_call - self.started if self.first_call is not None else 0.0
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.errors - (1 if self.failed and self.errors else 0))
+
+    def share(self, row: int) -> "RowTrace":
+        """打包请求中第 row 行分摊的记录：耗时与整包相同，token按行数平均（余数计入第一行）"""
+        count = len(self.shared_rows)
+        first = row == self.shared_rows[0]
+
+        def part(total: int) -> int:
+            return total // count + (total % count if first else 0)
+
+        usage = TokenUsage(*(part(getattr(self.usage, name)) for name in (
+            "requests", "prompt_tokens", "completion_tokens", "cache_hit_tokens", "cache_miss_tokens")))
+        return RowTrace(row, self.started, self.first_call, self.ttft, self.api_latency, self.parse_time,
+                        self.total_time, self.errors if first else 0, self.failed, self.error_class,
+                        self.aborted if first else 0, usage)
+
+
+_current_row: ContextVar[Optional[RowTrace]] = ContextVar("qa_current_row", default=None)
+
+
+@contextmanager
+def track_row(idx: int, shared_rows: Tuple[int, ...] = ()):
+    """在 with 块内发出的请求与解析，耗时和用量记到第 idx 行（批内下标）；打包请求传入包内各行 shared_rows"""
+    trace = RowTrace(idx, shared_rows=shared_rows)
+    token = _current_row.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.total_time = time.monotonic() - trace.started
+        _current_row.reset(token)
+
+
+def record_parse_time(seconds: float):
+    trace = _current_row.get()
+    if trace is not None:
+        trace.parse_time += seconds
+
+
+def record_failure(error_class: str):
+    """整行（或某一段）最终失败时记录错误类别"""
+    trace = _current_row.get()
+    if trace is not None:
+        trace.failed = True
+        trace.error_class = error_class
+
+
+def record_stream_abort():
+    """流式输出因偏离输出格式被提前中止"""
+    trace = _current_row.get()
+    if trace is not None:
+        trace.aborted += 1
+
+
+def _message_token_usage(message: Any) -> Optional[Dict[str, Any]]:
+    """从消息中读取usage：非流式调用在 response_metadata 中，流式调用的最后一个数据块只有 usage_metadata"""
+    token_usage = getattr(message, "response_metadata", {}).get("token_usage")
+    if token_usage:
+        return token_usage
+    usage_metadata = getattr(message, "usage_metadata", None)
+    if usage_metadata:
+        return {"prompt_tokens": usage_metadata.get("input_tokens"),
+                "completion_tokens": usage_metadata.get("output_tokens")}
+    return None
+
+
+class UsageMeter(BaseCallbackHandler):
+    """线程安全的用量与耗时记录：total 为全部请求的token之和，rows 为发出过请求的行（按批内行号，由 run_job 取出并持久化）
+
+    流式调用的usage来自最后一个数据块，不含前缀缓存命中数（全部计为未命中）；提前中止的调用没有usage，按已收到的输出估算。
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.total = TokenUsage()
+        self.rows: Dict[int, RowTrace] = {}
+        self._started: Dict[UUID, float] = {}
+        self._messages: Dict[UUID, Any] = {}
+        self._first_token: set = set()
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any):
+        self._call_started(run_id, messages)
+
+    def _call_started(self, run_id: UUID, messages: Any = None):
+        now = time.monotonic()
+        trace = _current_row.get()
+        with self._lock:
+            self._started[run_id] = now
+            self._messages[run_id] = messages
+            if trace is not None:
+                for row in trace.shared_rows or (trace.row,):
+                    existing = self.rows.get(row)
+                    if existing is None:
+                        self.rows[row] = trace
+                    elif existing.shared_rows and not trace.shared_rows:
+                        # 打包结果不合格后单独请求的行改用自己的记录，并带上分摊的打包用量
+                        trace.usage.add(existing.share(row).usage)
+                        self.rows[row] = trace
+                if trace.first_call is None:
+                    trace.first_call = now
+
+    def _call_finished(self, run_id: UUID) -> Optional[RowTrace]:
+        now = time.monotonic()
+        trace = _current_row.get()
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            self._messages.pop(run_id, None)
+            self._first_token.discard(run_id)
+            if trace is not None and started is not None:
+                trace.api_latency += now - started
+        return trace
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        if not token or run_id in self._first_token:
+            return
+        now = time.monotonic()
+        trace = _current_row.get()
+        with self._lock:
+            self._first_token.add(run_id)
+            started = self._started.get(run_id)
+            if trace is not None and started is not None and trace.ttft is None:
+                trace.ttft = now - started
+
+    def _add_usage(self, trace: Optional[RowTrace], usage: TokenUsage):
+        with self._lock:
+            self.total.add(usage)
+            if trace is not None:
+                trace.usage.add(usage)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        trace = self._call_finished(run_id)
+        token_usage = (response.llm_output or {}).get("token_usage")
+        if not token_usage and response.generations and response.generations[0]:
+            token_usage = _message_token_usage(getattr(response.generations[0][0], "message", None))
+        # 服务商没有返回usage时仍计入请求次数
+        self._add_usage(trace, parse_token_usage(token_usage) if token_usage else TokenUsage(requests=1))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, response: Optional[LLMResult] = None,
+                     **kwargs: Any):
+        if isinstance(error, GeneratorExit):
+            # 流式输出被主动中止，不计为失败调用
+            with self._lock:
+                messages = self._messages.get(run_id) or []
+            trace = self._call_finished(run_id)
+            text = response.generations[0][0].text if response and response.generations else ""
+            prompt_tokens = sum(count_tokens(str(m.content)) for batch in messages for m in batch)
+            completion_tokens = count_tokens(text) if text else 0
+            self._add_usage(trace, TokenUsage(1, prompt_tokens, completion_tokens, 0, prompt_tokens))
+            return
+        trace = self._call_finished(run_id)
+        if trace is None:
+            return
+        with self._lock:
+            trace.errors += 1
+            trace.error_class = type(error).__name__
+
+    def add(self, usage: TokenUsage):
+        """计入不经过回调的用量（如批处理接口返回的usage）"""
+        with self._lock:
+            self.total.add(usage)
+
+    def pop_row(self, idx: int) -> Optional[RowTrace]:
+        with self._lock:
+            trace = self.rows.pop(idx, None)
+            return trace.share(idx) if trace is not None and trace.shared_rows else trace
+
+    def clear_rows(self):
+        with self._lock:
+            self.rows.clear()
@@ -1,17 +1,83 @@
 import streamlit as st
 import pandas as pd
-import json
-import time
-from typing import List, Dict, Any
 import io
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import re
+import math
 import os
+import time
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema import HumanMessage
 from dotenv import load_dotenv
 
+from qa_engine import (
+    DEFAULT_BANNED_FILE,
+    DEFAULT_BUDGET,
+    DEFAULT_CACHE_PATH,
+    DEFAULT_JOB_DIR,
+    DEFAULT_MAX_RUNNING,
+    DEFAULT_PACKING,
+    DEFAULT_SIMILARITY,
+    DEFAULT_STREAMING,
+    DEFAULT_UPLOAD_CACHE_MB,
+    ENGINE_ASYNC,
+    ENGINE_BATCH,
+    ENGINE_THREAD,
+    RESULT_COLUMN,
+    ROW_NUMBER_COLUMN,
+    SCREEN_HINT,
+    SCREEN_OFF,
+    SCREEN_REPLACE,
+    SKIP_RESULT,
+    STATE_COMPLETED,
+    STATE_FAILED,
+    STATE_QUEUED,
+    STATE_RUNNING,
+    STATUS_COLUMN,
+    LATENCY_STAGES,
+    JobScheduler,
+    JobStore,
+    PackOptions,
+    RateLimiter,
+    ResultCache,
+    RetryPolicy,
+    RunMonitor,
+    StreamOptions,
+    TokenBudget,
+    UploadCache,
+    UsageMeter,
+    analyzed_rows,
+    build_backend_pool,
+    build_result_tables,
+    collect_sections,
+    count_rows,
+    create_qa_prompt,
+    csv_to_parquet,
+    explode_section,
+    export_job_csv,
+    failed_row_positions,
+    frame_to_xlsx,
+    grade_distribution,
+    initialize_llm,
+    is_error_result,
+    is_reused_result,
+    issue_frequency,
+    iter_table_rows,
+    load_backend_configs,
+    load_banned_phrases,
+    load_job_tables,
+    metric_percentiles,
+    metrics_to_json,
+    metrics_to_prometheus,
+    parquet_available,
+    parse_result_json,
+    read_preview,
+    result_fingerprint,
+    retry_failed_rows,
+    run_job,
+    summarize_metrics,
+    write_parquet,
+    write_xlsx,
+)
+
 # 加载环境变量
 load_dotenv()
 
@@ -169,8 +235,28 @@ if 'processing_complete' not in st.session_state:
     st.session_state.processing_complete = False
 if 'json_sections' not in st.session_state:
     st.session_state.json_sections = None
+if 'result_tables' not in st.session_state:
+    st.session_state.result_tables = None
 if 'selected_sections' not in st.session_state:
     st.session_state.selected_sections = []
+if 'run_config' not in st.session_state:
+    st.session_state.run_config = None
+if 'cache_stats' not in st.session_state:
+    st.session_state.cache_stats = None
+if 'usage_meter' not in st.session_state:
+    st.session_state.usage_meter = None
+if 'backend_pool' not in st.session_state:
+    st.session_state.backend_pool = None
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'result_file' not in st.session_state:
+    st.session_state.result_file = None
+if 'download_artifacts' not in st.session_state:
+    st.session_state.download_artifacts = None
+if 'watch_job_id' not in st.session_state:
+    st.session_state.watch_job_id = None
+if 'job_notice' not in st.session_state:
+    st.session_state.job_notice = None
 
 # 标题区域
 st.markdown('<h1 class="main-title">✨ LangChain智能质检助手</h1>', unsafe_allow_html=True)
@@ -179,166 +265,450 @@ st.markdown('<p class="subtitle">基于LangChain + DeepSeek V3的智能销售对
 # 装饰性分隔线
 st.markdown("---")
 
-def initialize_llm(api_key: str, base_url: str = None) -> ChatOpenAI:
-    """初始化DeepSeek模型"""
+def init_llm_or_report(api_key: str, base_url: str = None, json_mode: bool = True) -> ChatOpenAI:
+    """初始化DeepSeek模型（附带本次运行的token用量统计），失败时在页面提示并返回None
+
+    侧边栏填写了多后端配置时改为构建多后端模型池，此时忽略 api_key 与 base_url。
+    """
     try:
-        llm = ChatOpenAI(
-            model="deepseek-chat",
-            openai_api_key=api_key,
-            openai_api_base=base_url or "https://api.deepseek.com/v1",
-            temperature=0.7,
-            max_tokens=10000
-        )
-        return llm
+        st.session_state.usage_meter = UsageMeter()
+        st.session_state.backend_pool = None
+        backend_config = st.session_state.get('backend_config', '').strip()
+        if backend_config:
+            st.session_state.backend_pool = build_backend_pool(
+                load_backend_configs(backend_config), json_mode=json_mode,
+                callbacks=[st.session_state.usage_meter]
+            )
+            return st.session_state.backend_pool
+        return initialize_llm(api_key, base_url, json_mode=json_mode, callbacks=[st.session_state.usage_meter])
     except Exception as e:
         st.error(f"❌ 模型初始化失败: {str(e)}")
         return None
 
-def create_qa_prompt() -> ChatPromptTemplate:
-    """创建质检提示模板"""
-    try:
-        # 读取prompt.txt文件内容作为系统提示词
-        prompt_file_path = os.path.join(os.path.dirname(__file__), 'prompt.txt')
-        with open(prompt_file_path, 'r', encoding='utf-8') as f:
-            system_template = f.read()
-    except Exception as e:
-        st.error(f"❌ 读取prompt.txt文件失败: {str(e)}")
-        # 如果读取失败，使用默认提示词
-        system_template = """你是一个专业的销售对话质检专家。请分析以下销售对话，并从多个维度进行质量评估。
-
-请严格按照以下JSON格式返回结果：
-{
-    "对话质量问题": [],
-    "销售违禁词问题": [],
-    "优秀销售话术": [],
-    "整体评估": {
-        "对话总轮次": "总轮次数",
-        "问题轮次占比": "X%",
-        "优秀话术轮次占比": "X%",
-        "总体质量等级": "优秀/良好/一般/待改进"
-    }
-}
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    """进程内共享的结果缓存（所有会话共用同一个SQLite文件）"""
+    return ResultCache(os.getenv("QA_CACHE_PATH", DEFAULT_CACHE_PATH))
 
-请确保JSON格式正确，所有字段都要包含。"""
-    
-    human_template = """请分析以下销售对话：
+@st.cache_resource
+def get_job_store() -> JobStore:
+    """进程内共享的任务库，逐行保存进度，页面刷新或断线后可继续"""
+    return JobStore(os.getenv("QA_JOB_DIR", DEFAULT_JOB_DIR))
 
-{conversation}
+@st.cache_resource
+def get_scheduler() -> JobScheduler:
+    """进程内共享的任务调度器：各会话提交的后台任务排队运行，共用全局配额并公平分配并发
 
-请提供详细的质检分析结果。"""
-    
-    return ChatPromptTemplate.from_messages([
-        ("system", system_template),
-        ("human", human_template)
-    ])
+    全局配额由环境变量设置：QA_GLOBAL_RPM（默认20，0表示不限制）、QA_GLOBAL_TPM、QA_GLOBAL_CONCURRENCY（默认10），
+    QA_MAX_RUNNING_JOBS 为同时运行的任务数上限。
+    """
+    limiter = RateLimiter(
+        rpm=float(os.getenv("QA_GLOBAL_RPM", "20")) or None,
+        tpm=float(os.getenv("QA_GLOBAL_TPM", "0")) or None,
+        max_concurrency=int(os.getenv("QA_GLOBAL_CONCURRENCY", "10"))
+    )
+    return JobScheduler(get_job_store(), limiter, int(os.getenv("QA_MAX_RUNNING_JOBS", DEFAULT_MAX_RUNNING)))
 
-def analyze_conversation(llm: ChatOpenAI, conversation: str) -> str:
-    try:
-        prompt = create_qa_prompt()
-        messages = prompt.format_messages(conversation=conversation)
-        response = llm.invoke(messages)
-        return response.content
-    except Exception as e:
-        # 不要访问 response，直接返回错误信息
-        return f"❌ 分析失败: {str(e)}"
+@st.cache_resource
+def get_upload_cache() -> UploadCache:
+    """进程内共享的上传解析缓存：同一内容只解析一次，按内存占用淘汰（环境变量 QA_UPLOAD_CACHE_MB 设置上限）"""
+    return UploadCache(float(os.getenv("QA_UPLOAD_CACHE_MB", DEFAULT_UPLOAD_CACHE_MB)))
+
+@st.cache_resource
+def get_banned_screen():
+    """违禁词词典自动机只构建一次（可用环境变量 QA_BANNED_FILE 指定词典）"""
+    return load_banned_phrases(os.getenv("QA_BANNED_FILE", DEFAULT_BANNED_FILE))
+
+def build_prompt(run_config: dict):
+    """按运行配置设置长对话切分长度，并附加违禁词预检"""
+    prompt = create_qa_prompt().with_budget(
+        TokenBudget(chunk_tokens=run_config.get('chunk_tokens', DEFAULT_BUDGET.chunk_tokens))
+    )
+    if run_config.get('stream_output'):
+        prompt = prompt.with_streaming(StreamOptions(
+            section_tokens=run_config.get('section_tokens', DEFAULT_STREAMING.section_tokens)
+        ))
+    mode = run_config.get('banned_screen', SCREEN_OFF)
+    screen = get_banned_screen() if mode != SCREEN_OFF else None
+    return prompt.with_screen(screen, mode) if screen else prompt
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def scan_banned_column(file_id: str, column: str, _values: pd.Series) -> pd.DataFrame:
+    """对整列做一次本地违禁词扫描，返回命中明细（每处命中一行）"""
+    hits = get_banned_screen().scan_values(_values)
+    return pd.DataFrame(
+        [{'原始行号': pos + 1, **hit} for pos, row_hits in enumerate(hits) for hit in row_hits],
+        columns=['原始行号', '轮次', '违禁词', '类型', '风险等级', '位置']
+    )
 
-def extract_json_from_text(text: str) -> Dict[str, Any]:
-    """从文本中提取JSON数据"""
+def run_with_cache_stats(cache, fn, *args, **kwargs):
+    """执行批处理并记录本次运行的缓存命中/未命中数"""
+    if cache is None:
+        st.session_state.cache_stats = None
+        return fn(*args, **kwargs)
+    hits, misses = cache.hits, cache.misses
+    result = fn(*args, cache=cache, **kwargs)
+    st.session_state.cache_stats = {'hits': cache.hits - hits, 'misses': cache.misses - misses}
+    return result
+
+def build_limiter(run_config: dict) -> RateLimiter:
+    """根据本次运行配置创建共享限流器"""
+    return RateLimiter(
+        rpm=run_config['rpm'] or None,
+        tpm=run_config['tpm'] or None,
+        max_concurrency=run_config['max_workers'] if run_config['use_parallel'] else 1,
+        adaptive=run_config['adaptive']
+    )
+
+def foreground_engine(run_config: dict):
+    """会话内直接运行时的引擎与线程数：全局配额只支持线程模式，异步引擎改用线程池，线程数不超过全局并发上限"""
+    engine = run_config.get('engine', ENGINE_THREAD)
+    max_workers = run_config['max_workers'] if run_config['use_parallel'] else 1
+    return ENGINE_THREAD if engine == ENGINE_ASYNC else engine, get_scheduler().max_workers(max_workers)
+
+def build_packing(run_config: dict):
+    """短对话打包参数（未开启时为None）"""
+    pack_rows = run_config.get('pack_rows')
+    return PackOptions(max_rows=pack_rows) if pack_rows else None
+
+def submit_background(job_id: str, llm, run_config: dict) -> bool:
+    """提交到共享队列后台运行，本会话只轮询进度；任务已在队列中时提示并返回False"""
     try:
-        return json.loads(text)
-    except:
-        json_pattern = r'```json\s*({.*?})\s*```'
-        match = re.search(json_pattern, text, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(1))
-            except:
-                pass
+        get_scheduler().submit(
+            job_id,
+            llm,
+            max_workers=run_config['max_workers'] if run_config['use_parallel'] else 1,
+            retry=RetryPolicy(max_retries=run_config['max_retries']),
+            cache=get_result_cache() if run_config['use_cache'] else None,
+            engine=run_config.get('engine', ENGINE_THREAD),
+            prompt=build_prompt(run_config),
+            dedup_threshold=run_config.get('dedup_threshold'),
+            usage=st.session_state.usage_meter,
+            packing=build_packing(run_config)
+        )
+    except ValueError as e:
+        st.error(f"❌ {str(e)}")
+        return False
+    st.session_state.watch_job_id = job_id
+    st.session_state.cache_stats = None
+    return True
+
+def save_upload(uploaded_file) -> str:
+    """流式模式下将上传文件落盘到任务目录，同一文件只写一次"""
+    upload_dir = os.path.join(get_job_store().job_dir, "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, f"{uploaded_file.file_id}_{os.path.basename(uploaded_file.name)}")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+    return path
+
+@st.cache_data(show_spinner=False)
+def cached_row_count(path: str) -> int:
+    return count_rows(path)
+
+@st.cache_data(show_spinner=False)
+def cached_preview(path: str) -> pd.DataFrame:
+    """流式模式的预览（Excel的 nrows 仍需解析整张工作表，只读取一次）"""
+    return read_preview(path)
+
+def job_result_file(job_id: str) -> str:
+    """生成任务的完整结果CSV（原始各列 + 质检结果），流式任务逐块重读源文件"""
+    return export_job_csv(
+        get_job_store(), job_id, os.path.join(get_job_store().job_dir, f"{job_id}.result.csv")
+    )
+
+def load_job_results(job_id: str):
+    """将任务库中的（部分）结果载入结果展示区"""
+    job_store = get_job_store()
+    job = job_store.get_job(job_id)
+    st.session_state.processed_data = job_store.results_frame(job_id)
+    st.session_state.processing_complete = True
+    st.session_state.run_config = job['config'] or None
+    st.session_state.job_id = job_id
+    st.session_state.result_file = job_result_file(job_id) if job['source_path'] else None
+
+def make_progress_callback(progress_bar, status_text):
+    """将进度条与状态文本包装为引擎的进度回调"""
+    def on_progress(completed: int, total: int):
+        progress_bar.progress(completed / total if total else 1.0)
+        status_text.text(f"🔄 处理进度: {completed}/{total}")
+    return on_progress
+
+def result_status(result: str) -> str:
+    if result == SKIP_RESULT:
+        return "⏭️"
+    if is_reused_result(result):
+        return "♻️"
+    return "❌" if is_error_result(result) else "✅"
+
+def make_live_view(monitor: RunMonitor, refresh_interval: float = 0.5):
+    """运行期实时视图：追加最近完成的行，显示滚动吞吐、调用延迟与错误计数
+
+    按 refresh_interval 节流刷新，避免每完成一行都向浏览器推送一次。
+    返回 (on_result, render)，运行结束后再调用一次 render 显示最终状态。
+    """
+    stats_text = st.empty()
+    recent_table = st.empty()
+    last_render = [0.0]
+
+    def render():
+        snap = monitor.snapshot()
+        latency = (
+            f"{snap['latency_p50']:.1f}s / p95 {snap['latency_p95']:.1f}s / p99 {snap['latency_p99']:.1f}s"
+            if snap['latency_p50'] is not None else "-"
+        )
+        stats_text.caption(
+            f"⏱️ 已用 {snap['elapsed']:.0f}s ｜ 吞吐 {snap['rows_per_min']:.1f} 行/分钟 ｜ "
+            f"调用延迟 p50 {latency} ｜ 失败 {snap['failed']} 行（可重试 {snap['retryable']}）｜ "
+            f"空值跳过 {snap['skipped']} ｜ 复用 {snap['reused']} ｜ 限流 {snap['throttled']} 次"
+        )
+        recent_table.dataframe(
+            pd.DataFrame(
+                [{'行号': idx + 1, '状态': result_status(result), RESULT_COLUMN: result[:80]}
+                 for idx, result in monitor.recent],
+                columns=['行号', '状态', RESULT_COLUMN]
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
+
+    def on_result(idx: int, result: str):
+        monitor.record(idx, result)
+        now = time.monotonic()
+        if now - last_render[0] >= refresh_interval:
+            last_render[0] = now
+            render()
+
+    return on_result, render
+
+@st.fragment(run_every=2)
+def render_background_job():
+    """后台任务进度：每2秒轮询一次调度器，任务结束后载入结果并刷新整个页面"""
+    job_id = st.session_state.watch_job_id
+    scheduler = get_scheduler()
+    status = scheduler.status(job_id)
+    if status is None:
+        # 服务重启后调度器中没有该任务，已完成的行仍在任务库中
+        st.session_state.watch_job_id = None
+        st.rerun()
+    if status['state'] == STATE_QUEUED:
+        st.info(f"⏳ 任务 {job_id} 排队中（第 {status['position']} 位），前面的任务完成后自动开始")
+    elif status['state'] == STATE_RUNNING:
+        total = status['total']
+        st.progress(status['completed'] / total if total else 1.0)
+        st.text(f"🔄 处理进度: {status['completed']}/{total}（当前每个任务的并发份额 {scheduler.fair_share()}）")
+        job = scheduler.get(job_id)
+        if job.monitor is not None:
+            make_live_view(job.monitor)[1]()
+    else:
+        st.session_state.watch_job_id = None
+        load_job_results(job_id)
+        if status['state'] == STATE_COMPLETED:
+            st.session_state.job_notice = ("success", f"✅ 后台任务 {job_id} 已完成")
+        elif status['state'] == STATE_FAILED:
+            st.session_state.job_notice = (
+                "error", f"❌ 后台任务 {job_id} 运行失败: {status['error']}（已完成的行已保存，可在侧边栏继续运行）"
+            )
+        else:
+            st.session_state.job_notice = (
+                "warning", f"⏹️ 后台任务 {job_id} 已取消，已完成 {status['completed']}/{status['total']} 行"
+            )
+        st.rerun()
+    if st.button("⏹️ 取消任务", key="cancel_background_job"):
+        scheduler.cancel(job_id)
+        st.caption("已请求取消，正在处理中的行完成后停止")
+
+def format_seconds(value) -> str:
+    return f"{value:.2f}s" if value is not None else "-"
+
+def render_run_metrics(job_id: str):
+    """任务的逐行指标面板：各阶段耗时分位数、吞吐、错误率与最慢的行，可导出为 JSON/CSV/Prometheus"""
+    frame = get_job_store().metrics_frame(job_id)
+    if frame.empty:
+        return
+    summary = summarize_metrics(frame)
+    with st.expander("📈 运行指标"):
+        total_latency = summary['latency']['total']
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("整行耗时 p50", format_seconds(total_latency['p50']))
+            st.metric("错误率", f"{summary['error_rate'] * 100:.1f}%")
+        with col2:
+            st.metric("整行耗时 p95", format_seconds(total_latency['p95']))
+            st.metric("重试次数", summary['retries'])
+        with col3:
+            st.metric("整行耗时 p99", format_seconds(total_latency['p99']))
+            st.metric("API请求数", summary['requests'])
+        with col4:
+            st.metric("吞吐", f"{summary['throughput_rows_per_min']:.1f} 行/分钟")
+            st.metric("前缀缓存命中率", f"{summary['tokens']['cache_hit_rate'] * 100:.1f}%")
+        
+        st.dataframe(
+            pd.DataFrame([
+                {'阶段': label, **{name: format_seconds(summary['latency'][key][name])
+                                  for name in ('p50', 'p95', 'p99', 'max')}}
+                for key, label in LATENCY_STAGES
+            ]),
+            use_container_width=True,
+            hide_index=True
+        )
+        st.caption("排队等待为开始处理到首次发出请求的时间，主要来自并发窗口与RPM/TPM配额；调用耗时高说明慢在服务商；首token耗时只统计流式输出的行")
+        if summary['aborted_streams']:
+            st.caption(f"流式输出因偏离格式或字段过长提前中止 {summary['aborted_streams']} 次（已重新请求）")
+        if summary['error_classes']:
+            st.caption("失败类别：" + "，".join(f"{name} {count} 行" for name, count in summary['error_classes'].items()))
+        
+        st.markdown("**耗时最长的10行**")
+        st.dataframe(frame.nlargest(10, '总耗时'), use_container_width=True, hide_index=True)
         
-        json_pattern = r'\{.*\}'
-        match = re.search(json_pattern, text, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group())
-            except:
-                pass
-    
-    return {}
-
-def get_json_sections(json_data: Dict[str, Any]) -> List[str]:
-    """获取JSON中的所有顶级键名"""
-    return list(json_data.keys())
-
-def extract_section_content(json_data: Dict[str, Any], section: str) -> Any:
-    """提取指定section的内容"""
-    return json_data.get(section, None)
-
-def process_single_row(row_data, llm):
-    """处理单行数据"""
-    idx, value = row_data
-    if pd.isna(value) or str(value).strip() == "":
-        return idx, "⏭️ 空值跳过"
-    
-    result = analyze_conversation(llm, str(value))
-    return idx, result
-
-def process_batch_parallel(data: pd.DataFrame, column_name: str, llm: ChatOpenAI,
-                          progress_bar=None, status_text=None, max_workers: int = 5) -> pd.DataFrame:
-    """并行批量处理数据"""
-    total_rows = len(data)
-    
-    tasks = [(idx, value) for idx, value in enumerate(data[column_name])]
-    results = [None] * total_rows
-    completed = 0
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_idx = {
-            executor.submit(process_single_row, task, llm): task[0] 
-            for task in tasks
+        dl_col1, dl_col2, dl_col3 = st.columns(3)
+        with dl_col1:
+            st.download_button("📥 指标JSON", metrics_to_json(frame, summary),
+                               file_name=f"metrics_{job_id}.json", mime="application/json")
+        with dl_col2:
+            st.download_button("📥 逐行指标CSV", frame.to_csv(index=False).encode('utf-8-sig'),
+                               file_name=f"metrics_{job_id}.csv", mime="text/csv")
+        with dl_col3:
+            st.download_button("📥 Prometheus", metrics_to_prometheus(summary, {'job_id': job_id}),
+                               file_name=f"metrics_{job_id}.prom", mime="text/plain")
+
+def render_result_page(data: pd.DataFrame):
+    """分页展示结果表，每次重跑只向浏览器发送当前页"""
+    page_col1, page_col2 = st.columns([1, 3])
+    with page_col1:
+        page_size = st.selectbox("每页行数", [20, 50, 100, 200], key="result_page_size")
+    page_count = max(1, math.ceil(len(data) / page_size))
+    with page_col2:
+        page = st.number_input(
+            f"页码（共 {page_count} 页，{len(data)} 行）",
+            min_value=1,
+            max_value=page_count,
+            value=1,
+            key="result_page"
+        )
+    start = (int(page) - 1) * page_size
+    st.dataframe(data.iloc[start:start + page_size], use_container_width=True)
+
+def get_json_sections_state(data: pd.DataFrame) -> dict:
+    """按结果集指纹缓存解析出的JSON与已展开的section表，结果不变时重跑不再重复解析"""
+    fingerprint = result_fingerprint(data[RESULT_COLUMN])
+    state = st.session_state.json_sections
+    if state is None or state['fingerprint'] != fingerprint:
+        parsed = parse_result_json(data[RESULT_COLUMN])
+        state = {
+            'fingerprint': fingerprint,
+            'parsed': parsed,
+            'sections': collect_sections(parsed),
+            'tables': {},
+            'csv': {},
         }
+        st.session_state.json_sections = state
+    return state
+
+def get_result_tables_state(data: pd.DataFrame) -> dict:
+    """按任务与结果指纹缓存结构化结果表；任务结果另存为Parquet，重新打开任务时直接读取"""
+    key = (st.session_state.job_id, result_fingerprint(data[RESULT_COLUMN]))
+    state = st.session_state.result_tables
+    if state is None or state['key'] != key:
+        if st.session_state.job_id:
+            tables = load_job_tables(get_job_store(), st.session_state.job_id)
+        else:
+            tables = build_result_tables(data[RESULT_COLUMN])
+        state = {'key': key, 'tables': tables, 'parquet': {}}
+        st.session_state.result_tables = state
+    return state
+
+def get_tables_parquet(state: dict, name: str) -> bytes:
+    if name not in state['parquet']:
+        output = io.BytesIO()
+        write_parquet(output, getattr(state['tables'], name))
+        state['parquet'][name] = output.getvalue()
+    return state['parquet'][name]
+
+def render_result_dashboard(data: pd.DataFrame):
+    """汇总看板：质量等级分布、问题类型频次与各项指标的分位数，可按输入表格的列分组"""
+    state = get_result_tables_state(data)
+    metrics, items = state['tables'].metrics, state['tables'].items
+    analyzed = analyzed_rows(metrics)
+    if analyzed.empty:
+        return
+    with st.expander("📈 汇总看板", expanded=True):
+        group_options = [column for column in data.columns if column != RESULT_COLUMN]
+        group_column = st.selectbox("分组列（可选）", ["不分组", *group_options], key="dashboard_group")
+        by = None
+        if group_column != "不分组":
+            # 原始行号从1开始，对应结果表的行索引
+            by = data[group_column].reindex(analyzed[ROW_NUMBER_COLUMN].to_numpy() - 1)
         
-        for future in as_completed(future_to_idx):
-            idx, result = future.result()
-            results[idx] = result
-            completed += 1
-            
-            if progress_bar:
-                progress = completed / total_rows
-                progress_bar.progress(progress)
-            if status_text:
-                status_text.text(f"🔄 处理进度: {completed}/{total_rows}")
-    
-    result_df = data.copy()
-    result_df['质检结果'] = results
-    
-    return result_df
-
-def process_batch(data: pd.DataFrame, column_name: str, llm: ChatOpenAI,
-                 progress_bar=None, status_text=None) -> pd.DataFrame:
-    """顺序批量处理数据"""
-    results = []
-    total_rows = len(data)
-    
-    for idx, value in enumerate(data[column_name]):
-        if pd.isna(value) or str(value).strip() == "":
-            results.append("⏭️ 空值跳过")
-            continue
-            
-        result = analyze_conversation(llm, str(value))
-        results.append(result)
+        st.markdown("**总体质量等级分布**")
+        st.dataframe(grade_distribution(analyzed, by), use_container_width=True)
+        if by is not None:
+            st.dataframe(grade_distribution(analyzed, by, normalize=True), use_container_width=True)
+            st.caption("第二张表为组内占比(%)")
         
-        if progress_bar:
-            progress = (idx + 1) / total_rows
-            progress_bar.progress(progress)
-        if status_text:
-            status_text.text(f"🔄 处理进度: {idx + 1}/{total_rows}")
+        st.markdown("**问题类型频次**")
+        top_n = st.number_input("显示前N个", min_value=5, max_value=200, value=20, step=5, key="dashboard_top_n")
+        st.dataframe(issue_frequency(items, conversations=len(analyzed)).head(int(top_n)),
+                     use_container_width=True, hide_index=True)
         
-        time.sleep(0.5)
-    
-    result_df = data.copy()
-    result_df['质检结果'] = results
-    
-    return result_df
+        st.markdown("**指标分位数**")
+        st.dataframe(metric_percentiles(analyzed, by=by), use_container_width=True)
+        status_counts = metrics[STATUS_COLUMN].value_counts()
+        st.caption("统计 " + "，".join(f"{name} {count} 行" for name, count in status_counts.items() if count)
+                   + "；汇总只计成功与复用的行，占比为整体评估中的百分数")
+        
+        if parquet_available():
+            dl_col1, dl_col2 = st.columns(2)
+            with dl_col1:
+                st.download_button("📥 每段对话指标 (Parquet)", get_tables_parquet(state, 'metrics'),
+                                   file_name="result_metrics.parquet", mime="application/octet-stream")
+            with dl_col2:
+                st.download_button("📥 问题与话术明细 (Parquet)", get_tables_parquet(state, 'items'),
+                                   file_name="result_items.parquet", mime="application/octet-stream")
+
+def get_section_table(state: dict, section: str) -> pd.DataFrame:
+    if section not in state['tables']:
+        state['tables'][section] = explode_section(state['parsed'], section)
+    return state['tables'][section]
+
+def get_section_csv(state: dict, section: str) -> str:
+    if section not in state['csv']:
+        state['csv'][section] = get_section_table(state, section).to_csv(index=False)
+    return state['csv'][section]
+
+def build_download(fmt: str) -> bytes:
+    """生成完整结果的导出文件；流式任务从结果CSV逐块转换，不整体加载"""
+    data = st.session_state.processed_data
+    result_file = st.session_state.result_file
+    streamed = bool(result_file) and os.path.exists(result_file)
+    if fmt == 'csv':
+        if streamed:
+            with open(result_file, "rb") as f:
+                return f.read()
+        return data.to_csv(index=False).encode('utf-8')
+    output = io.BytesIO()
+    if fmt == 'xlsx':
+        if streamed:
+            write_xlsx(output, *iter_table_rows(result_file), sheet_name='质检结果')
+        else:
+            frame_to_xlsx(output, data, sheet_name='质检结果')
+    elif streamed:
+        csv_to_parquet(result_file, output)
+    else:
+        write_parquet(output, data)
+    return output.getvalue()
+
+def get_download(fmt: str, fingerprint: str, build: bool = True):
+    """按任务与结果指纹缓存导出文件，结果变化时丢弃旧文件；build=False 时只查缓存"""
+    key = (st.session_state.job_id, fingerprint)
+    artifacts = st.session_state.download_artifacts
+    if artifacts is None or artifacts['key'] != key:
+        artifacts = {'key': key, 'files': {}}
+        st.session_state.download_artifacts = artifacts
+    if fmt not in artifacts['files'] and build:
+        artifacts['files'][fmt] = build_download(fmt)
+    return artifacts['files'].get(fmt)
 
 # 侧边栏配置
 with st.sidebar:
@@ -361,12 +731,33 @@ with st.sidebar:
             placeholder="https://api.deepseek.com/v1"
         )
         
+        with st.expander("🔀 多后端（可选）"):
+            backend_config = st.text_area(
+                "后端配置 (JSON)",
+                value=os.getenv("QA_BACKENDS", ""),
+                key="backend_config",
+                height=150,
+                help="多个OpenAI兼容端点的JSON列表（或配置文件路径），每项含 base_url、api_key 或 api_key_env、model，"
+                     "可选 weight、rpm、tpm；填写后忽略上方的密钥与URL，请求按权重分配到各后端，出错或限流时自动切换",
+                placeholder='[{"base_url": "https://api.deepseek.com/v1", "api_key_env": "DEEPSEEK_API_KEY", '
+                            '"model": "deepseek-chat", "weight": 2}]'
+            )
+            if backend_config.strip():
+                try:
+                    configured_backends = load_backend_configs(backend_config.strip())
+                    st.caption("已配置后端：" + "、".join(
+                        f"{backend.name}（权重 {backend.weight:g}）" for backend in configured_backends
+                    ))
+                except (OSError, ValueError) as e:
+                    st.error(f"❌ 多后端配置无效: {str(e)}")
+        has_credentials = bool(api_key or backend_config.strip())
+        
         # 测试连接按钮
         if st.button("🔄 测试连接"):
-            if api_key:
+            if has_credentials:
                 with st.spinner("测试连接中..."):
                     try:
-                        test_llm = initialize_llm(api_key, base_url)
+                        test_llm = init_llm_or_report(api_key, base_url, json_mode=False)
                         if test_llm:
                             response = test_llm.invoke([HumanMessage(content="你好")])
                             st.success("✅ 连接成功！")
@@ -379,6 +770,103 @@ with st.sidebar:
     
     st.markdown("---")
     
+    with st.container():
+        st.markdown("#### 💾 结果缓存")
+        result_cache = get_result_cache()
+        st.caption(
+            f"已缓存 {len(result_cache)} 条，占用 {result_cache.size_bytes() / 1024 / 1024:.1f} MB，"
+            f"累计命中率 {result_cache.hit_rate * 100:.1f}%"
+        )
+        if st.button("🧹 清空缓存"):
+            result_cache.clear()
+            st.success("✅ 缓存已清空")
+    
+    st.markdown("---")
+    
+    with st.container():
+        st.markdown("#### 🗂️ 任务记录")
+        job_store = get_job_store()
+        recent_jobs = job_store.list_jobs()
+        if recent_jobs:
+            # 在共享队列中排队或运行的任务
+            active_jobs = {
+                status['job_id']: status['state'] for status in get_scheduler().jobs()
+                if status['state'] in (STATE_QUEUED, STATE_RUNNING)
+            }
+            status_marks = {'completed': ' ✅', 'failed': ' ❌', 'cancelled': ' ⏹️'}
+            job_labels = {
+                job['job_id']: f"{job['job_id']} · {job['source_name']} · "
+                               f"{job['completed_rows']}/{job['total_rows']}"
+                               f"{status_marks.get(job['status'], '')}"
+                               f"{' 🛰️' if job['job_id'] in active_jobs else ''}"
+                for job in recent_jobs
+            }
+            selected_job_id = st.selectbox(
+                "选择任务",
+                list(job_labels),
+                format_func=job_labels.get,
+                help="每完成一行即保存，页面刷新或断线后可查看部分结果或继续运行"
+            )
+            selected_job = next(job for job in recent_jobs if job['job_id'] == selected_job_id)
+            job_col1, job_col2 = st.columns(2)
+            with job_col1:
+                if st.button("📥 查看结果", use_container_width=True):
+                    load_job_results(selected_job_id)
+            with job_col2:
+                if selected_job_id in active_jobs:
+                    resume_clicked = False
+                    if st.button("📡 查看进度", use_container_width=True):
+                        st.session_state.watch_job_id = selected_job_id
+                else:
+                    resume_clicked = st.button(
+                        "▶️ 继续运行",
+                        use_container_width=True,
+                        disabled=selected_job['completed_rows'] >= selected_job['total_rows']
+                    )
+            if resume_clicked:
+                if not has_credentials:
+                    st.error("❌ 请先输入DeepSeek API密钥")
+                elif not selected_job['config']:
+                    st.error("❌ 任务缺少运行配置，无法继续")
+                else:
+                    job_config = selected_job['config']
+                    llm = init_llm_or_report(api_key, base_url, job_config.get('json_mode', True))
+                    if llm is not None and job_config.get('background'):
+                        if submit_background(selected_job_id, llm, job_config):
+                            st.success("✅ 已提交到后台队列，已完成的行不会重复处理")
+                    elif llm is not None:
+                        run_engine, run_workers = foreground_engine(job_config)
+                        with get_scheduler().foreground(build_limiter(job_config)) as limiter:
+                            progress_bar = st.progress(0)
+                            status_text = st.empty()
+                            on_result, render_live = make_live_view(RunMonitor(
+                                selected_job['total_rows'], selected_job['completed_rows'], limiter
+                            ))
+                            run_with_cache_stats(
+                                get_result_cache() if job_config['use_cache'] else None,
+                                run_job,
+                                job_store,
+                                selected_job_id,
+                                llm,
+                                make_progress_callback(progress_bar, status_text),
+                                run_workers,
+                                limiter,
+                                RetryPolicy(max_retries=job_config['max_retries']),
+                                on_result=on_result,
+                                engine=run_engine,
+                                prompt=build_prompt(job_config),
+                                dedup_threshold=job_config.get('dedup_threshold'),
+                                usage=st.session_state.usage_meter,
+                                packing=build_packing(job_config)
+                            )
+                        render_live()
+                        load_job_results(selected_job_id)
+                        st.success("✅ 任务已完成")
+        else:
+            st.caption("暂无任务记录")
+    
+    st.markdown("---")
+    
     with st.container():
         st.markdown("#### 📁 文件管理")
         uploaded_file = st.file_uploader(
@@ -387,25 +875,36 @@ with st.sidebar:
             help="支持CSV、Excel文件",
             label_visibility="collapsed"
         )
+        stream_mode = st.checkbox(
+            "🌊 大文件流式模式",
+            help="不整体加载文件：只读取表头与预览，处理时按块读取质检列，结果写入任务目录下的CSV"
+        )
 
 # 主内容区域
 if uploaded_file is not None:
     try:
         # 读取文件
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
+        source_path = None
+        table = None
+        if stream_mode:
+            source_path = save_upload(uploaded_file)
+            df = cached_preview(source_path)
+            row_count = cached_row_count(source_path)
         else:
-            df = pd.read_excel(uploaded_file)
+            # 解析结果按内容缓存，脚本重跑时不再重新读取文件
+            table = get_upload_cache().load(uploaded_file.file_id, uploaded_file.name, uploaded_file.getvalue)
+            df = table.frame
+            row_count = len(table)
         
         # 文件信息展示
         col1, col2, col3 = st.columns([2,1,1])
         with col1:
             st.success(f"✅ 成功加载文件: **{uploaded_file.name}**")
         with col2:
-            file_size = len(uploaded_file.getvalue()) / 1024
+            file_size = uploaded_file.size / 1024
             st.info(f"📊 文件大小: {file_size:.1f} KB")
         with col3:
-            st.info(f"📋 数据行数: {len(df)}")
+            st.info(f"📋 数据行数: {row_count}")
         
         # 数据预览卡片
         with st.container():
@@ -418,10 +917,12 @@ if uploaded_file is not None:
         with col1:
             st.markdown("### 🎯 处理配置")
             columns = df.columns.tolist()
+            text_column = table.text_column() if table is not None else None
             selected_column = st.selectbox(
                 "选择质检列",
                 columns,
-                help="选择包含需要质检文本的列"
+                index=columns.index(text_column) if text_column in columns else 0,
+                help="选择包含需要质检文本的列（默认选中平均长度最长的文本列）"
             )
             
             # 显示选中列的示例
@@ -429,25 +930,172 @@ if uploaded_file is not None:
                 sample_data = df[selected_column].head()
                 for i, text in enumerate(sample_data, 1):
                     st.markdown(f"**第{i}行:** {text}")
+            
+            banned_screen = st.selectbox(
+                "🚫 违禁词本地预检",
+                [SCREEN_OFF, SCREEN_HINT, SCREEN_REPLACE],
+                format_func={
+                    SCREEN_OFF: "关闭",
+                    SCREEN_HINT: "命中作为提示发给模型",
+                    SCREEN_REPLACE: "本地结果替代模型检测",
+                }.get,
+                help="按 banned_phrases.csv 词典在本地扫描销售发言；替代模式下“销售违禁词问题”完全由词典命中决定"
+            )
+            if banned_screen != SCREEN_OFF:
+                if get_banned_screen() is None:
+                    st.warning("⚠️ 未找到违禁词词典 banned_phrases.csv，本地预检不会生效")
+                elif not stream_mode:
+                    banned_hits = scan_banned_column(
+                        uploaded_file.file_id, selected_column, table.column(selected_column)
+                    )
+                    st.caption(
+                        f"🚫 本地预检：{banned_hits['原始行号'].nunique()} 行命中，共 {len(banned_hits)} 处"
+                    )
+                    if not banned_hits.empty:
+                        with st.expander("查看命中明细"):
+                            st.dataframe(banned_hits.head(200), use_container_width=True, hide_index=True)
+            
+            use_dedup = st.checkbox(
+                "♻️ 近重复对话复用结果",
+                value=False,
+                help="运行前按MinHash相似度对对话聚类，每簇只调用一次API，其余行复用代表行的结果（结果前带复用标记）"
+            )
+            dedup_threshold = None
+            if use_dedup:
+                dedup_threshold = st.slider(
+                    "相似度阈值",
+                    min_value=0.7,
+                    max_value=1.0,
+                    value=DEFAULT_SIMILARITY,
+                    step=0.01,
+                    help="估计的字符5-gram Jaccard相似度，达到阈值的对话视为近重复；1.0 表示只合并内容相同的对话"
+                )
         
         with col2:
             st.markdown("### ⚡ 性能配置")
             use_parallel = st.checkbox("🚀 启用并行处理", value=True)
-            max_workers = st.slider(
-                "并发线程数",
-                min_value=1,
+            engine = st.selectbox(
+                "执行引擎",
+                [ENGINE_THREAD, ENGINE_ASYNC, ENGINE_BATCH],
+                format_func={
+                    ENGINE_THREAD: "线程池",
+                    ENGINE_ASYNC: "异步协程 (asyncio)",
+                    ENGINE_BATCH: "离线批处理 (/v1/batches)",
+                }.get,
+                help="异步引擎在单线程内维持大量在途请求并共享连接池，适合高配额的服务商；"
+                     "离线批处理将所有行一次性提交到服务商的批处理接口，适合不急需结果的大任务（需服务商支持）"
+            )
+            if engine == ENGINE_BATCH:
+                st.caption(
+                    "📦 批处理在服务商端排队执行（最长24小时），不占用本地并发与RPM配额；"
+                    "页面关闭后可在侧边栏选择该任务“继续运行”取回结果，已提交的批次不会重复提交"
+                )
+            background = st.checkbox(
+                "🛰️ 后台运行（共享队列）",
+                value=True,
+                help="提交到进程内共享的任务队列，关闭页面后任务继续运行，此时下方的RPM/TPM与自适应并发设置不生效；"
+                     "不勾选时在本会话内运行，下方设置在全局配额之外另行生效。两种方式都与其他会话的任务共用全局"
+                     "RPM/TPM与并发配额并按任务公平分配（异步引擎改用线程池）"
+            )
+            if engine == ENGINE_ASYNC:
+                max_workers = st.number_input(
+                    "在途请求上限",
+                    min_value=1,
+                    max_value=1000,
+                    value=50,
+                    help="同时等待响应的请求数上限，启用自适应并发时为并发窗口的最大值"
+                )
+            else:
+                max_workers = st.slider(
+                    "并发线程数",
+                    min_value=1,
+                    max_value=10,
+                    value=3,
+                    help="同时处理的API调用数量上限，启用自适应并发时为并发窗口的最大值"
+                )
+            pack_rows = None
+            if st.checkbox(
+                "📦 短对话打包",
+                value=False,
+                disabled=engine != ENGINE_THREAD,
+                help="把相邻的短对话合并为一个请求，分摊系统提示的token与请求往返；"
+                     "某段结果缺失或不合格时该段自动改为单独请求（仅线程池引擎）"
+            ) and engine == ENGINE_THREAD:
+                pack_rows = st.slider(
+                    "每个请求最多对话数",
+                    min_value=2,
+                    max_value=20,
+                    value=DEFAULT_PACKING.max_rows,
+                    help=f"只打包不超过 {DEFAULT_PACKING.row_tokens} token 的短对话，每个请求中对话合计不超过 "
+                         f"{DEFAULT_PACKING.pack_tokens} token"
+                )
+            adaptive = st.checkbox(
+                "📈 自适应并发",
+                value=True,
+                help="调用成功时逐步提升并发，遇到429/5xx限流时自动减半"
+            )
+            rpm_limit = st.number_input(
+                "每分钟请求数上限 (RPM)",
+                min_value=0,
+                value=20,
+                help="所有线程共享的请求配额，0表示不限制"
+            )
+            tpm_limit = st.number_input(
+                "每分钟token上限 (TPM)",
+                min_value=0,
+                value=0,
+                step=10000,
+                help="所有线程共享的token配额（按输入长度估算），0表示不限制"
+            )
+            max_retries = st.number_input(
+                "最大重试次数",
+                min_value=0,
                 max_value=10,
                 value=3,
-                help="同时处理的API调用数量，建议不超过5个"
+                help="超时、429、5xx等可重试错误按指数退避自动重试的次数"
+            )
+            chunk_tokens = st.number_input(
+                "长对话切分长度 (token)",
+                min_value=0,
+                value=DEFAULT_BUDGET.chunk_tokens,
+                step=500,
+                help="对话超过该token数时按行切分为多段并行分析，再合并结果并重新计算整体评估；0表示不切分。每次请求的max_tokens按输入长度自动设置"
+            )
+            json_mode = st.checkbox(
+                "🧾 JSON模式",
+                value=True,
+                help="要求模型只输出JSON对象（response_format=json_object）；输出结构不符合提示词中的格式时自动附上问题重新请求一次"
+            )
+            stream_output = st.checkbox(
+                "📶 流式输出",
+                value=False,
+                disabled=engine == ENGINE_BATCH,
+                help="边接收边检查JSON结构：出现格式以外的字段、字段类型不符或单个字段过长时立即中止并重新请求，不再等待整段生成；同时记录首token耗时"
+            )
+            section_tokens = DEFAULT_STREAMING.section_tokens
+            if stream_output and engine != ENGINE_BATCH:
+                section_tokens = st.number_input(
+                    "单个字段输出上限 (token)",
+                    min_value=100,
+                    value=DEFAULT_STREAMING.section_tokens,
+                    step=100,
+                    help="流式输出时单个顶级字段（如“对话质量问题”）超过该长度即判定为失控输出并中止"
+                )
+            use_cache = st.checkbox(
+                "💾 启用结果缓存",
+                value=True,
+                help="相同对话、提示词与模型参数的结果直接复用，不再调用API"
             )
             
             # 性能提示
             with st.expander("ℹ️ 性能提示"):
                 st.markdown("""
-                - **顺序处理**: 每行0.5秒间隔
+                - **顺序处理**: 按RPM/TPM配额节流
                 - **并行处理**: 3线程约提升2-3倍速度
-                - **建议**: 根据API限流调整线程数
-                - **DeepSeek限制**: 每分钟最多20次调用
+                - **异步引擎**: 在途请求可达数百个，吞吐取决于服务商配额
+                - **自适应并发**: 成功时线性增加、限流时减半（AIMD）
+                - **自动重试**: 瞬时错误按指数退避重试，仍失败的行可单独重试
+                - **DeepSeek限制**: 每分钟最多20次调用，请据此设置RPM
                 """)
         
         # 处理按钮区域
@@ -455,44 +1103,96 @@ if uploaded_file is not None:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.button("🚀 开始智能质检", type="primary", use_container_width=True):
-                if not api_key:
+                if not has_credentials:
                     st.error("❌ 请先输入DeepSeek API密钥")
+                elif engine == ENGINE_BATCH and backend_config.strip():
+                    st.error("❌ 离线批处理不支持多后端，请清空多后端配置")
                 else:
                     with st.spinner("🔄 初始化模型..."):
-                        llm = initialize_llm(api_key, base_url)
+                        llm = init_llm_or_report(api_key, base_url, json_mode)
                         if llm is None:
                             st.error("❌ 模型初始化失败")
                         else:
-                            progress_bar = st.progress(0)
-                            status_text = st.empty()
-                            
-                            with st.spinner("🔄 正在处理数据..."):
-                                if use_parallel:
-                                    processed_df = process_batch_parallel(
-                                        df, 
-                                        selected_column, 
-                                        llm, 
-                                        progress_bar, 
-                                        status_text,
-                                        max_workers
-                                    )
-                                else:
-                                    processed_df = process_batch(
-                                        df, 
-                                        selected_column, 
-                                        llm, 
-                                        progress_bar, 
-                                        status_text
+                            run_config = {
+                                'column': selected_column,
+                                'use_parallel': use_parallel,
+                                'engine': engine,
+                                'background': background,
+                                'max_workers': max_workers,
+                                'adaptive': adaptive,
+                                'rpm': rpm_limit,
+                                'tpm': tpm_limit,
+                                'max_retries': max_retries,
+                                'chunk_tokens': chunk_tokens,
+                                'json_mode': json_mode,
+                                'stream_output': stream_output and engine != ENGINE_BATCH,
+                                'section_tokens': section_tokens,
+                                'banned_screen': banned_screen,
+                                'dedup_threshold': dedup_threshold,
+                                'pack_rows': pack_rows,
+                                'use_cache': use_cache,
+                            }
+                            job_store = get_job_store()
+                            job_id = job_store.create_job(
+                                None if stream_mode else table.with_compact_column(selected_column),
+                                selected_column,
+                                uploaded_file.name,
+                                run_config,
+                                source_path=source_path
+                            )
+                            st.session_state.job_id = job_id
+                            st.session_state.run_config = run_config
+                            st.session_state.result_file = job_result_file(job_id) if stream_mode else None
+                            if background:
+                                if submit_background(job_id, llm, run_config):
+                                    st.info(f"🛰️ 任务ID: {job_id}（已提交到后台队列，关闭页面后继续运行，可在侧边栏任务记录中查看进度）")
+                            else:
+                                progress_bar = st.progress(0)
+                                status_text = st.empty()
+                                st.info(f"🗂️ 任务ID: {job_id}（每完成一行即保存，页面刷新后可在侧边栏继续运行）")
+                                run_engine, run_workers = foreground_engine(run_config)
+                                
+                                with st.spinner("🔄 正在处理数据..."), \
+                                        get_scheduler().foreground(build_limiter(run_config)) as limiter:
+                                    on_result, render_live = make_live_view(RunMonitor(row_count, limiter=limiter))
+                                    processed_df = run_with_cache_stats(
+                                        get_result_cache() if use_cache else None,
+                                        run_job,
+                                        job_store,
+                                        job_id,
+                                        llm,
+                                        make_progress_callback(progress_bar, status_text),
+                                        run_workers,
+                                        limiter,
+                                        RetryPolicy(max_retries=max_retries),
+                                        on_result=on_result,
+                                        engine=run_engine,
+                                        prompt=build_prompt(run_config),
+                                        dedup_threshold=dedup_threshold,
+                                        usage=st.session_state.usage_meter,
+                                        packing=build_packing(run_config)
                                     )
-                            
-                            st.session_state.processed_data = processed_df
-                            st.session_state.processing_complete = True
-                            st.success("✅ 处理完成！")
-                            st.balloons()
+                                render_live()
+                                
+                                st.session_state.processed_data = processed_df
+                                st.session_state.processing_complete = True
+                                st.success("✅ 处理完成！")
+                                st.balloons()
                 
     except Exception as e:
         st.error(f"❌ 文件读取失败: {str(e)}")
 
+# 后台任务进度
+if st.session_state.watch_job_id:
+    st.markdown("---")
+    st.markdown("### 🛰️ 后台任务")
+    render_background_job()
+
+if st.session_state.job_notice:
+    notice_kind, notice_text = st.session_state.job_notice
+    getattr(st, notice_kind)(notice_text)
+    st.session_state.job_notice = None
+
 # 结果展示区域
 if st.session_state.processing_complete and st.session_state.processed_data is not None:
     st.markdown("---")
@@ -501,9 +1201,11 @@ if st.session_state.processing_complete and st.session_state.processed_data is n
     # 结果统计卡片
     col1, col2, col3, col4 = st.columns(4)
     
-    total_rows = len(st.session_state.processed_data)
-    success_rows = len([r for r in st.session_state.processed_data['质检结果'] 
-                       if not str(r).startswith(('❌', '⚠️', '⏭️'))])
+    result_column = st.session_state.processed_data[RESULT_COLUMN]
+    pending_rows = int(result_column.isna().sum())
+    total_rows = len(st.session_state.processed_data) - pending_rows
+    success_rows = len([r for r in result_column.dropna() 
+                       if not is_error_result(r)])
     
     with col1:
         st.metric("📊 总处理行数", total_rows)
@@ -512,112 +1214,181 @@ if st.session_state.processing_complete and st.session_state.processed_data is n
     with col3:
         st.metric("❌ 失败行数", total_rows - success_rows)
     with col4:
-        st.metric("📈 成功率", f"{(success_rows/total_rows)*100:.1f}%")
+        st.metric("📈 成功率", f"{(success_rows/total_rows)*100:.1f}%" if total_rows else "-")
+    
+    if pending_rows:
+        st.info(f"⏳ 当前为部分结果：还有 {pending_rows} 行未完成，可在侧边栏任务记录中继续运行或刷新查看")
+    
+    reused_rows = int(result_column.dropna().map(is_reused_result).sum())
+    if reused_rows:
+        st.caption(f"♻️ 近重复复用：{reused_rows} 行直接复用了相似对话的结果，未调用API")
+    
+    cache_stats = st.session_state.cache_stats
+    if cache_stats:
+        lookups = cache_stats['hits'] + cache_stats['misses']
+        hit_rate = cache_stats['hits'] / lookups * 100 if lookups else 0.0
+        st.caption(
+            f"💾 结果缓存：命中 {cache_stats['hits']} 行，未命中 {cache_stats['misses']} 行，"
+            f"命中率 {hit_rate:.1f}%"
+        )
+    
+    usage_meter = st.session_state.usage_meter
+    if usage_meter is not None and usage_meter.total.requests:
+        st.caption(f"🧮 本次运行token用量：{usage_meter.total.describe()}")
+    if st.session_state.job_id:
+        job_usage = get_job_store().usage_summary(st.session_state.job_id)
+        if job_usage.requests:
+            # 续跑过的任务另外显示各次运行的合计
+            if usage_meter is None or job_usage != usage_meter.total:
+                st.caption(f"🧮 任务累计token用量：{job_usage.describe()}")
+        render_run_metrics(st.session_state.job_id)
+    backend_pool = st.session_state.backend_pool
+    if backend_pool is not None:
+        with st.expander("🔀 后端健康状态"):
+            st.dataframe(pd.DataFrame(backend_pool.stats()), use_container_width=True, hide_index=True)
+    
+    # 失败行重试
+    failed_positions = failed_row_positions(st.session_state.processed_data)
+    run_config = st.session_state.run_config
+    # 流式任务的结果表不含原始列，失败行请在侧边栏选择任务后继续运行或使用命令行重试
+    if failed_positions and run_config and run_config['column'] in st.session_state.processed_data.columns:
+        retryable_count = len(failed_row_positions(st.session_state.processed_data, retryable_only=True))
+        st.warning(
+            f"⚠️ {len(failed_positions)} 行分析失败：可重试 {retryable_count} 行，"
+            f"不可重试 {len(failed_positions) - retryable_count} 行"
+        )
+        if st.button("🔁 仅重试失败行"):
+            if not has_credentials:
+                st.error("❌ 请先输入DeepSeek API密钥")
+            else:
+                llm = init_llm_or_report(api_key, base_url, run_config.get('json_mode', True))
+                if llm is not None:
+                    progress_bar = st.progress(0)
+                    status_text = st.empty()
+                    with st.spinner("🔄 正在重试失败行..."), \
+                            get_scheduler().foreground(build_limiter(run_config)) as limiter:
+                        st.session_state.processed_data = run_with_cache_stats(
+                            get_result_cache() if run_config['use_cache'] else None,
+                            retry_failed_rows,
+                            st.session_state.processed_data,
+                            run_config['column'],
+                            llm,
+                            make_progress_callback(progress_bar, status_text),
+                            foreground_engine(run_config)[1],
+                            limiter,
+                            RetryPolicy(max_retries=run_config['max_retries']),
+                            prompt=build_prompt(run_config)
+                        )
+                    if st.session_state.job_id:
+                        retried = st.session_state.processed_data[RESULT_COLUMN]
+                        get_job_store().record_results(
+                            st.session_state.job_id,
+                            [(pos, retried.iloc[pos]) for pos in failed_positions]
+                        )
+                    st.rerun()
     
     # 结果表格
     st.markdown("#### 📊 详细结果")
-    st.dataframe(st.session_state.processed_data, use_container_width=True)
+    render_result_page(st.session_state.processed_data)
+    
+    render_result_dashboard(st.session_state.processed_data)
     
     # JSON内容提取功能
     st.markdown("### 📊 智能内容提取")
     
-    all_json_data = []
-    valid_rows = []
-    
-    for idx, row in st.session_state.processed_data.iterrows():
-        result_text = str(row.get('质检结果', ''))
-        if result_text and not result_text.startswith(('❌', '⚠️', '⏭️')):
-            json_data = extract_json_from_text(result_text)
-            if json_data:
-                all_json_data.append(json_data)
-                valid_rows.append(idx)
-    
-    if all_json_data:
-        all_sections = set()
-        for json_data in all_json_data:
-            all_sections.update(get_json_sections(json_data))
+    json_state = get_json_sections_state(st.session_state.processed_data)
+    all_sections = json_state['sections']
+    
+    if all_sections:
+        st.markdown("#### 🎯 选择提取内容")
         
-        if all_sections:
-            st.markdown("#### 🎯 选择提取内容")
+        selected_sections = st.multiselect(
+            "选择要整理的JSON部分：",
+            all_sections,
+            help="选择要提取和整理的JSON部分"
+        )
+        
+        if selected_sections:
+            st.markdown("#### 📋 提取结果")
             
-            selected_sections = st.multiselect(
-                "选择要整理的JSON部分：",
-                sorted(all_sections),
-                help="选择要提取和整理的JSON部分"
-            )
+            tabs = st.tabs(selected_sections)
             
-            if selected_sections:
-                st.markdown("#### 📋 提取结果")
-                
-                tabs = st.tabs(selected_sections)
-                
-                for i, section in enumerate(selected_sections):
-                    with tabs[i]:
-                        section_data = []
-                        for idx, json_data in enumerate(all_json_data):
-                            content = extract_section_content(json_data, section)
-                            if content is not None:
-                                if isinstance(content, list):
-                                    for item in content:
-                                        section_data.append({
-                                            '原始行号': valid_rows[idx] + 1,
-                                            '内容': item
-                                        })
-                                else:
-                                    section_data.append({
-                                        '原始行号': valid_rows[idx] + 1,
-                                            '内容': content
-                                        })
+            for i, section in enumerate(selected_sections):
+                with tabs[i]:
+                    df_section = get_section_table(json_state, section)
+                    
+                    if not df_section.empty:
+                        st.dataframe(df_section, use_container_width=True)
                         
-                        if section_data:
-                            df_section = pd.DataFrame(section_data)
-                            st.dataframe(df_section, use_container_width=True)
-                            
-                            csv_data = df_section.to_csv(index=False)
-                            st.download_button(
-                                label=f"📥 下载 {section}",
-                                data=csv_data,
-                                file_name=f"{section}.csv",
-                                mime="text/csv",
-                                key=f"download_{section}_{i}"
-                            )
-                        else:
-                            st.info(f"📭 {section} 暂无数据")
+                        csv_data = get_section_csv(json_state, section)
+                        st.download_button(
+                            label=f"📥 下载 {section}",
+                            data=csv_data,
+                            file_name=f"{section}.csv",
+                            mime="text/csv",
+                            key=f"download_{section}_{i}"
+                        )
+                    else:
+                        st.info(f"📭 {section} 暂无数据")
     
-    # 下载区域
+    # 下载区域：CSV每个结果集只生成一次，Excel/Parquet点击后才生成
     st.markdown("### 📥 下载选项")
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
+    fingerprint = json_state['fingerprint']
     
     with col1:
-        csv = st.session_state.processed_data.to_csv(index=False)
         st.download_button(
             label="📄 下载完整CSV",
-            data=csv,
+            data=get_download('csv', fingerprint),
             file_name="质检结果.csv",
             mime="text/csv",
             use_container_width=True
         )
     
     with col2:
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            st.session_state.processed_data.to_excel(writer, index=False, sheet_name='质检结果')
-        excel_data = output.getvalue()
-        
-        st.download_button(
-            label="📊 下载完整Excel",
-            data=excel_data,
-            file_name="质检结果.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True
-        )
+        excel_data = get_download('xlsx', fingerprint, build=False)
+        if excel_data is None and st.button("📊 生成Excel", use_container_width=True):
+            with st.spinner("正在生成Excel..."):
+                excel_data = get_download('xlsx', fingerprint)
+        if excel_data is not None:
+            st.download_button(
+                label="📊 下载完整Excel",
+                data=excel_data,
+                file_name="质检结果.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True
+            )
     
     with col3:
+        if parquet_available():
+            parquet_data = get_download('parquet', fingerprint, build=False)
+            if parquet_data is None and st.button("🧱 生成Parquet", use_container_width=True):
+                with st.spinner("正在生成Parquet..."):
+                    parquet_data = get_download('parquet', fingerprint)
+            if parquet_data is not None:
+                st.download_button(
+                    label="🧱 下载Parquet",
+                    data=parquet_data,
+                    file_name="质检结果.parquet",
+                    mime="application/octet-stream",
+                    use_container_width=True
+                )
+        else:
+            st.caption("安装 pyarrow 后可导出Parquet")
+    
+    with col4:
         if st.button("🔄 重新处理", use_container_width=True):
             st.session_state.processed_data = None
             st.session_state.processing_complete = False
             st.session_state.json_sections = None
             st.session_state.selected_sections = []
+            st.session_state.run_config = None
+            st.session_state.cache_stats = None
+            st.session_state.usage_meter = None
+            st.session_state.backend_pool = None
+            st.session_state.job_id = None
+            st.session_state.result_file = None
+            st.session_state.download_artifacts = None
             st.rerun()
 
 # 底部信息
@@ -0,0 +1,20 @@
+"""测试共用的夹具：本地模拟的OpenAI兼容服务"""
+import pytest
+
+from qa_engine.mock_server import MockOptions, MockServer
+
+
+@pytest.fixture
+def mock_server():
+    """按参数启动模拟服务，测试结束后关闭"""
+    servers = []
+
+    def start(**options) -> MockServer:
+        options = {"latency": 0.01, "jitter": 0.0, **options}
+        server = MockServer(MockOptions(**options)).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
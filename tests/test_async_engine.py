@@ -0,0 +1,60 @@
+import asyncio
+import json
+import time
+
+from qa_engine.async_engine import aiter_batch_results, iter_batch_results_async
+from qa_engine.core import FAILED_PREFIX, SKIP_RESULT, initialize_llm
+from qa_engine.retry import NO_RETRY
+
+
+def conversations(count: int, pulled: list):
+    for n in range(count):
+        pulled.append(n)
+        yield "" if n == 3 else f"销售：您好{n}\n顾客：随便看看"
+
+
+def collect(values, llm, concurrency, **kwargs):
+    async def main():
+        return [item async for item in aiter_batch_results(values, llm, concurrency, **kwargs)]
+
+    return asyncio.run(main())
+
+
+def test_yields_every_row_with_bounded_in_flight(mock_server):
+    server = mock_server(latency=0.05)
+    pulled = []
+    results = dict(collect(conversations(20, pulled), initialize_llm("test", server.url), 4))
+    assert sorted(results) == list(range(20))
+    assert results[3] == SKIP_RESULT
+    assert all(isinstance(json.loads(result), dict) for idx, result in results.items() if idx != 3)
+    assert server.stats.snapshot()["peak_in_flight"] <= 4
+
+
+def test_input_is_read_on_demand(mock_server):
+    server = mock_server(latency=0.05)
+    pulled = []
+
+    async def first():
+        items = aiter_batch_results(conversations(50, pulled), initialize_llm("test", server.url), 4)
+        item = await items.__anext__()
+        await items.aclose()
+        return item
+
+    asyncio.run(first())
+    assert len(pulled) < 10
+
+
+def test_failures_become_failed_results(mock_server):
+    server = mock_server(error_rate=1.0)
+    results = dict(collect(conversations(5, []), initialize_llm("test", server.url), 2, retry=NO_RETRY))
+    assert all(results[idx].startswith(FAILED_PREFIX) for idx in (0, 1, 2, 4))
+
+
+def test_sync_wrapper_cancels_in_flight_requests_on_early_exit(mock_server):
+    server = mock_server(latency=0.3)
+    results = iter_batch_results_async(conversations(40, []), initialize_llm("test", server.url), concurrency=8)
+    # 空值行不发请求，最先产出
+    assert next(results) == (3, SKIP_RESULT)
+    results.close()
+    time.sleep(0.5)
+    assert server.stats.snapshot()["requests"] <= 8
@@ -0,0 +1,99 @@
+from typing import Any, Iterator, List, Optional
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from qa_engine.backends import Backend, BackendConfig, BackendPool
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeChat(BaseChatModel):
+    """按 error 失败（error 为None时正常返回 reply），calls 记录调用次数"""
+    reply: str = "{}"
+    error: Optional[Exception] = None
+    calls: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        for ch in self.reply:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=ch))
+
+
+def make_pool(*llms: FakeChat, cooldown: float = 60.0) -> BackendPool:
+    backends = [Backend(BackendConfig(f"b{n}", "http://127.0.0.1/v1", "key", "m", weight=len(llms) - n), llm)
+                for n, llm in enumerate(llms)]
+    return BackendPool(backends=backends, cooldown=cooldown)
+
+
+MESSAGES = [HumanMessage(content="销售：您好")]
+
+
+def test_failover_and_cooldown():
+    bad, good = FakeChat(error=ConnectionError("down")), FakeChat(reply='{"ok": 1}')
+    pool = make_pool(bad, good)
+    assert pool.invoke(MESSAGES).content == '{"ok": 1}'
+    assert (bad.calls, good.calls) == (1, 1)
+    # 冷却中的后端排在健康后端之后，不再先尝试
+    assert pool.invoke(MESSAGES).content == '{"ok": 1}'
+    assert (bad.calls, good.calls) == (1, 2)
+    stats = {s["后端"]: s for s in pool.stats()}
+    assert stats["b0"]["失败"] == 1 and stats["b0"]["状态"].startswith("冷却中")
+    assert stats["b1"]["成功请求"] == 2
+
+
+def test_auth_error_fails_over_but_other_errors_raise():
+    pool = make_pool(FakeChat(error=StatusError(401)), FakeChat(reply="ok"))
+    assert pool.invoke(MESSAGES).content == "ok"
+    pool = make_pool(FakeChat(error=ValueError("bad request")), FakeChat(reply="ok"))
+    with pytest.raises(ValueError):
+        pool.invoke(MESSAGES)
+
+
+def test_all_backends_failing_raises_last_error():
+    pool = make_pool(FakeChat(error=ConnectionError("a")), FakeChat(error=StatusError(503)))
+    with pytest.raises(StatusError):
+        pool.invoke(MESSAGES)
+
+
+def test_stream_fails_over_before_first_chunk():
+    bad, good = FakeChat(error=StatusError(429)), FakeChat(reply='{"ok": 1}')
+    pool = make_pool(bad, good)
+    chunks = list(pool.stream(MESSAGES))
+    assert len(chunks) > 1
+    assert "".join(chunk.content for chunk in chunks) == '{"ok": 1}'
+    assert bad.calls == 1 and pool.stats()[0]["限流"] == 1
+
+
+async def _collect(pool: BackendPool) -> str:
+    return "".join([chunk.content async for chunk in pool.astream(MESSAGES)])
+
+
+def test_astream_fails_over_before_first_chunk():
+    import asyncio
+
+    pool = make_pool(FakeChat(error=ConnectionError("down")), FakeChat(reply="abc"))
+    assert asyncio.run(_collect(pool)) == "abc"
@@ -0,0 +1,54 @@
+import json
+
+from qa_engine.batch_api import BatchOptions, _plan_rows, batch_client, iter_batch_api_results, submit_batches
+from qa_engine.cache import ResultCache
+from qa_engine.core import FAILED_PREFIX, RETRYABLE_FAILED_PREFIX, SKIP_RESULT, create_qa_prompt, initialize_llm
+
+ROWS = [(0, "用户：你好\n客服：您好"), (1, ""), (2, "用户：想退货\n客服：好的"), (3, "用户：有现货吗\n客服：有")]
+OPTIONS = BatchOptions(max_requests=2, poll_interval=0.05)
+
+
+def run(llm, **kwargs):
+    return {idx: (result, trace) for idx, result, trace in iter_batch_api_results(ROWS, llm, options=OPTIONS, **kwargs)}
+
+
+def test_batch_job_runs_to_completion_and_fills_cache(mock_server, tmp_path):
+    llm = initialize_llm("test-key", mock_server().url)
+    cache = ResultCache(str(tmp_path / "cache.db"))
+    submitted, collected = [], []
+    results = run(llm, cache=cache, on_submit=lambda batch_id, rows: submitted.append(rows),
+                  on_collected=lambda batch_id, status: collected.append(status))
+    assert submitted == [[0, 2], [3]]
+    assert collected == ["completed", "completed"]
+    assert results[1] == (SKIP_RESULT, None)
+    for idx in (0, 2, 3):
+        result, trace = results[idx]
+        assert isinstance(json.loads(result), dict)
+        assert trace.usage.requests == 1
+
+    # 全部命中缓存时不再提交批次
+    submitted.clear()
+    again = run(llm, cache=cache, on_submit=lambda batch_id, rows: submitted.append(rows))
+    assert submitted == []
+    assert {idx: result for idx, (result, _) in again.items()} == {idx: result for idx, (result, _) in results.items()}
+
+
+def test_failed_requests_come_back_retryable(mock_server):
+    llm = initialize_llm("test-key", mock_server(error_rate=1.0).url)
+    results = run(llm)
+    assert all(results[idx][0].startswith(RETRYABLE_FAILED_PREFIX) for idx in (0, 2, 3))
+    assert results[0][1].errors == 1
+
+
+def test_resumed_batches_are_polled_not_resubmitted(mock_server):
+    server = mock_server()
+    llm = initialize_llm("test-key", server.url)
+    plans, requests = {}, {}
+    assert list(_plan_rows(ROWS, llm, None, create_qa_prompt(), plans, requests)) == [(1, SKIP_RESULT)]
+    open_batches = dict(submit_batches(batch_client(llm), requests, OPTIONS))
+    submitted = []
+    results = run(llm, open_batches=open_batches, on_submit=lambda batch_id, rows: submitted.append(rows))
+    assert submitted == []
+    assert sorted(results) == [0, 1, 2, 3]
+    assert not any(result.startswith(FAILED_PREFIX) for result, _ in results.values())
+    assert server.stats.snapshot()["requests"] == 3
@@ -0,0 +1,49 @@
+from qa_engine.budget import TokenBudget, count_tokens, merge_chunk_data, quality_grade
+
+
+def test_split_keeps_lines_whole_and_under_budget():
+    lines = [f"销售：第{n}句，请问您今天想看看哪一款手表呢？\n" for n in range(60)]
+    conversation = "".join(lines)
+    budget = TokenBudget(chunk_tokens=100)
+    chunks = budget.split(conversation)
+    assert len(chunks) > 1
+    assert "".join(chunks) == conversation
+    assert all(count_tokens(chunk) <= 100 for chunk in chunks)
+    assert all(chunk.endswith("\n") for chunk in chunks)
+    assert TokenBudget(chunk_tokens=0).split(conversation) == [conversation]
+    assert budget.split("销售：您好") == ["销售：您好"]
+
+
+def test_overlong_line_gets_its_own_chunk():
+    long_line = "销售：" + "非常" * 200 + "\n"
+    chunks = TokenBudget(chunk_tokens=50).split("顾客：你好\n" + long_line + "顾客：再见\n")
+    assert chunks == ["顾客：你好\n", long_line, "顾客：再见\n"]
+
+
+def test_max_output_is_clamped():
+    budget = TokenBudget(min_output=100, output_base=50, output_ratio=0.5, context_window=1000)
+    assert budget.max_output(10) == 100
+    assert budget.max_output(400) == 250
+    assert budget.max_output(400, model_max=200) == 200
+    assert budget.max_output(900) == 100
+    assert budget.max_output(2000) == 1
+
+
+def test_merge_shifts_turns_and_recomputes_summary():
+    first = {
+        "对话质量问题": [{"轮次": 2, "描述": "a"}, {"轮次": "第3轮", "描述": "b"}],
+        "优秀销售话术": [{"轮次": 1}],
+        "整体评估": {"对话总轮次": "10轮", "总体质量等级": "优秀", "评语": "保留"},
+    }
+    second = {"对话质量问题": [{"轮次": "第4轮", "描述": "c"}, {"描述": "无轮次"}], "销售违禁词问题": [{"轮次": 1}]}
+    merged = merge_chunk_data([first, second], [8, 6])
+    # 第一段不平移（原样保留），后续段的轮次加上前面各段的总轮次
+    assert [item.get("轮次") for item in merged["对话质量问题"]] == [2, "第3轮", 14, None]
+    assert merged["销售违禁词问题"] == [{"轮次": 11}]
+    summary = merged["整体评估"]
+    # 第二段没有对话总轮次，按该段的非空行数6计
+    assert summary["对话总轮次"] == 16
+    assert summary["问题轮次占比"] == "31.2%"
+    assert summary["优秀话术轮次占比"] == "6.2%"
+    assert summary["总体质量等级"] == quality_grade(31.25, 6.25) == "待改进"
+    assert summary["评语"] == "保留"
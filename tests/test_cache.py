@@ -0,0 +1,55 @@
+import pytest
+
+from qa_engine import cache as cache_module
+from qa_engine.cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的时钟（同一秒内的写入也有先后）"""
+    now = [1_000_000.0]
+
+    def time():
+        now[0] += 0.001
+        return now[0]
+
+    monkeypatch.setattr(cache_module.time, "time", time)
+    return now
+
+
+def test_evicts_least_recently_used_past_size_limit(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "cache.db"), max_size_mb=1000 / 1024 / 1024, evict_every=1)
+    cache.put("a", "甲" * 100)  # 300字节
+    cache.put("b", "乙" * 100)
+    cache.put("c", "丙" * 100)
+    assert cache.get("a") is not None
+    cache.put("d", "丁" * 100)
+    assert cache.get("b") is None
+    assert [cache.get(key) is not None for key in "acd"] == [True, True, True]
+    assert cache.size_bytes() <= 1000
+    cache.close()
+
+
+def test_expires_entries_by_age(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "cache.db"), max_size_mb=None, max_age_days=1)
+    cache.put("old", "{}")
+    clock[0] += 86400 * 2
+    cache.put("new", "{}")
+    assert cache.get("old") is None
+    assert cache.get("new") == "{}"
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.evict()
+    assert len(cache) == 1
+    cache.close()
+
+
+def test_survives_reopen_and_clear(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(path)
+    cache.put("key", "结果")
+    cache.close()
+    cache = ResultCache(path)
+    assert cache.get("key") == "结果" and cache.hit_rate == 1.0
+    cache.clear()
+    assert len(cache) == 0 and cache.hit_rate == 0.0
+    cache.close()
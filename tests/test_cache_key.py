@@ -0,0 +1,12 @@
+from qa_engine.core import initialize_llm, result_cache_key
+from qa_engine.prompt import load_prompt
+
+
+def test_key_depends_on_effective_request_parameters():
+    messages = load_prompt().format_messages("销售：您好")
+    llm = initialize_llm("test", "http://127.0.0.1/v1")
+    key = result_cache_key(llm, messages, 1000)
+    assert key == result_cache_key(llm, messages, 1000)
+    assert key != result_cache_key(llm, messages, 2000)
+    assert key != result_cache_key(initialize_llm("test", "http://127.0.0.1/v1", temperature=0.1), messages, 1000)
+    assert key != result_cache_key(initialize_llm("test", "http://127.0.0.1/v1", json_mode=False), messages, 1000)
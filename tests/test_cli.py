@@ -0,0 +1,65 @@
+import logging
+
+import pandas as pd
+
+from qa_engine.cli import main
+from qa_engine.core import RESULT_COLUMN, RETRYABLE_FAILED_PREFIX
+
+
+def run_cli(tmp_path, server, *args):
+    return main([*args, "--api-key", "test", "--base-url", server.url, "--job-dir", str(tmp_path / "jobs"),
+                 "--no-cache", "--max-retries", "0"])
+
+
+def write_input(tmp_path, frame: pd.DataFrame) -> str:
+    path = tmp_path / "input.csv"
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+def test_stream_with_retry_failed_is_rejected(tmp_path, mock_server, caplog):
+    server = mock_server()
+    source = write_input(tmp_path, pd.DataFrame({"对话": ["销售：您好"]}))
+    with caplog.at_level(logging.ERROR):
+        code = run_cli(tmp_path, server, source, "-c", "对话", "-o", str(tmp_path / "out.csv"),
+                       "--stream", "--retry-failed")
+    assert code == 2
+    assert "流式模式暂不支持 --retry-failed" in caplog.text
+    assert server.stats.requests == 0
+
+
+def test_stream_writes_every_row(tmp_path, mock_server):
+    server = mock_server()
+    source = write_input(tmp_path, pd.DataFrame({"门店": ["A", "B", "C"], "对话": ["销售：您好", "", "销售：在吗"]}))
+    output = tmp_path / "out.csv"
+    assert run_cli(tmp_path, server, source, "-c", "对话", "-o", str(output), "--stream") == 0
+    result = pd.read_csv(output, keep_default_na=False)
+    assert list(result["门店"]) == ["A", "B", "C"]
+    assert result[RESULT_COLUMN][0].startswith("{")
+    assert server.stats.requests == 2
+
+
+def test_retry_failed_only_requests_failed_rows(tmp_path, mock_server):
+    server = mock_server()
+    previous = pd.DataFrame({
+        "对话": ["销售：您好", "销售：在吗"],
+        RESULT_COLUMN: ['{"已有": "结果"}', f"{RETRYABLE_FAILED_PREFIX}: timeout"],
+    })
+    source = write_input(tmp_path, previous)
+    output = tmp_path / "out.csv"
+    assert run_cli(tmp_path, server, source, "-c", "对话", "-o", str(output), "--retry-failed") == 0
+    result = pd.read_csv(output)
+    assert result[RESULT_COLUMN][0] == '{"已有": "结果"}'
+    assert result[RESULT_COLUMN][1].startswith("{")
+    assert server.stats.requests == 1
+
+
+def test_tables_summary_when_every_row_fails(tmp_path, mock_server, caplog):
+    server = mock_server(error_rate=1.0)
+    source = write_input(tmp_path, pd.DataFrame({"对话": ["销售：您好", "销售：在吗"]}))
+    with caplog.at_level(logging.INFO):
+        code = run_cli(tmp_path, server, source, "-c", "对话", "-o", str(tmp_path / "out.csv"),
+                       "--tables-out", str(tmp_path / "tables"))
+    assert code == 0
+    assert "质量等级分布: 无可统计结果" in caplog.text
+    assert (tmp_path / "tables" / "metrics.parquet").exists()
@@ -0,0 +1,78 @@
+import math
+import random
+
+import numpy as np
+
+from qa_engine import dedup
+from qa_engine.core import RETRYABLE_FAILED_PREFIX
+from qa_engine.dedup import (
+    find_near_duplicates,
+    is_reused_result,
+    mark_reused,
+    minhash_signatures,
+    recall_radius,
+)
+
+
+def conversation(seed: int, length: int = 400) -> str:
+    rng = random.Random(seed)
+    return "".join(rng.choice("甲乙丙丁戊己庚辛壬癸子丑寅卯辰巳午未申酉戌亥") for _ in range(length))
+
+
+def edited(text: str, positions) -> str:
+    chars = list(text)
+    for pos in positions:
+        chars[pos] = "X"
+    return "".join(chars)
+
+
+def test_recall_radius_covers_three_sigma_at_threshold():
+    for num_perm, threshold in ((128, 0.9), (128, 0.8), (256, 0.85), (64, 0.7)):
+        radius = recall_radius(num_perm, threshold)
+        # 完整签名刚好达到阈值时，不同的位置各有一半概率在1-bit签名中也不同
+        differing = num_perm - math.ceil(threshold * num_perm)
+        missed = sum(math.comb(differing, d) for d in range(radius, differing + 1)) / 2 ** differing
+        assert missed < 1e-3
+    assert recall_radius(128, 1.0) == 1
+
+
+def test_pair_at_threshold_with_all_low_bits_differing_is_found(monkeypatch):
+    leader = np.arange(128, dtype=np.uint32) * 2
+    member = leader.copy()
+    member[:12] += 1  # 116/128 个位置相同（估计相似度 0.906），不同的12个位置最低位全部不同
+    monkeypatch.setattr(dedup, "minhash_signatures", lambda texts, num_perm: np.stack([leader, member]))
+    assert find_near_duplicates(["甲", "乙"], threshold=0.9) == {1: 0}
+
+
+def test_signatures_ignore_whitespace_and_track_similarity():
+    base = conversation(1)
+    signatures = minhash_signatures([base, " ".join(base[i:i + 50] for i in range(0, 400, 50)) + "\n",
+                                     edited(base, [100]), conversation(2)])
+    assert signatures.shape == (4, 128) and signatures.dtype == np.uint32
+    similarity = (signatures == signatures[0]).mean(axis=1)
+    assert similarity[1] < 1.0  # 空白折叠为单个空格，切分处的k-gram不同
+    assert similarity[2] > 0.9
+    assert similarity[3] < 0.2
+    assert (minhash_signatures([base]) == minhash_signatures([base])).all()
+
+
+def test_clusters_near_duplicates_onto_the_first_row():
+    base, other = conversation(1), conversation(2)
+    values = [base, None, edited(base, [10]), other, "  ", edited(base, [300]), base, edited(other, [5])]
+    assert find_near_duplicates(values, 0.9) == {2: 0, 5: 0, 6: 0, 7: 3}
+    assert find_near_duplicates(values, 1.0) == {6: 0}
+
+
+def test_members_must_be_similar_to_the_leader_not_each_other():
+    base = conversation(3)
+    near = edited(base, range(0, 400, 100))
+    nearer = edited(near, range(50, 400, 100))
+    # near 与 base、nearer 都相似，但 nearer 与 base 不相似：不会链式并入 base 的簇
+    reuse = find_near_duplicates([base, near, nearer], 0.85)
+    assert reuse == {1: 0}
+
+
+def test_reused_results_are_marked_and_failures_copied():
+    assert mark_reused("{}", 4) == "♻️ 复用第5行结果: {}" and is_reused_result(mark_reused("{}", 4))
+    failure = f"{RETRYABLE_FAILED_PREFIX}: 超时"
+    assert mark_reused(failure, 4) == failure
@@ -0,0 +1,69 @@
+import json
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from qa_engine.core import create_qa_prompt
+from qa_engine.packing import PackOptions, group_rows, parse_pack_result, process_pack
+from qa_engine.prompt import PACK_ITEM_FIELD, PACK_RESULTS_FIELD, PACK_TEMPLATE
+
+PROMPT = create_qa_prompt()
+VALID = PROMPT.schema
+PACK_PREFIX = PACK_TEMPLATE.split("{count}")[0]
+
+
+class PackChat(BaseChatModel):
+    """打包请求返回 pack_items（为None时抛出异常），单段请求返回合格结果；requests 记录每次请求是否为打包请求"""
+    pack_items: Optional[List[Any]] = None
+    requests: List[bool] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-pack"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        packed = str(messages[-1].content).startswith(PACK_PREFIX)
+        self.requests.append(packed)
+        if packed and self.pack_items is None:
+            raise ValueError("打包请求失败")
+        content = {PACK_RESULTS_FIELD: self.pack_items} if packed else VALID
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=json.dumps(content, ensure_ascii=False)))])
+
+
+ROWS = [(0, "销售：您好"), (1, "销售：欢迎光临"), (2, "销售：需要帮忙吗"), (3, "销售：再见")]
+
+
+def test_parse_pack_result_keys_items_by_number():
+    content = "说明文字 " + json.dumps({PACK_RESULTS_FIELD: [
+        {PACK_ITEM_FIELD: "2", "a": 2}, {PACK_ITEM_FIELD: 1, "a": 1}, {PACK_ITEM_FIELD: "x"}, "跳过",
+        {PACK_ITEM_FIELD: 1, "a": "重复编号取第一个"},
+    ]}, ensure_ascii=False)
+    assert parse_pack_result(content) == {1: {"a": 1}, 2: {"a": 2}}
+    assert parse_pack_result('{"其他": []}') == {}
+    assert parse_pack_result("不是JSON") == {}
+
+
+def test_group_rows_packs_adjacent_short_rows():
+    rows = [(0, "销售：短"), (1, None), (2, "销售：短"), (3, "销售：短"), (4, "销售：" + "长" * 2000), (5, "销售：短")]
+    groups = [[k for k, _ in group] for group in group_rows(rows, PROMPT, PackOptions(max_rows=2))]
+    assert groups == [[1], [0, 2], [4], [3, 5]]
+
+
+def test_missing_or_invalid_items_fall_back_to_single_requests():
+    items = [{PACK_ITEM_FIELD: 1, **VALID}, {PACK_ITEM_FIELD: 2, "分析": "缺少字段"}, {PACK_ITEM_FIELD: 4, **VALID}]
+    llm = PackChat(pack_items=items, requests=[])
+    results = dict(process_pack(ROWS, llm, prompt=PROMPT))
+    assert sorted(results) == [0, 1, 2, 3]
+    assert all(set(json.loads(result)) >= set(VALID) for result in results.values())
+    # 一个打包请求 + 编号2（不合格）与编号3（缺失）各一个单独请求
+    assert llm.requests == [True, False, False]
+
+
+def test_failed_pack_request_falls_back_for_every_row():
+    llm = PackChat(pack_items=None, requests=[])
+    results = dict(process_pack(ROWS, llm, prompt=PROMPT))
+    assert sorted(results) == [0, 1, 2, 3]
+    assert llm.requests == [True] + [False] * 4
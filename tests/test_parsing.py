@@ -0,0 +1,34 @@
+import time
+
+from qa_engine.parsing import extract_json_from_text, iter_json_objects
+
+
+def test_objects_in_order_with_braces_in_strings():
+    text = '前 {"a": "}{", "b": {"c": 1}} 中 {"d": "\\"}"} 后'
+    assert list(iter_json_objects(text)) == ['{"a": "}{", "b": {"c": 1}}', '{"d": "\\"}"}']
+
+
+def test_complete_object_after_truncated_one():
+    text = '{"对话质量问题": [{"轮次": 1, "描述": "截断 {"整体评估": {"总体质量等级": "良好"}}'
+    assert list(iter_json_objects(text)) == ['{"整体评估": {"总体质量等级": "良好"}}']
+    assert extract_json_from_text(text) == {"整体评估": {"总体质量等级": "良好"}}
+
+
+def test_unclosed_object_yields_nothing():
+    assert list(iter_json_objects('{"a": [1, 2')) == []
+    assert extract_json_from_text('{"a": [1, 2') == {}
+
+
+def test_valid_object_inside_unparseable_candidate():
+    assert extract_json_from_text('{"a": 1, "b": {"x": 1}}') == {"a": 1, "b": {"x": 1}}
+    assert extract_json_from_text('{"a": 1 "b": {"x": 1}}') == {"x": 1}
+
+
+def test_deep_or_unparseable_braces_do_not_recurse():
+    started = time.perf_counter()
+    assert extract_json_from_text('{' * 2000 + '}' * 2000) == {}
+    assert extract_json_from_text('{"a": 1 ' * 3000 + '}' * 3000) == {"a": 1}
+    nested = '{"a": ' * 5000 + '1' + '}' * 5000
+    data = extract_json_from_text(nested)
+    assert isinstance(data, dict) and data
+    assert time.perf_counter() - started < 5
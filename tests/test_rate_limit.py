@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from qa_engine.rate_limit import AdaptiveConcurrency, RateLimiter, TokenBucket
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_token_bucket_reports_wait_and_refills():
+    bucket = TokenBucket(600)  # 每秒10个
+    assert bucket.reserve(600) == 0.0
+    assert bucket.reserve(5) == pytest.approx(0.5, abs=0.05)
+    started = time.monotonic()
+    bucket.acquire(2)
+    assert 0.1 <= time.monotonic() - started < 1.0
+    # 超过容量的申请按容量计，不会永远等待
+    assert bucket.reserve(10 ** 6) == pytest.approx(60.0, abs=1.0)
+
+
+def test_token_bucket_drain_makes_everyone_wait():
+    bucket = TokenBucket(600)
+    bucket.drain()
+    assert bucket.reserve(1) > 0
+
+
+def test_adaptive_concurrency_grows_and_halves_once_per_cooldown():
+    window = AdaptiveConcurrency(initial=2, maximum=4, cooldown=60)
+    for _ in range(20):
+        window.acquire()
+        window.release()
+    assert window.limit == 4
+    window.acquire()
+    window.release(throttled=True)
+    assert window.limit == 2
+    # 冷却期内的后续限流不再收缩
+    window.acquire()
+    window.release(throttled=True)
+    assert window.limit == 2
+    window.acquire()
+    window.release(succeeded=False)
+    assert window.limit == 2
+
+
+def test_adaptive_concurrency_blocks_at_limit():
+    window = AdaptiveConcurrency(initial=1, maximum=1)
+    window.acquire()
+    entered = threading.Event()
+
+    def second():
+        window.acquire()
+        entered.set()
+        window.release()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not entered.wait(0.1)
+    window.release()
+    assert entered.wait(1.0)
+    thread.join()
+
+
+def test_slot_backs_off_on_throttle_errors_only():
+    limiter = RateLimiter(rpm=600, max_concurrency=8, initial_concurrency=8)
+    with pytest.raises(ValueError):
+        with limiter.slot():
+            raise ValueError("不是限流")
+    assert limiter.concurrency.limit == 8 and limiter.throttled_count == 0
+    with pytest.raises(StatusError):
+        with limiter.slot():
+            raise StatusError(429)
+    assert limiter.concurrency.limit == 4 and limiter.throttled_count == 1
+    assert limiter.requests.reserve(1) > 0
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_slot_async_limits_in_flight():
+    limiter = RateLimiter(max_concurrency=3, adaptive=False)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limiter.slot_async():
+            peak = max(peak, limiter.concurrency.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(12)))
+
+    asyncio.run(main())
+    assert peak == 3
+    assert len(limiter.latencies) == 12
@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from qa_engine import retry
+from qa_engine.retry import RetryPolicy, call_with_retry, call_with_retry_async
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int, retry_after: str = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+
+def failing(errors, result="ok"):
+    """依次抛出 errors 中的异常，之后返回 result；calls 记录调用次数"""
+    errors = list(errors)
+
+    def fn():
+        fn.calls += 1
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    fn.calls = 0
+    return fn
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(retry.time, "sleep", delays.append)
+    return delays
+
+
+def test_backoff_is_capped_exponential_with_jitter():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+    for attempt, bound in enumerate((1, 2, 4, 5, 5)):
+        delays = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= bound for delay in delays)
+        assert max(delays) > bound * 0.5
+
+
+def test_retryable_errors_are_retried_until_success(sleeps):
+    fn = failing([StatusError(500), StatusError(429), TimeoutError()])
+    assert call_with_retry(fn, RetryPolicy(max_retries=3, base_delay=0.01)) == "ok"
+    assert fn.calls == 4 and len(sleeps) == 3
+
+
+def test_gives_up_after_max_retries_or_on_fatal_errors(sleeps):
+    fn = failing([StatusError(503)] * 5)
+    with pytest.raises(StatusError):
+        call_with_retry(fn, RetryPolicy(max_retries=2, base_delay=0.01))
+    assert fn.calls == 3
+    fn = failing([StatusError(400)])
+    with pytest.raises(StatusError):
+        call_with_retry(fn, RetryPolicy(max_retries=2))
+    assert fn.calls == 1 and len(sleeps) == 2
+
+
+def test_retry_after_raises_the_delay_up_to_max_delay(sleeps):
+    call_with_retry(failing([StatusError(429, "3"), StatusError(429, "100")]),
+                    RetryPolicy(base_delay=0.01, max_delay=10.0))
+    assert sleeps == [3.0, 10.0]
+
+
+def test_async_retry_uses_the_same_policy(monkeypatch):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(retry.asyncio, "sleep", sleep)
+    errors = [StatusError(502, "2")]
+
+    async def fn():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert asyncio.run(call_with_retry_async(fn, RetryPolicy(base_delay=0.01))) == "ok"
+    assert delays == [2.0]
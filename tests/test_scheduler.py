@@ -0,0 +1,75 @@
+import logging
+import time
+
+import pandas as pd
+
+from qa_engine.async_engine import ENGINE_ASYNC
+from qa_engine.core import initialize_llm
+from qa_engine.jobs import STATUS_CANCELLED, STATUS_COMPLETED, JobStore, run_job
+from qa_engine.rate_limit import RateLimiter
+from qa_engine.scheduler import STATE_CANCELLED, STATE_COMPLETED, FINISHED_STATES, JobScheduler
+
+
+def create_job(store: JobStore, rows: int) -> str:
+    frame = pd.DataFrame({"对话": [f"销售：您好{n}" for n in range(rows)]})
+    return store.create_job(frame, "对话", "input.csv")
+
+
+def wait_finished(scheduler: JobScheduler, job_id: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while scheduler.status(job_id)["state"] not in FINISHED_STATES:
+        assert time.monotonic() < deadline, "任务未在限定时间内结束"
+        time.sleep(0.05)
+
+
+def test_cancelled_jobs_are_recorded_in_store(tmp_path, mock_server):
+    server = mock_server(latency=0.1)
+    store = JobStore(str(tmp_path))
+    scheduler = JobScheduler(store, RateLimiter(max_concurrency=2, adaptive=False), max_running=1)
+    llm = initialize_llm("test", server.url)
+    running, queued = create_job(store, 50), create_job(store, 5)
+    scheduler.submit(running, llm, max_workers=2)
+    scheduler.submit(queued, llm, max_workers=2)
+    while scheduler.status(running)["completed"] == 0:
+        time.sleep(0.05)
+    assert scheduler.cancel(queued) and scheduler.cancel(running)
+    wait_finished(scheduler, running)
+    assert scheduler.status(queued)["state"] == STATE_CANCELLED
+    assert scheduler.status(running)["state"] == STATE_CANCELLED
+    assert store.get_job(queued)["status"] == STATUS_CANCELLED
+    assert store.get_job(running)["status"] == STATUS_CANCELLED
+    assert store.get_job(running)["completed_rows"] < 50
+    scheduler.shutdown(wait=True)
+
+
+def test_async_engine_runs_on_threads_with_warning(tmp_path, mock_server, caplog):
+    server = mock_server()
+    store = JobStore(str(tmp_path))
+    scheduler = JobScheduler(store, max_running=1)
+    job_id = create_job(store, 3)
+    with caplog.at_level(logging.WARNING, logger="qa_engine.scheduler"):
+        scheduler.submit(job_id, initialize_llm("test", server.url), engine=ENGINE_ASYNC)
+    assert "异步引擎改用线程引擎" in caplog.text
+    wait_finished(scheduler, job_id)
+    assert scheduler.status(job_id)["state"] == STATE_COMPLETED
+    assert store.get_job(job_id)["status"] == STATUS_COMPLETED
+    scheduler.shutdown(wait=True)
+
+
+def test_foreground_run_shares_the_global_limiter(tmp_path, mock_server):
+    server = mock_server(latency=0.05)
+    store = JobStore(str(tmp_path))
+    shared = RateLimiter(max_concurrency=2, adaptive=False)
+    scheduler = JobScheduler(store, shared, max_running=1)
+    llm = initialize_llm("test", server.url)
+    job_id = create_job(store, 6)
+    local = RateLimiter(max_concurrency=4, adaptive=False)
+    with scheduler.foreground(local) as limiter:
+        with scheduler.foreground():
+            assert scheduler.fair_share() == 1
+        # 本次运行的并发设置更宽，仍受全局并发上限约束
+        run_job(store, job_id, llm, max_workers=scheduler.max_workers(4), limiter=limiter)
+    assert store.get_job(job_id)["status"] == STATUS_COMPLETED
+    assert server.stats.snapshot()["peak_in_flight"] <= 2
+    assert shared.concurrency.in_flight == local.concurrency.in_flight == 0
+    scheduler.shutdown(wait=True)
@@ -0,0 +1,31 @@
+import math
+
+from qa_engine.screen import PhraseMatcher, PhraseScreen
+
+ENTRIES = [{"违禁词": "最好", "类型": "夸大承诺", "风险等级": "高"}, {"违禁词": "Guarantee", "类型": "承诺", "风险等级": "中"}]
+
+
+def test_offsets_index_the_original_text():
+    matcher = PhraseMatcher(["strasse", "最好"])
+    text = "İİ Straße STRASSE 最好"
+    hits = [(pos, matcher.phrases[idx]) for pos, idx in matcher.find(text)]
+    assert hits == [(3, "strasse"), (10, "strasse"), (18, "最好")]
+    assert text[18:20] == "最好"
+
+
+def test_scan_skips_customer_turns_and_reports_positions():
+    conversation = "顾客：这是最好的吗\n销售：İ GUARANTEE 最好"
+    hits = PhraseScreen(ENTRIES).scan(conversation)
+    assert [(hit["轮次"], hit["违禁词"]) for hit in hits] == [(2, "Guarantee"), (2, "最好")]
+    for hit in hits:
+        start = hit["位置"]
+        assert conversation[start:start + len(hit["违禁词"])].casefold() == hit["违禁词"].casefold()
+
+
+def test_scan_values_prefilter_matches_row_scans():
+    screen = PhraseScreen(ENTRIES + [{"违禁词": "strasse", "类型": "测试", "风险等级": "低"}])
+    values = ["销售：没有命中", "销售：GUARANTEE", math.nan, 12, "", "销售：Straße\n顾客：最好", "顾客：最好"]
+    expected = [screen.scan(value) if isinstance(value, str) else [] for value in values]
+    assert screen.scan_values(values) == expected
+    assert [len(hits) for hits in expected] == [0, 1, 0, 0, 0, 1, 0]
+    assert PhraseScreen([]).scan_values(["销售：最好"]) == [[]]
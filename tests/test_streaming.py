@@ -0,0 +1,73 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from qa_engine.streaming import StreamChecker, StreamOptions, consume_stream
+
+SCHEMA = {"问题": [{"轮次": 1}], "评估": {"等级": "良好"}, "备注": ""}
+VALID = json.dumps({"问题": [{"轮次": 1, "描述": "含 } ] \" { 的文字"}], "评估": {"等级": "良好"}, "备注": "\\\"x\\\\"},
+                   ensure_ascii=False)
+
+
+def feed_all(checker: StreamChecker, text: str, size: int) -> StreamChecker:
+    for start in range(0, len(text), size):
+        if checker.feed(text[start:start + size]):
+            break
+    return checker
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_valid_output_completes_for_any_chunking(size):
+    checker = feed_all(StreamChecker(SCHEMA), "```json\n" + VALID + "\n```", size)
+    assert checker.complete and checker.problems == []
+
+
+@pytest.mark.parametrize("text, problem", [
+    ('{"问题": [], "多余": 1}', "多余字段 多余"),
+    ('{"问题": [], "问题": []}', "重复字段 问题"),
+    ('{"问题": "不是数组"}', "问题 应为数组"),
+    ('{"评估": [1]}', "评估 应为对象"),
+    ('好' * 300 + '{"问题": []}', "JSON对象之前有过多文字"),
+])
+def test_drift_is_detected(text, problem):
+    checker = feed_all(StreamChecker(SCHEMA), text, 2)
+    assert checker.problems == [problem]
+    assert not checker.complete
+
+
+def test_section_budget_counts_chunks():
+    checker = StreamChecker(SCHEMA, StreamOptions(section_tokens=1000, section_share=0.5), max_tokens=20)
+    assert checker.section_limit == 10
+    checker.feed('{"问题": [')
+    for _ in range(10):
+        assert not checker.feed('{"轮次": 1},')
+    assert checker.feed('{"轮次": 1},')
+    assert checker.problems == ["问题 的输出超过 10 token"]
+
+
+def test_without_schema_only_structure_is_tracked():
+    checker = feed_all(StreamChecker(None), '{"任意": {"嵌套": [1, 2]}, "其他": "x"}', 4)
+    assert checker.complete and checker.problems == []
+
+
+def test_consume_stream_stops_and_closes_on_drift():
+    sent = []
+
+    def chunks():
+        try:
+            for text in ['{"问题": [', '], "多余"', ': 1', '}']:
+                sent.append(text)
+                yield SimpleNamespace(content=text)
+        finally:
+            sent.append("closed")
+
+    content, problems = consume_stream(chunks(), StreamChecker(SCHEMA))
+    assert content == '{"问题": [], "多余"'
+    assert problems == ["多余字段 多余（已提前中止）"]
+    assert sent[-1] == "closed" and len(sent) == 3
+
+
+def test_consume_stream_reads_to_the_end_after_completion():
+    chunks = [SimpleNamespace(content=text) for text in ['{"问题": []}', "", " "]]
+    assert consume_stream(chunks, StreamChecker(SCHEMA)) == ('{"问题": []} ', [])
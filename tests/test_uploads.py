@@ -0,0 +1,60 @@
+import pandas as pd
+
+from qa_engine.uploads import COMPACT_DTYPE, UploadCache
+
+
+def csv_bytes(rows: int, text: str = "销售：您好，欢迎光临") -> bytes:
+    frame = pd.DataFrame({"编号": range(rows), "对话": [f"{text}{n}" for n in range(rows)]})
+    return frame.to_csv(index=False).encode("utf-8")
+
+
+def reader(data: bytes, reads: list):
+    def read() -> bytes:
+        reads.append(1)
+        return data
+
+    return read
+
+
+def test_same_upload_or_content_is_parsed_once():
+    cache, reads = UploadCache(), []
+    data = csv_bytes(10)
+    first = cache.load("upload-1", "a.csv", reader(data, reads))
+    assert cache.load("upload-1", "a.csv", reader(data, reads)) is first
+    assert len(reads) == 1
+    # 不同上传ID、相同内容：读取并哈希，但不再解析
+    assert cache.load("upload-2", "b.csv", reader(data, reads)) is first
+    assert len(reads) == 2
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert first.text_column() == "对话" and len(first) == 10
+
+
+def test_least_recently_used_tables_are_evicted():
+    tables = {name: csv_bytes(200, name) for name in ("甲", "乙", "丙")}
+    probe = UploadCache().load("probe", "p.csv", reader(tables["甲"], []))
+    cache = UploadCache(max_mb=probe.nbytes * 2.5 / 1024 / 1024)
+    cache.load("甲", "甲.csv", reader(tables["甲"], []))
+    cache.load("乙", "乙.csv", reader(tables["乙"], []))
+    cache.load("甲", "甲.csv", reader(tables["甲"], []))
+    cache.load("丙", "丙.csv", reader(tables["丙"], []))
+    assert len(cache) == 2 and cache.nbytes <= cache.max_bytes
+    reads = []
+    cache.load("乙", "乙.csv", reader(tables["乙"], reads))
+    assert reads == [1]
+
+
+def test_oversized_table_is_still_kept():
+    cache = UploadCache(max_mb=0.0001)
+    cache.load("big", "big.csv", reader(csv_bytes(500), []))
+    assert len(cache) == 1
+
+
+def test_compact_column_keeps_values():
+    table = UploadCache().load("x", "x.csv", reader(csv_bytes(5), []))
+    frame = table.with_compact_column("对话")
+    assert frame["对话"].tolist() == table.frame["对话"].tolist()
+    if COMPACT_DTYPE:
+        assert frame["对话"].dtype == COMPACT_DTYPE
+    # 原表格不被修改，其余列共用
+    assert table.frame["对话"].dtype == object
+    assert frame["编号"].tolist() == list(range(5))